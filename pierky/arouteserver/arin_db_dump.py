@@ -21,7 +21,7 @@ import requests
 from packaging import version
 
 from .ipaddresses import IPNetwork
-from .cached_objects import CachedObject
+from .cached_objects import CachedObject, CachedDataNotModified
 from .errors import ARINWhoisDBDumpError
 
 
@@ -29,6 +29,8 @@ class ARINWhoisDBDump(CachedObject):
 
     EXPIRY_TIME_TAG = "arin_whois_db_dump"
 
+    USE_CACHE_MEMO = False
+
     def __init__(self, *args, **kwargs):
         CachedObject.__init__(self, *args, **kwargs)
 
@@ -120,14 +122,25 @@ class ARINWhoisDBDump(CachedObject):
         return "arin-whois-db-dump.json"
 
     def _get_data(self):
+        http_response = None
+
         if self.source.lower().startswith("http://") or \
-            self.source.lower().starswith("https://"):
+            self.source.lower().startswith("https://"):
 
             logging.debug("Downloading ARIN Whois DB dump")
 
             url = self.source
             try:
-                response = requests.get(url).content
+                http_response = requests.get(
+                    url, headers=self._get_conditional_headers(url)
+                )
+                if http_response.status_code == 304:
+                    logging.debug("ARIN Whois DB dump not modified")
+                    raise CachedDataNotModified()
+                http_response.raise_for_status()
+                response = http_response.content
+            except CachedDataNotModified:
+                raise
             except requests.exceptions.HTTPError as e:
                 raise ARINWhoisDBDumpError(
                     "HTTP error while retrieving ARIN Whois DB dump "
@@ -160,6 +173,10 @@ class ARINWhoisDBDump(CachedObject):
                     "from {}: {}".format(path, str(e))
                 )
 
+        # The dump is not decompressed and parsed again
+        # if it's the same of the cached one.
+        self._set_validators(self.source, response, http_response)
+
         if self.source.endswith(".bz2"):
             try:
                 raw = decompress(response).decode("utf-8")
@@ -31,8 +31,7 @@ from .config.asns import ConfigParserASNS
 from .config.clients import ConfigParserClients
 from .enrichers.arin_db_dump import ARINWhoisDBDumpEnricher
 from .enrichers.registrobr_db_dump import RegistroBRWhoisDBDumpEnricher
-from .enrichers.irrdb import IRRDBConfigEnricher_ASNs, \
-                             IRRDBConfigEnricher_Prefixes
+from .enrichers.irrdb import IRRDBConfigEnricher_Combined
 from .enrichers.pdb_as_set import PeeringDBConfigEnricher_ASSet
 from .enrichers.pdb_max_prefix import PeeringDBConfigEnricher_MaxPrefix
 from .enrichers.pdb_never_via_route_servers import NeverViaRouteServersEnricher
@@ -44,8 +43,15 @@ from .errors import MissingDirError, MissingFileError, BuilderError, \
                     ConfigError, MissingGeneralConfigFileError
 from .ipaddresses import IPNetwork, IPAddress
 from .irrdb import IRRDBInfo
-from .cached_objects import CachedObject, normalize_expiry_time
+from .irr_expander import IRR_SETS_MEMO
+from .prefix_aggregator import aggregate_prefix_list
+from .cached_objects import CachedObject, normalize_expiry_time, \
+                            normalize_stale_max_age, \
+                            normalize_negative_expiry_time, \
+                            normalize_serializers
+from .cache_backends import get_cache_backend
 from .reject_reasons import REJECT_REASONS
+from .roa_table import ROATable
 
 
 class ConfigBuilder(object):
@@ -61,6 +67,11 @@ class ConfigBuilder(object):
 
     IGNORABLE_ISSUES = ["ext-comms-32bit-asn", "roles_not_available"]
 
+    # Set to False for builders that only process the configuration
+    # and do not render any template (template_dir and template_name
+    # are ignored).
+    TEMPLATE_NEEDED = True
+
     def validate_bgpspeaker_specific_configuration(self):
         """Check compatibility between config and target BGP speaker
 
@@ -131,9 +142,15 @@ class ConfigBuilder(object):
 
     def __init__(self, template_dir=None, template_name=None,
                  cache_dir=None, cache_expiry=CachedObject.DEFAULT_EXPIRY,
+                 cache_backend="json", cache_serve_stale=None,
+                 cache_negative_expiry=None, cache_serializer=None,
+                 cache_memory_limit=None, stats_file=None,
                  bgpq3_path="bgpq4", bgpq3_host=IRRDBInfo.BGPQ3_DEFAULT_HOST,
                  bgpq3_sources=IRRDBInfo.BGPQ3_DEFAULT_SOURCES,
                  bgpq3_timeout=IRRDBInfo.BGPQ3_DEFAULT_TIMEOUT,
+                 irr_query_method=IRRDBInfo.IRR_QUERY_METHOD_DEFAULT,
+                 irr_dumps=None, aggregate_prefix_lists=False,
+                 compress_rpki_roas=False,
                  rtt_getter_path=None, threads=4,
                  ip_ver=None, perform_graceful_shutdown=False,
                  ignore_errors=[], live_tests=False,
@@ -210,6 +227,65 @@ class ConfigBuilder(object):
 
                 - *cache_expiry* program's configuration file option.
 
+            cache_backend (str): the storage engine used to keep cached
+                data: "json" (one JSON file for each object) or
+                "sqlite" (a single SQLite database inside the
+                cache directory).
+
+                Same of:
+
+                - *cache_backend* program's configuration file option.
+
+            cache_serve_stale (int or dict): how long expired cached data
+                can still be used, in seconds since when it was fetched.
+                Expired data used within this limit is refreshed in
+                background, so that the next execution finds it fresh.
+                Same format of *cache_expiry*; the default is to never
+                use expired data.
+
+                Same of:
+
+                - *cache_serve_stale* program's configuration file option.
+
+            cache_negative_expiry (int or dict): how long the cached
+                information about objects for which no data is
+                available (for example, networks without a PeeringDB
+                record) is kept. Same format of *cache_expiry*; it's
+                never longer than the *cache_expiry* of the object.
+
+                Same of:
+
+                - *cache_negative_expiry* program's configuration file
+                  option.
+
+            cache_serializer (str or dict): the format used to store
+                cached data: "json", "json-zlib" or "binary". Same
+                format of *cache_expiry*, with these names in place
+                of the integers. Data is always read, regardless of
+                the format used to store it.
+
+                Same of:
+
+                - *cache_serializer* program's configuration file option.
+
+            cache_memory_limit (int): size, in megabytes, of the cached
+                data that is kept in memory, so that objects requested
+                multiple times during the execution are not read from
+                the cache over and over. 0 (the default) to disable it.
+
+                Same of:
+
+                - *cache_memory_limit* program's configuration file option.
+
+            stats_file (str): path of the file where a JSON report with
+                stats about the usage of the cache (hits, misses, time
+                spent to fetch data from external sources, ...) is
+                written at the end of the template rendering.
+
+                Same of:
+
+                - *--stats-file* CLI argument.
+
             ip_ver (int): if *None*, the output configuration will be targeted
                 for both IPv4 and IPv6; otherwise, set this to *4* or to
                 *6* to obtain AFI-specific output configuration.
@@ -325,6 +401,39 @@ class ConfigBuilder(object):
 
                 - *bgpq3_timeout* program's configuration file option.
 
+            irr_query_method (str): how IRR objects are expanded: "bgpq",
+                to run the bgpq4/bgpq3 program, or "native", to query the
+                IRRD hosts (*bgpq3_host*) directly, using a built-in client
+                that keeps persistent connections to them.
+
+                Same of:
+
+                - *irr_query_method* program's configuration file option.
+
+            irr_dumps (list): paths (or glob patterns) of the RPSL dump
+                files (plain text or gzipped) used to expand IRR objects
+                when *irr_query_method* is "local".
+
+                Same of:
+
+                - *irr_dumps* program's configuration file option.
+
+            aggregate_prefix_lists (bool): merge the entries of the prefix
+                lists built out of IRR data (AS-SETs, white lists, ARIN
+                and Registro.br Whois records) into fewer equivalent ones.
+
+                Same of:
+
+                - *aggregate_prefix_lists* program's configuration file option.
+
+            compress_rpki_roas (bool): remove the RPKI ROAs that are
+                redundant, because another ROA for the same origin ASN
+                already covers them.
+
+                Same of:
+
+                - *compress_rpki_roas* program's configuration file option.
+
             rtt_getter_path (str): path to the program that is executed to
                 determine the RTT of a peer.
                 Syntax and details can be found at the following URL:
@@ -349,18 +458,23 @@ class ConfigBuilder(object):
 
         # Parameters initialization
 
-        self.template_dir = self._check_is_dir(
-            "template_dir", template_dir
-        )
+        self.template_dir = None
+        self.template_name = None
+        self.template_path = None
+
+        if self.TEMPLATE_NEEDED:
+            self.template_dir = self._check_is_dir(
+                "template_dir", template_dir
+            )
 
-        self.template_name = template_name
-        if not self.template_name:
-            raise MissingArgumentError("template_name")
+            self.template_name = template_name
+            if not self.template_name:
+                raise MissingArgumentError("template_name")
 
-        self.template_path = os.path.join(self.template_dir,
-                                          self.template_name)
-        if not os.path.isfile(self.template_path):
-            raise MissingFileError(self.template_path)
+            self.template_path = os.path.join(self.template_dir,
+                                              self.template_name)
+            if not os.path.isfile(self.template_path):
+                raise MissingFileError(self.template_path)
 
         self.cache_dir = self._check_is_dir(
             "cache_dir", cache_dir
@@ -368,10 +482,37 @@ class ConfigBuilder(object):
 
         self.cache_expiry = normalize_expiry_time(cache_expiry)
 
+        # The storage is shared with the other builders that use
+        # the same cache, but policies and stats are of this one.
+        try:
+            self.cache_backend = get_cache_backend(self.cache_dir,
+                                                   cache_backend).get_view()
+        except ARouteServerError as e:
+            raise BuilderError(str(e))
+        self.cache_backend.serve_stale = \
+            normalize_stale_max_age(cache_serve_stale)
+        self.cache_backend.negative_expiry = \
+            normalize_negative_expiry_time(cache_negative_expiry)
+        self.cache_backend.serializers = \
+            normalize_serializers(cache_serializer)
+        if cache_memory_limit is not None:
+            self.cache_backend.memo.max_size = \
+                int(cache_memory_limit) * 1024 * 1024
+
+        self.stats_file = stats_file
+
+        # Members of the AS-SETs and route-sets fetched by the
+        # IRRd client are shared by all the bundles of the build.
+        IRR_SETS_MEMO.clear()
+
         self.bgpq3_path = bgpq3_path
         self.bgpq3_host = bgpq3_host
         self.bgpq3_sources = bgpq3_sources
         self.bgpq3_timeout = bgpq3_timeout
+        self.irr_query_method = irr_query_method
+        self.irr_dumps = irr_dumps or []
+        self.aggregate_prefix_lists = aggregate_prefix_lists
+        self.compress_rpki_roas = compress_rpki_roas
 
         self.rtt_getter_path = rtt_getter_path
 
@@ -438,8 +579,8 @@ class ConfigBuilder(object):
         # { "<as_set_bundle_id>": <IRRDBRecord>, ... }
         self.irrdb_info = None
 
-        # { "<len>": [{"prefix": "<ip>/<len>", "max_len": x, "asn": "AS<n>"}]
-        self.rpki_roas = {}
+        # ROATable, populated by the RPKI ROAs enricher.
+        self.rpki_roas = ROATable()
 
         # [<asn (int)>]
         self.never_via_route_servers_asns = []
@@ -524,8 +665,11 @@ class ConfigBuilder(object):
 
         # Processing
 
-        logging.info("Started processing configuration "
-                     "for {}".format(self.template_path))
+        if self.template_path:
+            logging.info("Started processing configuration "
+                         "for {}".format(self.template_path))
+        else:
+            logging.info("Started processing configuration")
 
         start_time = int(time.time())
 
@@ -589,16 +733,17 @@ class ConfigBuilder(object):
         if irrdb_cfg["peering_db"]:
             used_enricher_classes += [PeeringDBConfigEnricher_ASSet]
 
-        used_enricher_classes += [IRRDBConfigEnricher_ASNs,
-                                  IRRDBConfigEnricher_Prefixes,
+        # Origin ASNs and prefixes (IPv4 and IPv6) of the AS-SETs are
+        # fetched by the same enricher, as independent tasks.
+        used_enricher_classes += [IRRDBConfigEnricher_Combined,
                                   PeeringDBConfigEnricher_MaxPrefix]
 
         if self.cfg_general.rtt_based_functions_are_used:
             used_enricher_classes.append(RTTGetterConfigEnricher)
 
         if self.cfg_general.rpki_roas_needed and \
-            self.cfg_general["rpki_roas"]["source"] == \
-                "ripe-rpki-validator-cache":
+            self.cfg_general["rpki_roas"]["source"] in \
+                ("ripe-rpki-validator-cache", "rtr-client"):
             used_enricher_classes.append(RPKIROAsEnricher)
 
         if irrdb_cfg["use_arin_bulk_whois_data"]["enabled"]:
@@ -623,6 +768,57 @@ class ConfigBuilder(object):
 
                 raise BuilderError()
 
+        if self.aggregate_prefix_lists:
+            self._aggregate_prefix_lists()
+
+    def _aggregate_prefix_lists(self):
+        """Merge the entries of the prefix lists built by the enrichers.
+
+        Each list is aggregated on its own: lists from different sources
+        lead to different outcomes (tagging of the routes, origin ASN
+        validation), so they can't be merged together.
+        """
+        start_time = time.time()
+        lists_cnt = 0
+        entries_before = 0
+        entries_after = 0
+
+        for bundle in (self.irrdb_info or {}).values():
+            prefixes = bundle.prefixes
+            if not prefixes:
+                continue
+            aggregated = aggregate_prefix_list(prefixes)
+            lists_cnt += 1
+            entries_before += len(prefixes)
+            entries_after += len(aggregated)
+            if len(aggregated) < len(prefixes):
+                bundle.save("prefixes", aggregated)
+
+        for whois_records in (self.arin_whois_records,
+                              self.registrobr_whois_records):
+            for record in whois_records.values():
+                prefixes = list(record.prefixes)
+                if not prefixes:
+                    continue
+                aggregated = aggregate_prefix_list(prefixes)
+                lists_cnt += 1
+                entries_before += len(prefixes)
+                entries_after += len(aggregated)
+                if len(aggregated) < len(prefixes):
+                    record.save_prefixes(aggregated)
+
+        if not entries_before:
+            return
+
+        logging.info(
+            "Prefix lists aggregation: {} entries of {} lists merged into "
+            "{} (-{:.1f}%) in {:.1f} seconds".format(
+                entries_before, lists_cnt, entries_after,
+                (entries_before - entries_after) * 100.0 / entries_before,
+                time.time() - start_time
+            )
+        )
+
     def _include_local_file(self, local_file_id):
         raise NotImplementedError()
 
@@ -644,16 +840,6 @@ class ConfigBuilder(object):
                 be written.
         """
 
-        def sorted_rpki_roas():
-            """Returns a list of ROAs, sorted by prefix length, prefix, ASN"""
-            res = []
-            prefix_lengths = sorted(map(int, self.rpki_roas.keys()))
-            for pref_len in prefix_lengths:
-                for roa in sorted(self.rpki_roas[str(pref_len)],
-                                  key=lambda r: (r["prefix"], r["asn"])):
-                    res.append(roa)
-            return res
-
         def get_output_file_for_router_id(router_id):
             if (
                 output_file is sys.stdout or \
@@ -709,7 +895,7 @@ class ConfigBuilder(object):
         self.data["asns"] = self.cfg_asns
         self.data["asn3216_map"] = self.asn3216_map
         self.data["irrdb_info"] = self.irrdb_info
-        self.data["rpki_roas"] = sorted_rpki_roas()
+        self.data["rpki_roas"] = self.rpki_roas
         self.data["arin_whois_records"] = self.arin_whois_records
         self.data["registrobr_whois_records"] = self.registrobr_whois_records
         self.data["never_via_route_servers_asns"] = self.never_via_route_servers_asns
@@ -861,6 +1047,19 @@ class ConfigBuilder(object):
             logging.info("Template rendering completed after "
                         "{} seconds.".format(stop_time - start_time))
 
+            self._write_cache_stats()
+
+    def _write_cache_stats(self):
+        stats = self.cache_backend.stats
+
+        logging.info(stats.get_summary())
+        logging.debug(self.cache_backend.memo.get_summary())
+        if self.irr_query_method == "native":
+            logging.debug(IRR_SETS_MEMO.get_summary())
+
+        if self.stats_file:
+            stats.write_report(self.stats_file)
+
 class BIRDConfigBuilder(ConfigBuilder):
     """BIRD configuration builder.
 
@@ -1324,11 +1523,7 @@ class OpenBGPDConfigBuilder(ConfigBuilder):
             return True
 
         def aggregated_roas_covered_space():
-            prefixes = []
-            for pref_len in self.rpki_roas:
-                for roa in self.rpki_roas[pref_len]:
-                    prefixes.append(roa["prefix"])
-            return aggregate(prefixes)
+            return aggregate([roa.prefix for roa in self.rpki_roas])
 
         env.filters["convert_ext_comm"] = convert_ext_comm
         env.filters["community_is_set"] = community_is_set
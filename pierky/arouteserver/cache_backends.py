@@ -0,0 +1,787 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import namedtuple
+from contextlib import contextmanager
+import copy
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .cache_memo import CacheMemo
+from .cache_serializers import deserialize, get_cache_serializer
+from .cache_stats import CacheStats
+from .errors import CachedObjectsError
+
+
+def write_atomically(path, text):
+    """Write text (str or bytes) to a file, replacing it atomically.
+
+    The text is written to a temporary file in the same directory,
+    which is then renamed: readers never see a half-written file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                    prefix=".{}.".format(os.path.basename(path)),
+                                    suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb" if isinstance(text, bytes) else "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def write_json_atomically(path, data):
+    write_atomically(path, json.dumps(data))
+
+
+# Used by the garbage collector: last_used is the most recent
+# time the entry was saved or loaded, with a resolution of
+# CacheBackend.ACCESS_TIME_RESOLUTION seconds.
+CacheEntryInfo = namedtuple("CacheEntryInfo",
+                            ["key", "location", "size", "last_used"])
+
+
+class CacheBackend(object):
+    """Storage engine used by CachedObject to persist its data.
+
+    Entries are identified by a key (the object's file name) and
+    are represented by a dict with the 'ts' and 'data' keys, and
+    optionally with the 'meta' one.
+    The expiry time tag of the object is passed to load() and
+    save() to keep track of the amount of data read and written,
+    and to pick the serializer used to encode it.
+
+    Negative entries (no information available for the object)
+    are kept apart, in a compact index that maps the key to the
+    timestamp of the entry: see load_negative() and save_negative().
+
+    The backend also holds the caching policies and the stats
+    that are shared by all the objects that use it; get_view() can
+    be used to get a backend with its own policies and stats, that
+    uses the same storage.
+    """
+
+    NAME = None
+
+    LOCKS_DIR = ".locks"
+
+    # The access time of the entries is updated on load only
+    # when it's older than this, to avoid a write on every read.
+    ACCESS_TIME_RESOLUTION = 3600
+
+    # Negative entries older than this (or than the longest
+    # negative expiry time, if longer) are pruned from the index.
+    NEGATIVE_INDEX_MAX_AGE = 604800
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+
+        # { "<expiry_time_tag>": <max age of stale entries> }
+        self.serve_stale = {}
+
+        # { "<expiry_time_tag>": <expiry time of negative entries> }
+        self.negative_expiry = {}
+
+        # { "<expiry_time_tag>": "<serializer name>" }
+        # Entries are read regardless of the serializer used
+        # to write them.
+        self.serializers = {}
+
+        self.memo = CacheMemo()
+
+        self.stats = CacheStats()
+
+        # Used when fcntl is not available: entries are
+        # locked only among the threads of this process.
+        # { "<key>": <threading.Lock> }
+        self._thread_locks = {}
+        self._thread_locks_lock = threading.Lock()
+
+    def get_view(self):
+        """Return a backend that uses the same storage of this one.
+
+        Policies, in-memory cache and stats of the returned backend
+        are its own, so that each ConfigBuilder can set them without
+        affecting the other builders that use the same cache.
+        """
+        view = copy.copy(self)
+        view.serve_stale = {}
+        view.negative_expiry = {}
+        view.serializers = {}
+        view.memo = CacheMemo()
+        view.stats = CacheStats()
+        return view
+
+    @contextmanager
+    def lock(self, key):
+        """Exclusive lock on the entry, shared among processes.
+
+        It's an advisory lock, taken while the data of the entry
+        is fetched, so that only one process at a time performs
+        the fetch while the others wait for its result.
+        """
+        if not os.path.isdir(self.cache_dir):
+            # Nothing can be shared yet.
+            yield
+            return
+
+        if fcntl is None:
+            with self._thread_locks_lock:
+                thread_lock = self._thread_locks.setdefault(
+                    key, threading.Lock()
+                )
+            with thread_lock:
+                yield
+            return
+
+        lock_path = self._get_lock_path(key)
+        locks_dir = os.path.dirname(lock_path)
+        try:
+            os.makedirs(locks_dir, exist_ok=True)
+            f = open(lock_path, "a")
+        except OSError as e:
+            raise CachedObjectsError(
+                "Error while creating the cache lock file {}: {}".format(
+                    lock_path, str(e)
+                )
+            )
+
+        with f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _get_lock_path(self, key):
+        return os.path.join(self.cache_dir, self.LOCKS_DIR,
+                            "{}.lock".format(key))
+
+    def remove_lock_file(self, key):
+        """Remove the lock file of an entry, if it's not in use."""
+        lock_path = self._get_lock_path(key)
+        if fcntl is None or not os.path.exists(lock_path):
+            return
+
+        try:
+            with open(lock_path, "a") as f:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    # Another process is fetching the entry.
+                    return
+                os.remove(lock_path)
+        except OSError as e:
+            logging.debug("Can't remove the cache lock file {}: {}".format(
+                lock_path, str(e)))
+
+    def get_location(self, key):
+        """Textual representation of the entry's location, for logging."""
+        raise NotImplementedError()
+
+    def iter_entries(self):
+        """Yield a CacheEntryInfo for each entry in the cache."""
+        raise NotImplementedError()
+
+    def delete(self, key):
+        self.memo.pop(key)
+        self._delete(key)
+
+    def _delete(self, key):
+        raise NotImplementedError()
+
+    def compact(self):
+        """Reclaim the space left by the deleted entries."""
+        pass
+
+    def load(self, key, tag="general", memo_ns=None):
+        """Return the entry for the given key, or None if not found.
+
+        When memo_ns (the name of the class of the object that uses
+        the entry) is given, the entry is looked up in the in-memory
+        cache first, and it's added to it once loaded.
+        """
+        return self.load_with_size(key, tag, memo_ns)[0]
+
+    def load_with_size(self, key, tag="general", memo_ns=None):
+        """Same of load(), plus the size of the serialized data.
+
+        (None, 0) is returned if the entry is not found.
+        """
+        if memo_ns and self.memo.max_size:
+            version = self._get_version(key)
+            entry, size = self.memo.get(memo_ns, key, version)
+            if entry is not None:
+                return entry, size
+
+            entry, size = self._load(key, tag)
+            if entry is not None:
+                self.memo.put(memo_ns, key, entry, size, version)
+            return entry, size
+
+        return self._load(key, tag)
+
+    def save(self, key, entry, tag="general", memo_ns=None):
+        """Save the entry and return the size of its serialized data."""
+        size = self._save(key, entry, tag)
+
+        if memo_ns and self.memo.max_size:
+            self.memo.put(memo_ns, key, entry, size, self._get_version(key))
+        else:
+            self.memo.pop(key)
+
+        return size
+
+    def _get_version(self, key):
+        """Return a token that changes when the entry is modified.
+
+        None is returned if the entry is not found. It's also used
+        to keep track of the access time of the entries that are
+        served from the in-memory cache.
+        """
+        raise NotImplementedError()
+
+    def _load(self, key, tag):
+        """Return the entry and the size of its serialized data.
+
+        (None, 0) is returned if the entry is not found.
+        """
+        raise NotImplementedError()
+
+    def _save(self, key, entry, tag):
+        """Save the entry and return the size of its serialized data."""
+        raise NotImplementedError()
+
+    def load_negative(self, key):
+        """Return the timestamp of the negative entry, or None."""
+        raise NotImplementedError()
+
+    def save_negative(self, key, ts):
+        raise NotImplementedError()
+
+    def delete_negative(self, key):
+        raise NotImplementedError()
+
+    def _get_negative_index_max_age(self):
+        return max([self.NEGATIVE_INDEX_MAX_AGE] +
+                   list(self.negative_expiry.values()))
+
+    def _decode(self, raw, tag):
+        start_time = time.time()
+        res = deserialize(raw)
+        self.stats.add_read(tag, len(raw), time.time() - start_time)
+        return res
+
+    def _encode(self, data, tag):
+        serializer = get_cache_serializer(self.serializers.get(tag))
+        res = serializer.dumps(data)
+        self.stats.incr(tag, "bytes_written", len(res))
+        return res
+
+class JSONFilesCacheBackend(CacheBackend):
+    """One JSON file for each cached object.
+
+    Negative entries are kept in a single JSON file, which is read
+    again only when it's modified by other processes.
+    """
+
+    NAME = "json"
+
+    NEGATIVE_INDEX_FILENAME = ".negative_index.json"
+
+    def __init__(self, *args, **kwargs):
+        CacheBackend.__init__(self, *args, **kwargs)
+
+        # { "<key>": <ts> }
+        self._negative_index = {}
+        self._negative_index_mtime = None
+        self._negative_index_lock = threading.Lock()
+
+    def _get_negative_index_path(self):
+        return os.path.join(self.cache_dir, self.NEGATIVE_INDEX_FILENAME)
+
+    def _refresh_negative_index(self):
+        # Must be called with self._negative_index_lock acquired.
+        path = self._get_negative_index_path()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._negative_index = {}
+            self._negative_index_mtime = None
+            return
+
+        if mtime == self._negative_index_mtime:
+            return
+
+        try:
+            with open(path, "r") as f:
+                self._negative_index = json.load(f)
+        except Exception as e:
+            logging.error(
+                "Error while reading the index of the negative cache "
+                "entries: {} - {}".format(path, str(e))
+            )
+            self._negative_index = {}
+        self._negative_index_mtime = mtime
+
+    def load_negative(self, key):
+        with self._negative_index_lock:
+            self._refresh_negative_index()
+            return self._negative_index.get(key)
+
+    def save_negative(self, key, ts):
+        self._update_negative_index(key, ts)
+
+    def delete_negative(self, key):
+        self._update_negative_index(key, None)
+
+    def _update_negative_index(self, key, ts):
+        path = self._get_negative_index_path()
+
+        try:
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+        except OSError as e:
+            raise CachedObjectsError(
+                "Error while saving data to the cache: {}".format(str(e))
+            )
+
+        # Other processes could be updating the index too.
+        with self.lock(self.NEGATIVE_INDEX_FILENAME), \
+            self._negative_index_lock:
+
+            # Always read again: mtime could have a coarse resolution.
+            self._negative_index_mtime = None
+            self._refresh_negative_index()
+
+            min_ts = int(time.time()) - self._get_negative_index_max_age()
+            index = {
+                k: v for k, v in self._negative_index.items()
+                if v > min_ts and k != key
+            }
+            if ts is not None:
+                index[key] = ts
+
+            try:
+                write_json_atomically(path, index)
+            except Exception as e:
+                raise CachedObjectsError(
+                    "Error while saving data to the cache: {}".format(str(e))
+                )
+
+            self._negative_index = index
+            self._negative_index_mtime = os.stat(path).st_mtime_ns
+
+    def get_location(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _load(self, key, tag):
+        file_path = self.get_location(key)
+
+        if not os.path.isfile(file_path):
+            return None, 0
+
+        try:
+            with open(file_path, "rb") as f:
+                raw = f.read()
+            entry = self._decode(raw, tag)
+            self._update_access_time(file_path)
+            return entry, len(raw)
+        except Exception as e:
+            logging.error(
+                "Error while reading data from cache: {} - {}".format(
+                    file_path, str(e)
+                )
+            )
+            return None, 0
+
+    def _get_version(self, key):
+        file_path = self.get_location(key)
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+
+        self._update_access_time(file_path, st)
+
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _update_access_time(self, file_path, st=None):
+        # The atime is not reliable (noatime, relatime mounts),
+        # so it is explicitly updated, keeping the mtime.
+        try:
+            st = st or os.stat(file_path)
+            now = time.time()
+            if now - max(st.st_atime, st.st_mtime) > \
+                    self.ACCESS_TIME_RESOLUTION:
+                os.utime(file_path, (now, st.st_mtime))
+        except OSError as e:
+            logging.debug("Can't update the access time of {}: {}".format(
+                file_path, str(e)))
+
+    def iter_entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+
+        for dir_entry in os.scandir(self.cache_dir):
+            if dir_entry.name.startswith(".") or \
+                not dir_entry.name.endswith(".json") or \
+                    not dir_entry.is_file():
+                continue
+            st = dir_entry.stat()
+            yield CacheEntryInfo(dir_entry.name, dir_entry.path, st.st_size,
+                                 max(st.st_atime, st.st_mtime))
+
+    def _delete(self, key):
+        try:
+            os.remove(self.get_location(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            raise CachedObjectsError(
+                "Error while removing data from the cache: {}".format(str(e))
+            )
+
+    def _save(self, key, entry, tag):
+        file_path = self.get_location(key)
+
+        try:
+            if not os.path.exists(os.path.dirname(file_path)):
+                os.makedirs(os.path.dirname(file_path))
+            raw = self._encode(entry, tag)
+            write_atomically(file_path, raw)
+        except Exception as e:
+            raise CachedObjectsError(
+                "Error while saving data to the cache: {}".format(str(e))
+            )
+        return len(raw)
+
+class SQLiteCacheBackend(CacheBackend):
+    """All the cached objects in a single SQLite database.
+
+    The database is opened in WAL mode, so that readers are not
+    blocked by writers; each thread uses its own connection.
+
+    Entries that are not found in the database are looked up in
+    the legacy JSON files: if found, they are imported into the
+    database and the original file is removed.
+    """
+
+    NAME = "sqlite"
+
+    DB_FILENAME = "cache.sqlite3"
+
+    def __init__(self, *args, **kwargs):
+        CacheBackend.__init__(self, *args, **kwargs)
+
+        self.db_path = os.path.join(self.cache_dir, self.DB_FILENAME)
+        self.legacy = JSONFilesCacheBackend(self.cache_dir)
+        self._local = threading.local()
+
+    def _get_conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache_entries ("
+                    "  key TEXT PRIMARY KEY,"
+                    "  ts INTEGER NOT NULL,"
+                    "  data TEXT,"
+                    "  meta TEXT,"
+                    "  last_access INTEGER,"
+                    "  version INTEGER"
+                    ")"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS negative_entries ("
+                    "  key TEXT PRIMARY KEY,"
+                    "  ts INTEGER NOT NULL"
+                    ")"
+                )
+                # Databases created before these columns were added.
+                columns = [row[1] for row in conn.execute(
+                    "PRAGMA table_info(cache_entries)"
+                )]
+                for column, column_type in (("meta", "TEXT"),
+                                            ("last_access", "INTEGER"),
+                                            ("version", "INTEGER")):
+                    if column not in columns:
+                        conn.execute(
+                            "ALTER TABLE cache_entries "
+                            "ADD COLUMN {} {}".format(column, column_type)
+                        )
+        except (OSError, sqlite3.Error) as e:
+            raise CachedObjectsError(
+                "Error while opening the cache database {}: {}".format(
+                    self.db_path, str(e)
+                )
+            )
+
+        self._local.conn = conn
+        return conn
+
+    def get_location(self, key):
+        return "{}:{}".format(self.db_path, key)
+
+    def _import_legacy_entry(self, key, tag):
+        entry = self.legacy.load(key, tag)
+        if not isinstance(entry, dict):
+            return None, 0
+        if "ts" not in entry or "data" not in entry:
+            return None, 0
+
+        logging.debug("Importing {} into the cache database".format(
+            self.legacy.get_location(key)))
+
+        size = self._save(key, entry, tag)
+
+        try:
+            os.remove(self.legacy.get_location(key))
+        except OSError as e:
+            logging.warning(
+                "Can't remove the legacy cache file {}: {}".format(
+                    self.legacy.get_location(key), str(e)
+                )
+            )
+
+        return entry, size
+
+    def _load(self, key, tag):
+        try:
+            row = self._get_conn().execute(
+                "SELECT ts, data, meta, last_access FROM cache_entries "
+                "WHERE key = ?",
+                (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(
+                "Error while reading data from cache: {} - {}".format(
+                    self.get_location(key), str(e)
+                )
+            )
+            return None, 0
+
+        if row is None:
+            return self._import_legacy_entry(key, tag)
+
+        ts, raw, raw_meta, last_access = row
+
+        self._update_access_time(key, max(ts, last_access or 0))
+
+        try:
+            entry = {"ts": ts, "data": self._decode(raw, tag)}
+            if raw_meta:
+                entry["meta"] = json.loads(raw_meta)
+            return entry, len(raw) + len(raw_meta or "")
+        except Exception as e:
+            logging.error(
+                "Error while reading data from cache: {} - {}".format(
+                    self.get_location(key), str(e)
+                )
+            )
+            return None, 0
+
+    def _get_version(self, key):
+        try:
+            row = self._get_conn().execute(
+                "SELECT ts, version, last_access FROM cache_entries "
+                "WHERE key = ?",
+                (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+
+        if row is None:
+            return None
+
+        ts, version, last_access = row
+
+        self._update_access_time(key, max(ts, last_access or 0))
+
+        return (ts, version)
+
+    def _update_access_time(self, key, last_used):
+        now = int(time.time())
+        if now - last_used <= self.ACCESS_TIME_RESOLUTION:
+            return
+
+        try:
+            conn = self._get_conn()
+            with conn:
+                conn.execute(
+                    "UPDATE cache_entries SET last_access = ? WHERE key = ?",
+                    (now, key)
+                )
+        except sqlite3.Error as e:
+            logging.debug(
+                "Can't update the access time of {}: {}".format(
+                    self.get_location(key), str(e)
+                )
+            )
+
+    def iter_entries(self):
+        if not os.path.isfile(self.db_path):
+            return
+
+        try:
+            rows = self._get_conn().execute(
+                "SELECT key, "
+                "  IFNULL(LENGTH(data), 0) + IFNULL(LENGTH(meta), 0), "
+                "  MAX(ts, IFNULL(last_access, 0)) "
+                "FROM cache_entries"
+            ).fetchall()
+        except sqlite3.Error as e:
+            raise CachedObjectsError(
+                "Error while reading the cache database {}: {}".format(
+                    self.db_path, str(e)
+                )
+            )
+
+        for key, size, last_used in rows:
+            yield CacheEntryInfo(key, self.get_location(key), size, last_used)
+
+    def _delete(self, key):
+        try:
+            conn = self._get_conn()
+            with conn:
+                conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            raise CachedObjectsError(
+                "Error while removing data from the cache: {}".format(str(e))
+            )
+
+    def compact(self):
+        try:
+            conn = self._get_conn()
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error as e:
+            logging.warning(
+                "Can't compact the cache database {}: {}".format(
+                    self.db_path, str(e)
+                )
+            )
+
+    def load_negative(self, key):
+        try:
+            row = self._get_conn().execute(
+                "SELECT ts FROM negative_entries WHERE key = ?",
+                (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.error(
+                "Error while reading data from cache: {} - {}".format(
+                    self.get_location(key), str(e)
+                )
+            )
+            return None
+
+        return row[0] if row else None
+
+    def save_negative(self, key, ts):
+        try:
+            conn = self._get_conn()
+            with conn:
+                conn.execute(
+                    "DELETE FROM negative_entries WHERE ts <= ?",
+                    (ts - self._get_negative_index_max_age(),)
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO negative_entries "
+                    "(key, ts) VALUES (?, ?)",
+                    (key, ts)
+                )
+        except sqlite3.Error as e:
+            raise CachedObjectsError(
+                "Error while saving data to the cache: {}".format(str(e))
+            )
+
+    def delete_negative(self, key):
+        try:
+            conn = self._get_conn()
+            with conn:
+                conn.execute("DELETE FROM negative_entries WHERE key = ?",
+                             (key,))
+        except sqlite3.Error as e:
+            raise CachedObjectsError(
+                "Error while saving data to the cache: {}".format(str(e))
+            )
+
+    def _save(self, key, entry, tag):
+        try:
+            raw = self._encode(entry["data"], tag)
+            raw_meta = json.dumps(entry["meta"]) if entry.get("meta") else None
+
+            conn = self._get_conn()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries "
+                    "(key, ts, data, meta, last_access, version) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, entry["ts"], raw, raw_meta, int(time.time()),
+                     time.time_ns())
+                )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            raise CachedObjectsError(
+                "Error while saving data to the cache: {}".format(str(e))
+            )
+        return len(raw) + len(raw_meta or "")
+
+CACHE_BACKENDS = {
+    JSONFilesCacheBackend.NAME: JSONFilesCacheBackend,
+    SQLiteCacheBackend.NAME: SQLiteCacheBackend
+}
+
+# Backends are shared among all the cached objects that use
+# the same cache directory.
+# { ("<name>", "<cache_dir>"): <CacheBackend> }
+_backends = {}
+_backends_lock = threading.Lock()
+
+def get_cache_backend(cache_dir, name=None):
+    name = name or JSONFilesCacheBackend.NAME
+
+    if name not in CACHE_BACKENDS:
+        raise CachedObjectsError(
+            "Unknown cache backend: '{}'; it must be one of {}.".format(
+                name, ", ".join(sorted(CACHE_BACKENDS))
+            )
+        )
+
+    backend_key = (name, os.path.realpath(cache_dir))
+
+    with _backends_lock:
+        if backend_key not in _backends:
+            _backends[backend_key] = CACHE_BACKENDS[name](cache_dir)
+        return _backends[backend_key]
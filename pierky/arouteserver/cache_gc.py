@@ -0,0 +1,263 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import namedtuple
+import fnmatch
+import logging
+import os
+import time
+
+from .cache_backends import get_cache_backend
+from .enrichers.arin_db_dump import ARINWhoisDBDumpEnricher
+from .enrichers.irrdb import IRRDBTasksCosts
+from .enrichers.registrobr_db_dump import RegistroBRWhoisDBDumpEnricher
+from .errors import CachedObjectsError
+from .rtr_client import RTR_RPKI_ROAs
+
+
+# An item that can be removed from the cache directory:
+# a cache entry or one of the files written by the enrichers.
+CacheGCItem = namedtuple("CacheGCItem",
+                         ["kind", "location", "size", "last_used", "remove"])
+
+class CacheGCResult(object):
+    """Number and size of the items removed and kept, by kind."""
+
+    KINDS = ("entries", "whois_db_files", "rtr_state_files", "temp_files")
+
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+
+        # { "<kind>": { "removed": x, "removed_bytes": x, ... } }
+        self.kinds = {
+            kind: {
+                "removed": 0,
+                "removed_bytes": 0,
+                "kept": 0,
+                "kept_bytes": 0,
+            }
+            for kind in self.KINDS
+        }
+
+    def add(self, item, removed):
+        stats = self.kinds[item.kind]
+        if removed:
+            stats["removed"] += 1
+            stats["removed_bytes"] += item.size
+        else:
+            stats["kept"] += 1
+            stats["kept_bytes"] += item.size
+
+    @property
+    def removed(self):
+        return sum(stats["removed"] for stats in self.kinds.values())
+
+    @property
+    def removed_bytes(self):
+        return sum(stats["removed_bytes"] for stats in self.kinds.values())
+
+    @property
+    def kept_bytes(self):
+        return sum(stats["kept_bytes"] for stats in self.kinds.values())
+
+    def get_summary(self):
+        return ("Cache garbage collection: {} {} objects, {:,} bytes "
+                "reclaimed, {:,} bytes still in use".format(
+                    "would remove" if self.dry_run else "removed",
+                    self.removed, self.removed_bytes, self.kept_bytes))
+
+    def to_text(self):
+        fmt = "{:<16} {:>8} {:>14} {:>8} {:>14}"
+
+        lines = [fmt.format("Kind", "Removed", "Bytes", "Kept", "Bytes")]
+        for kind in self.KINDS:
+            stats = self.kinds[kind]
+            lines.append(fmt.format(
+                kind, stats["removed"], "{:,}".format(stats["removed_bytes"]),
+                stats["kept"], "{:,}".format(stats["kept_bytes"])
+            ))
+        lines.append("")
+        lines.append(self.get_summary())
+        return "\n".join(lines)
+
+class CacheGC(object):
+    """Garbage collector for the cache directory.
+
+    Cache entries, the per-ASN files written by the Whois DB dump
+    enrichers and the state files of the RTR client are removed when
+    they have not been used for more than ``max_age`` seconds; then,
+    if the total size is still above ``max_size`` bytes, the least
+    recently used ones are removed until the size fits into the
+    budget. A value of 0 disables the corresponding policy.
+
+    Temporary files left by interrupted writes are always removed.
+
+    Some files are never removed: the history of the IRRDB tasks
+    costs, which is small and updated at every build, and the index
+    of the local IRR dumps (irr_dumps), which is updated when the
+    dumps change and would be expensive to build again.
+    """
+
+    DEFAULT_MAX_AGE = 2592000
+
+    # Saved using the cache backend, but not cache entries.
+    NOT_ENTRIES = (IRRDBTasksCosts.CACHE_KEY,)
+
+    WHOIS_DB_DIRS = (ARINWhoisDBDumpEnricher.DIR_NAME,
+                     RegistroBRWhoisDBDumpEnricher.DIR_NAME)
+
+    # Temporary files younger than this could still be
+    # in use by a running build.
+    TEMP_FILES_MIN_AGE = 3600
+
+    def __init__(self, cache_dir, cache_backend=None, max_size=0, max_age=0,
+                 dry_run=False):
+        self.cache_dir = cache_dir
+        self.cache_backend = get_cache_backend(cache_dir, cache_backend)
+        self.max_size = max_size or 0
+        self.max_age = max_age or 0
+        self.dry_run = dry_run
+
+    def _remove_entry(self, key):
+        self.cache_backend.delete(key)
+        self.cache_backend.remove_lock_file(key)
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            raise CachedObjectsError(
+                "Error while removing {} from the cache: {}".format(
+                    path, str(e)
+                )
+            )
+
+    def _iter_files(self, dir_path):
+        if not os.path.isdir(dir_path):
+            return
+        for dir_entry in os.scandir(dir_path):
+            if dir_entry.is_file():
+                yield dir_entry
+
+    def _get_items(self):
+        items = []
+
+        for entry in self.cache_backend.iter_entries():
+            if entry.key in self.NOT_ENTRIES:
+                continue
+            items.append(CacheGCItem(
+                "entries", entry.location, entry.size, entry.last_used,
+                lambda key=entry.key: self._remove_entry(key)
+            ))
+
+        for dir_name in self.WHOIS_DB_DIRS:
+            # These files are written again at every build for the
+            # ASNs that are still used, so their mtime tells when
+            # they were used the last time.
+            for dir_entry in self._iter_files(
+                os.path.join(self.cache_dir, dir_name)
+            ):
+                if dir_entry.name.startswith("."):
+                    continue
+                st = dir_entry.stat()
+                items.append(CacheGCItem(
+                    "whois_db_files", dir_entry.path, st.st_size,
+                    st.st_mtime,
+                    lambda path=dir_entry.path: self._remove_file(path)
+                ))
+
+        # Written at every sync with the RTR server.
+        for dir_entry in self._iter_files(self.cache_dir):
+            if not fnmatch.fnmatch(dir_entry.name,
+                                   RTR_RPKI_ROAs.STATE_FILES_PATTERN):
+                continue
+            st = dir_entry.stat()
+            items.append(CacheGCItem(
+                "rtr_state_files", dir_entry.path, st.st_size, st.st_mtime,
+                lambda name=dir_entry.name: self._remove_rtr_state_file(name)
+            ))
+
+        return items
+
+    def _remove_rtr_state_file(self, name):
+        self._remove_file(os.path.join(self.cache_dir, name))
+        self.cache_backend.remove_lock_file(name)
+
+    def _get_temp_files(self):
+        items = []
+
+        for dir_path in [self.cache_dir] + [
+            os.path.join(self.cache_dir, dir_name)
+            for dir_name in self.WHOIS_DB_DIRS
+        ]:
+            for dir_entry in self._iter_files(dir_path):
+                if not dir_entry.name.startswith(".") or \
+                    not dir_entry.name.endswith(".tmp"):
+                    continue
+                st = dir_entry.stat()
+                items.append(CacheGCItem(
+                    "temp_files", dir_entry.path, st.st_size, st.st_mtime,
+                    lambda path=dir_entry.path: self._remove_file(path)
+                ))
+
+        return items
+
+    def _remove(self, item, result):
+        logging.debug("{} {} from the cache".format(
+            "Would remove" if self.dry_run else "Removing", item.location))
+        if not self.dry_run:
+            item.remove()
+        result.add(item, removed=True)
+
+    def run(self):
+        result = CacheGCResult(dry_run=self.dry_run)
+
+        if not os.path.isdir(self.cache_dir):
+            return result
+
+        now = time.time()
+
+        for item in self._get_temp_files():
+            if now - item.last_used > self.TEMP_FILES_MIN_AGE:
+                self._remove(item, result)
+
+        # Least recently used first.
+        items = sorted(self._get_items(), key=lambda item: item.last_used)
+
+        total_size = sum(item.size for item in items)
+
+        for item in items:
+            if self.max_age and now - item.last_used > self.max_age:
+                remove = True
+            elif self.max_size and total_size > self.max_size:
+                remove = True
+            else:
+                remove = False
+
+            if remove:
+                self._remove(item, result)
+                total_size -= item.size
+            else:
+                result.add(item, removed=False)
+
+        if result.removed and not self.dry_run:
+            self.cache_backend.compact()
+
+        logging.info(result.get_summary())
+
+        return result
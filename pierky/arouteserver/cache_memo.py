@@ -0,0 +1,117 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+import marshal
+import threading
+
+
+class CacheMemo(object):
+    """In-memory LRU cache of the entries loaded from a cache backend.
+
+    It avoids reading and decoding the same entry over and over when
+    an object is requested multiple times during the same execution
+    (for example, the same PeeringDB network used by more enrichers).
+
+    Entries are identified by the class of the object that uses them
+    and by their key; along with each entry, the backend stores a
+    version (for example, the mtime of the file), that is checked
+    when the entry is looked up: entries modified by other processes
+    are then loaded again.
+
+    Entries are kept marshal-encoded, and decoded at each lookup: the
+    objects that load the same entry get their own copy of the data,
+    that they can modify, and the memory used by the memo is the size
+    of the encoded entries. Entries are evicted, least recently used
+    first, when the total exceeds ``max_size`` bytes; entries larger
+    than that are never kept. A ``max_size`` of 0, the default,
+    disables the memo.
+    """
+
+    DEFAULT_MAX_SIZE = 0
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.lock = threading.Lock()
+
+        self.max_size = max_size
+
+        # { "<key>": ("<class name>", <encoded entry>,
+        #             <size of the entry in the backend>, <version>) }
+        self.entries = OrderedDict()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ns, key, version):
+        with self.lock:
+            if key in self.entries and \
+                self.entries[key][0] == ns and \
+                    self.entries[key][3] == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                _, blob, size, _ = self.entries[key]
+                return marshal.loads(blob), size
+
+            if self.max_size:
+                self.misses += 1
+            return None, 0
+
+    def _pop(self, key):
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key)[1])
+
+    def put(self, ns, key, entry, size, version):
+        """Keep the entry; size is the one of the entry in the backend,
+        returned by get()."""
+        if version is None or not self.max_size:
+            self.pop(key)
+            return
+
+        try:
+            blob = marshal.dumps(entry)
+        except ValueError:
+            # Not made of built-in types only.
+            blob = None
+
+        with self.lock:
+            self._pop(key)
+
+            if blob is None or len(blob) > self.max_size:
+                return
+
+            self.entries[key] = (ns, blob, size, version)
+            self.size += len(blob)
+
+            while self.size > self.max_size:
+                self._pop(next(iter(self.entries)))
+
+    def pop(self, key):
+        with self.lock:
+            self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def get_summary(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return ("In-memory cache: {} hits, {} misses ({:.1f}% hit rate), "
+                    "{} objects, {:,} bytes".format(
+                        self.hits, self.misses,
+                        self.hits * 100.0 / lookups if lookups else 0,
+                        len(self.entries), self.size))
@@ -0,0 +1,159 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import marshal
+import struct
+import zlib
+
+from .errors import CachedObjectsError
+
+
+class CacheSerializer(object):
+    """Encoding of the data stored into the cache.
+
+    Apart from the plain JSON one, which is kept for backward
+    compatibility, data encoded by serializers starts with a header:
+    the magic bytes, the version of the header and the ID of the
+    format, followed by a format-specific version number. This allows
+    to read entries regardless of the serializer that is currently
+    configured, and to detect entries written by incompatible versions.
+    """
+
+    NAME = None
+
+    MAGIC = b"ARSC"
+    HEADER_VERSION = 1
+    HEADER = struct.Struct("!4sBBH")
+
+    FORMAT_ID = None
+    FORMAT_VERSION = 0
+
+    def _get_header(self):
+        return self.HEADER.pack(self.MAGIC, self.HEADER_VERSION,
+                                self.FORMAT_ID, self.FORMAT_VERSION)
+
+    def dumps(self, data):
+        raise NotImplementedError()
+
+    def loads(self, raw, format_version):
+        raise NotImplementedError()
+
+class JSONSerializer(CacheSerializer):
+    """Plain JSON text, without header."""
+
+    NAME = "json"
+
+    def dumps(self, data):
+        return json.dumps(data).encode("utf-8")
+
+    def loads(self, raw, format_version=None):
+        return json.loads(raw)
+
+class CompressedJSONSerializer(CacheSerializer):
+    """zlib-compressed JSON."""
+
+    NAME = "json-zlib"
+
+    FORMAT_ID = 1
+
+    COMPRESSION_LEVEL = 6
+
+    def dumps(self, data):
+        return self._get_header() + zlib.compress(
+            json.dumps(data).encode("utf-8"), self.COMPRESSION_LEVEL
+        )
+
+    def loads(self, raw, format_version):
+        return json.loads(zlib.decompress(raw))
+
+class BinarySerializer(CacheSerializer):
+    """zlib-compressed marshal encoding.
+
+    Much faster to load than JSON; the version of the marshal format
+    is stored in the header, so that entries written by a Python
+    version that uses a different one are not used.
+    """
+
+    NAME = "binary"
+
+    FORMAT_ID = 2
+    FORMAT_VERSION = marshal.version
+
+    # Speed is preferred over size here.
+    COMPRESSION_LEVEL = 1
+
+    def dumps(self, data):
+        return self._get_header() + zlib.compress(
+            marshal.dumps(data, self.FORMAT_VERSION), self.COMPRESSION_LEVEL
+        )
+
+    def loads(self, raw, format_version):
+        if format_version != self.FORMAT_VERSION:
+            raise ValueError(
+                "marshal format version {} not supported".format(
+                    format_version
+                )
+            )
+        return marshal.loads(zlib.decompress(raw))
+
+CACHE_SERIALIZERS = {
+    serializer.NAME: serializer()
+    for serializer in (JSONSerializer, CompressedJSONSerializer,
+                       BinarySerializer)
+}
+
+_SERIALIZERS_BY_FORMAT_ID = {
+    serializer.FORMAT_ID: serializer
+    for serializer in CACHE_SERIALIZERS.values()
+    if serializer.FORMAT_ID is not None
+}
+
+def get_cache_serializer(name=None):
+    name = name or JSONSerializer.NAME
+
+    if name not in CACHE_SERIALIZERS:
+        raise CachedObjectsError(
+            "Unknown cache serializer: '{}'; it must be one of {}.".format(
+                name, ", ".join(sorted(CACHE_SERIALIZERS))
+            )
+        )
+    return CACHE_SERIALIZERS[name]
+
+def deserialize(raw):
+    """Decode data written by any of the serializers.
+
+    Data without the header is assumed to be plain JSON.
+    """
+    if isinstance(raw, str):
+        return json.loads(raw)
+
+    header_len = CacheSerializer.HEADER.size
+    if raw[:len(CacheSerializer.MAGIC)] != CacheSerializer.MAGIC:
+        return json.loads(raw)
+
+    _, header_version, format_id, format_version = \
+        CacheSerializer.HEADER.unpack(raw[:header_len])
+
+    if header_version != CacheSerializer.HEADER_VERSION:
+        raise ValueError(
+            "header version {} not supported".format(header_version)
+        )
+    if format_id not in _SERIALIZERS_BY_FORMAT_ID:
+        raise ValueError("format ID {} not supported".format(format_id))
+
+    return _SERIALIZERS_BY_FORMAT_ID[format_id].loads(
+        memoryview(raw)[header_len:], format_version
+    )
@@ -0,0 +1,150 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import threading
+import time
+
+from .errors import ARouteServerError
+
+
+class LatencyHistogram(object):
+    """Cumulative histogram of durations, in seconds."""
+
+    BUCKETS = (0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120)
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(self.BUCKETS) + 1)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+        for idx, upper_bound in enumerate(self.BUCKETS):
+            if value <= upper_bound:
+                self.buckets[idx] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def to_dict(self):
+        # Same format of the Prometheus histograms:
+        # each bucket counts the values <= its upper bound.
+        histogram = {}
+        cnt = 0
+        for upper_bound, bucket_cnt in zip(self.BUCKETS, self.buckets):
+            cnt += bucket_cnt
+            histogram[str(upper_bound)] = cnt
+        histogram["+Inf"] = self.count
+
+        return {
+            "count": self.count,
+            "total": round(self.total, 6),
+            "max": round(self.max, 6),
+            "histogram": histogram
+        }
+
+class CacheStats(object):
+    """Counters about the usage of the cache, by expiry time tag.
+
+    The same instance is shared by all the objects that use a
+    cache backend, so counters are aggregated across all the
+    threads of the enrichers.
+    """
+
+    COUNTERS = ("hits", "stale_hits", "negative_hits", "misses",
+                "not_modified", "fetch_errors", "bytes_read",
+                "bytes_written")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.start_time = time.time()
+
+            # { "<expiry_time_tag>": { "hits": x, ... } }
+            self.tags = {}
+
+    def _get_tag(self, tag):
+        if tag not in self.tags:
+            self.tags[tag] = {
+                "counters": dict.fromkeys(self.COUNTERS, 0),
+                "fetch_time": LatencyHistogram(),
+                "deserialization_time": 0.0
+            }
+        return self.tags[tag]
+
+    def incr(self, tag, counter, value=1):
+        assert counter in self.COUNTERS
+        with self.lock:
+            self._get_tag(tag)["counters"][counter] += value
+
+    def add_fetch_time(self, tag, seconds):
+        with self.lock:
+            self._get_tag(tag)["fetch_time"].add(seconds)
+
+    def add_read(self, tag, size, deserialization_time):
+        with self.lock:
+            stats = self._get_tag(tag)
+            stats["counters"]["bytes_read"] += size
+            stats["deserialization_time"] += deserialization_time
+
+    def to_dict(self):
+        with self.lock:
+            res = {
+                "start_time": int(self.start_time),
+                "duration": round(time.time() - self.start_time, 3),
+                "sources": {}
+            }
+            for tag in sorted(self.tags):
+                stats = self.tags[tag]
+                res["sources"][tag] = dict(stats["counters"])
+                res["sources"][tag]["fetch_time"] = \
+                    stats["fetch_time"].to_dict()
+                res["sources"][tag]["deserialization_time"] = \
+                    round(stats["deserialization_time"], 6)
+            return res
+
+    def get_summary(self):
+        hits = 0
+        misses = 0
+        fetch_time = 0.0
+        with self.lock:
+            for stats in self.tags.values():
+                hits += stats["counters"]["hits"] + \
+                    stats["counters"]["stale_hits"] + \
+                    stats["counters"]["negative_hits"]
+                misses += stats["counters"]["misses"]
+                fetch_time += stats["fetch_time"].total
+
+        return ("Cache: {} hits, {} misses, {:.1f} seconds spent "
+                "fetching external data".format(hits, misses, fetch_time))
+
+    def write_report(self, path):
+        try:
+            with open(path, "w") as f:
+                json.dump(self.to_dict(), f, indent=2)
+        except Exception as e:
+            raise ARouteServerError(
+                "Error while writing the cache stats file {}: {}".format(
+                    path, str(e)
+                )
+            )
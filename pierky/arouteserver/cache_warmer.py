@@ -0,0 +1,339 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
+import logging
+import threading
+import time
+
+from .arin_db_dump import ARINWhoisDBDump
+from .builder import ConfigBuilder
+from .enrichers.irrdb import IRRDBConfigEnricher_Combined
+from .enrichers.pdb_as_set import PeeringDBConfigEnricher_ASSet
+from .enrichers.pdb_max_prefix import PeeringDBConfigEnricher_MaxPrefix
+from .errors import ARouteServerError, BuilderError, ExternalDataNoInfoError
+from .irrdb import ASSet, RSet
+from .peering_db import PeeringDBNet, PeeringDBNetNeverViaRouteServers
+from .registro_br_db_dump import RegistroBRWhoisDBDump
+from .ripe_rpki_cache import RIPE_RPKI_ROAs
+from .rtr_client import RTR_RPKI_ROAs
+
+
+class CacheWarmUpStats(object):
+    """Per-source counters of the objects processed by the CacheWarmer."""
+
+    SOURCES = (
+        "PeeringDB networks",
+        "PeeringDB never via RS",
+        "IRR AS-SETs",
+        "IRR prefixes",
+        "RPKI ROAs",
+        "ARIN Whois DB dump",
+        "Registro.br Whois DB dump",
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+        # { "<source>": { "objects": x, "cached": x, ... } }
+        self.sources = {}
+
+        self.elapsed = 0
+
+    def add(self, source, from_cache, error, size, seconds):
+        with self.lock:
+            if source not in self.sources:
+                self.sources[source] = {
+                    "objects": 0,
+                    "cached": 0,
+                    "fetched": 0,
+                    "errors": 0,
+                    "bytes": 0,
+                    "seconds": 0.0
+                }
+            stats = self.sources[source]
+
+            stats["objects"] += 1
+            if error:
+                stats["errors"] += 1
+            elif from_cache:
+                stats["cached"] += 1
+            else:
+                stats["fetched"] += 1
+            stats["bytes"] += size
+            stats["seconds"] += seconds
+
+    @property
+    def errors(self):
+        return sum(stats["errors"] for stats in self.sources.values())
+
+    def to_text(self):
+        fmt = "{:<26} {:>8} {:>8} {:>8} {:>8} {:>14} {:>9}"
+
+        lines = [fmt.format("Source", "Objects", "Cached", "Fetched",
+                            "Errors", "Bytes", "Seconds")]
+        for source in self.SOURCES:
+            if source not in self.sources:
+                continue
+            stats = self.sources[source]
+            lines.append(fmt.format(
+                source, stats["objects"], stats["cached"],
+                stats["fetched"], stats["errors"],
+                "{:,}".format(stats["bytes"]),
+                "{:.1f}".format(stats["seconds"])
+            ))
+        lines.append("")
+        lines.append("Seconds are the sum of the time spent on each object; "
+                     "completed in {:.1f} seconds.".format(self.elapsed))
+        return "\n".join(lines)
+
+class CacheWarmer(ConfigBuilder):
+    """Fetch the external data needed to build the configuration.
+
+    The PeeringDB records, IRR datasets, RPKI ROAs and Whois DB dumps
+    that the configuration builders would use are fetched concurrently
+    and stored into the cache, so that the builders that are executed
+    afterwards (BIRD, OpenBGPD, HTML, ...) can run using only cached
+    data.
+
+    Data is gathered for all the clients and for both IPv4 and IPv6,
+    regardless of the ``ip_ver`` argument.
+    Stale cache entries are not used here: they are fetched again.
+
+    Errors are logged and do not stop the process. Once the object
+    is created, the stats of the warm-up process are available in
+    the ``warm_up_stats`` attribute.
+    """
+
+    TEMPLATE_NEEDED = False
+
+    def __init__(self, *args, **kwargs):
+        kwargs["ip_ver"] = None
+        kwargs["cache_serve_stale"] = None
+        self.warm_up_stats = CacheWarmUpStats()
+
+        ConfigBuilder.__init__(self, *args, **kwargs)
+
+    def _warm_up(self, source, obj):
+        start_time = time.time()
+
+        res = None
+        error = False
+        size = 0
+        try:
+            obj.load_data()
+            size = obj.cache_entry_size
+            res = obj
+        except ExternalDataNoInfoError:
+            # The missing info is cached too.
+            pass
+        except Exception as e:
+            logging.error(
+                "Error while fetching {} for the cache: {}".format(
+                    source, str(e) or "error unknown"
+                ),
+                exc_info=not isinstance(e, ARouteServerError)
+            )
+            error = True
+
+        self.warm_up_stats.add(source, obj.from_cache, error, size,
+                               time.time() - start_time)
+        return res
+
+    def _get_peeringdb_nets_tasks(self):
+        irrdb_cfg = self.cfg_general["filtering"]["irrdb"]
+
+        # { "<asn>": <clients whose AS-SETs are taken from PeeringDB> }
+        tasks = {}
+
+        if irrdb_cfg["peering_db"]:
+            tasks.update(
+                PeeringDBConfigEnricher_ASSet(self, self.threads).get_tasks()
+            )
+
+        for asn in PeeringDBConfigEnricher_MaxPrefix(
+            self, self.threads
+        ).get_tasks():
+            if asn not in tasks:
+                tasks[asn] = []
+
+        return tasks
+
+    def _submit_peeringdb_nets(self, executor, cache_cfg):
+        tasks = self._get_peeringdb_nets_tasks()
+
+        # Bulk queries are used only for the networks that
+        # are not in the cache yet.
+        missing_asns = []
+        for asn in tasks:
+            net = PeeringDBNet(int(asn), **cache_cfg)
+            try:
+                if net.load_data_from_cache() and not net.stale:
+                    continue
+            except ExternalDataNoInfoError:
+                continue
+            missing_asns.append(asn)
+
+        if missing_asns:
+            PeeringDBNet.populate_bulk_query_cache(missing_asns)
+
+        futures = []
+        for asn in tasks:
+            futures.append((
+                executor.submit(self._warm_up, "PeeringDB networks",
+                                PeeringDBNet(int(asn), **cache_cfg)),
+                tasks[asn]
+            ))
+        return futures
+
+    def _submit_irrdb(self, executor, cache_cfg):
+        # Same logic used by the builder to work out the
+        # AS-SET bundles of each client.
+        IRRDBConfigEnricher_Combined(self, self.threads).prepare()
+
+        irrdbtools_cfg = {
+            "bgpq3_path": self.bgpq3_path,
+            "bgpq3_host": self.bgpq3_host,
+            "bgpq3_sources": self.bgpq3_sources,
+            "bgpq3_timeout": self.bgpq3_timeout,
+            "irr_query_method": self.irr_query_method,
+        }
+        irrdbtools_cfg.update(cache_cfg)
+
+        allow_longer_prefixes = \
+            self.cfg_general["filtering"]["irrdb"]["allow_longer_prefixes"]
+
+        futures = []
+        for _, record in self.irrdb_info.items():
+            if "asns" in record.requested_objects:
+                futures.append(executor.submit(
+                    self._warm_up, "IRR AS-SETs",
+                    ASSet(record.object_names, **irrdbtools_cfg)
+                ))
+            if "prefixes" in record.requested_objects:
+                for ip_ver in (4, 6):
+                    futures.append(executor.submit(
+                        self._warm_up, "IRR prefixes",
+                        RSet(record.object_names, ip_ver,
+                             allow_longer_prefixes=allow_longer_prefixes,
+                             **irrdbtools_cfg)
+                    ))
+        return futures
+
+    def _submit_other_sources(self, executor, cache_cfg):
+        filtering = self.cfg_general["filtering"]
+        irrdb_cfg = filtering["irrdb"]
+
+        futures = []
+
+        if filtering["never_via_route_servers"]["peering_db"]:
+            futures.append(executor.submit(
+                self._warm_up, "PeeringDB never via RS",
+                PeeringDBNetNeverViaRouteServers(**cache_cfg)
+            ))
+
+        rpki_roas_cfg = self.cfg_general["rpki_roas"]
+        if self.cfg_general.rpki_roas_needed and \
+                rpki_roas_cfg["source"] == "rtr-client":
+            futures.append(executor.submit(
+                self._warm_up, "RPKI ROAs",
+                RTR_RPKI_ROAs(
+                    cache_dir=self.cache_dir,
+                    server=rpki_roas_cfg["rtr_client_server"],
+                    cache_backend=self.cache_backend
+                )
+            ))
+        elif self.cfg_general.rpki_roas_needed and \
+                rpki_roas_cfg["source"] == "ripe-rpki-validator-cache":
+            futures.append(executor.submit(
+                self._warm_up, "RPKI ROAs",
+                RIPE_RPKI_ROAs(
+                    ripe_rpki_validator_url=rpki_roas_cfg["ripe_rpki_validator_url"],
+                    ignore_cache_files_older_than=rpki_roas_cfg["ignore_cache_files_older_than"],
+                    fetch_mode=rpki_roas_cfg["ripe_rpki_validator_fetch_mode"],
+                    timeout=rpki_roas_cfg["ripe_rpki_validator_timeout"],
+                    **cache_cfg
+                )
+            ))
+
+        for cfg_section, source, parser_class in (
+            ("use_arin_bulk_whois_data", "ARIN Whois DB dump",
+             ARINWhoisDBDump),
+            ("use_registrobr_bulk_whois_data", "Registro.br Whois DB dump",
+             RegistroBRWhoisDBDump)
+        ):
+            if not irrdb_cfg[cfg_section]["enabled"]:
+                continue
+            futures.append(executor.submit(
+                self._warm_up, source,
+                parser_class(source=irrdb_cfg[cfg_section]["source"],
+                             **cache_cfg)
+            ))
+
+        return futures
+
+    def enrich_config(self):
+        start_time = time.time()
+
+        cache_cfg = {
+            "cache_dir": self.cache_dir,
+            "cache_expiry": self.cache_expiry,
+            "cache_backend": self.cache_backend,
+        }
+
+        # Clients IDs are needed to work out the IRR bundles.
+        clients_asns = {}
+        for client in self.cfg_clients.cfg["clients"]:
+            asn = "AS{}".format(client["asn"])
+            clients_asns[asn] = clients_asns.get(asn, 0) + 1
+            client["id"] = "{}_{}".format(asn, clients_asns[asn])
+
+        # A single pool of threads is used for all the sources.
+        # The IRR bundles can be known only after the AS-SETs
+        # of the clients have been fetched from PeeringDB, so
+        # their tasks are submitted only at that point, while
+        # the other sources are still being fetched.
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            try:
+                pdb_futures = self._submit_peeringdb_nets(executor,
+                                                          cache_cfg)
+            except ARouteServerError as e:
+                if str(e):
+                    logging.error(str(e))
+                raise BuilderError()
+
+            futures = self._submit_other_sources(executor, cache_cfg)
+
+            for future, clients in pdb_futures:
+                net = future.result()
+                if net is None or not net.irr_as_sets:
+                    continue
+                for client in clients:
+                    client["as_sets_from_pdb"] = deepcopy(net.irr_as_sets)
+
+            futures += self._submit_irrdb(executor, cache_cfg)
+
+            for future in futures:
+                future.result()
+
+        self.warm_up_stats.elapsed = time.time() - start_time
+
+        if self.warm_up_stats.errors:
+            logging.error(
+                "{} errors occurred while warming up the cache".format(
+                    self.warm_up_stats.errors
+                )
+            )
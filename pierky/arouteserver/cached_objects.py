@@ -13,21 +13,38 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import json
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import logging
-import os
+import threading
 import time
 
+from .cache_backends import CacheBackend, get_cache_backend
+from .cache_serializers import CACHE_SERIALIZERS
 from .errors import CachedObjectsError, ExternalDataNoInfoError, \
                     CachedObjectsExpiryTimeConfigurationError
 
 
-def normalize_expiry_time(config=None):
+def _normalize_per_tag_values(config, default, cfg_name, allowed_values=None):
+    # Values are integers, or strings out of allowed_values.
+    if allowed_values:
+        value_type = str
+        value_descr = "one of {}".format(", ".join(sorted(allowed_values)))
+    else:
+        value_type = int
+        value_descr = "an integer"
+
     res = {}
 
     if config is None:
-        res = CachedObject.DEFAULT_EXPIRY
-    elif isinstance(config, int):
+        res = dict(default)
+    elif isinstance(config, value_type):
+        if allowed_values and config not in allowed_values:
+            raise CachedObjectsExpiryTimeConfigurationError(
+                "Invalid value for '{}': it must be {}.".format(
+                    cfg_name, value_descr
+                )
+            )
         res["general"] = config
     elif isinstance(config, dict):
         try:
@@ -39,30 +56,120 @@ def normalize_expiry_time(config=None):
                             k, ", ".join(CachedObject.ALLOWED_EXPIRY_TIME_TAGS)
                         )
                     )
-                if not isinstance(config[k], int):
+                if not isinstance(config[k], value_type) or \
+                    (allowed_values and config[k] not in allowed_values):
                     raise ValueError(
                         "invalid value for the '{}' keyword: it must be "
-                        "an integer".format(k)
+                        "{}".format(k, value_descr)
                     )
-                res[k] = int(config[k])
+                res[k] = config[k]
         except ValueError as e:
             raise CachedObjectsExpiryTimeConfigurationError(
-                "Error while processing the 'cache_expiry' "
-                "configuration: {}.".format(str(e))
+                "Error while processing the '{}' "
+                "configuration: {}.".format(cfg_name, str(e))
             )
 
         if "general" not in res:
-            res["general"] = CachedObject.DEFAULT_EXPIRY["general"]
+            res["general"] = default["general"]
     else:
         raise CachedObjectsExpiryTimeConfigurationError(
-            "Invalid format for 'cache_expiry': it must be an "
-            "integer or a dictionary."
+            "Invalid format for '{}': it must be {} "
+            "or a dictionary.".format(cfg_name, value_descr)
         )
     for k in CachedObject.ALLOWED_EXPIRY_TIME_TAGS:
         if k not in res:
             res[k] = res["general"]
     return res
 
+def normalize_expiry_time(config=None):
+    return _normalize_per_tag_values(config, CachedObject.DEFAULT_EXPIRY,
+                                     "cache_expiry")
+
+def normalize_stale_max_age(config=None):
+    return _normalize_per_tag_values(config, CachedObject.DEFAULT_STALE_MAX_AGE,
+                                     "cache_serve_stale")
+
+def normalize_negative_expiry_time(config=None):
+    return _normalize_per_tag_values(config,
+                                     CachedObject.DEFAULT_NEGATIVE_EXPIRY,
+                                     "cache_negative_expiry")
+
+def normalize_serializers(config=None):
+    return _normalize_per_tag_values(config, CachedObject.DEFAULT_SERIALIZER,
+                                     "cache_serializer",
+                                     allowed_values=CACHE_SERIALIZERS)
+
+class StaleEntriesRefresher(object):
+    """Refresh expired entries that have been served from the cache.
+
+    Objects are refreshed in a pool of background threads; the
+    same entry is refreshed only once, even if it's requested
+    multiple times. A copy of the object is used, so that the
+    one that is in use is not touched by the background thread.
+    """
+
+    MAX_WORKERS = 4
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pending = {}
+
+    def submit(self, obj):
+        key = obj._get_object_filepath()
+
+        with self.lock:
+            if key in self.pending:
+                return
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.MAX_WORKERS,
+                    thread_name_prefix="stale_cache_refresher"
+                )
+            self.pending[key] = self.executor.submit(self._refresh, key,
+                                                     obj.get_fresh_copy())
+
+    def _refresh(self, key, obj):
+        try:
+            obj.refresh_cache()
+        except Exception as e:
+            logging.warning(
+                "Error while refreshing the stale cache entry {} in "
+                "background, the old data will be used till the next "
+                "attempt: {}".format(key, str(e) or "error unknown")
+            )
+        finally:
+            with self.lock:
+                del self.pending[key]
+
+    def wait(self):
+        with self.lock:
+            futures = list(self.pending.values())
+
+        if not futures:
+            return
+
+        logging.info("Waiting for {} stale cache entries to be "
+                     "refreshed...".format(len(futures)))
+        for future in futures:
+            future.result()
+
+STALE_ENTRIES_REFRESHER = StaleEntriesRefresher()
+
+def wait_for_stale_entries_refresh():
+    STALE_ENTRIES_REFRESHER.wait()
+
+class CachedDataNotModified(Exception):
+    """Raised by _get_data() when the cached data is still valid.
+
+    Children classes can use the metadata saved along with the
+    cached data (self.cached_meta) to perform conditional requests
+    (HTTP ETag / Last-Modified, content hash, ...) and raise this
+    exception when the source has not changed: the timestamp of the
+    cached entry is then updated, without processing the data again.
+    """
+    pass
+
 class CachedObject(object):
 
     DEFAULT_EXPIRY = {
@@ -80,11 +187,40 @@ class CachedObject(object):
                                 "registrobr_whois_db_dump")
     EXPIRY_TIME_TAG = "general"
 
+    # Objects made of a single large entry, loaded once per build,
+    # are not kept in the in-memory cache of the backend.
+    USE_CACHE_MEMO = True
+
+    # Serving stale entries is disabled by default; see
+    # the 'cache_serve_stale' option in config.d/arouteserver.yml
+    DEFAULT_STALE_MAX_AGE = {
+        "general": 0
+    }
+
+    # Entries for objects for which no information is available
+    # expire sooner than the others; see the 'cache_negative_expiry'
+    # option in config.d/arouteserver.yml
+    DEFAULT_NEGATIVE_EXPIRY = {
+        "general": 3600
+    }
+
+    # Format used to store cached data; see the 'cache_serializer'
+    # option in config.d/arouteserver.yml
+    DEFAULT_SERIALIZER = {
+        "general": "json"
+    }
+
     MISSING_INFO_EXCEPTION = ExternalDataNoInfoError
 
     def get_expiry_time(self, cache_expiry):
         return cache_expiry[self.EXPIRY_TIME_TAG]
 
+    def __new__(cls, *args, **kwargs):
+        obj = object.__new__(cls)
+        # Used by get_fresh_copy().
+        obj._init_args = (args, kwargs)
+        return obj
+
     def __init__(self, **kwargs):
         self.cache_dir = kwargs.get("cache_dir", "var")
         if not self.cache_dir:
@@ -96,31 +232,65 @@ class CachedObject(object):
         else:
             self.cache_expiry_time = cache_expiry[self.EXPIRY_TIME_TAG]
 
+        # Can be a CacheBackend instance or the name of the backend.
+        cache_backend = kwargs.get("cache_backend", None)
+        if isinstance(cache_backend, CacheBackend):
+            self.cache_backend = cache_backend
+        else:
+            self.cache_backend = get_cache_backend(self.cache_dir,
+                                                   cache_backend)
+
         self.raw_data = None
         self.bypass_cache = False
         self.from_cache = False
+        self.stale = False
+
+        # Size of the serialized data of the cache entry that
+        # was loaded or saved last.
+        self.cache_entry_size = 0
+
+        # Metadata saved along with the data: the one of the entry
+        # found in the cache, even if expired, and the one that
+        # _get_data() sets for the data it returns.
+        self.cached_meta = {}
+        self.meta = {}
 
     def _get_object_filename(self):
         raise NotImplementedError()
 
     def _get_object_filepath(self):
-        return os.path.join(self.cache_dir, self._get_object_filename())
+        return self.cache_backend.get_location(self._get_object_filename())
+
+    def get_negative_expiry_time(self):
+        # Negative entries never last longer than the positive ones.
+        negative_expiry = self.cache_backend.negative_expiry.get(
+            self.EXPIRY_TIME_TAG
+        )
+        if negative_expiry is None:
+            return self.cache_expiry_time
+        return min(negative_expiry, self.cache_expiry_time)
+
+    def _get_memo_ns(self):
+        if not self.USE_CACHE_MEMO:
+            return None
+        return self.__class__.__name__
 
     def load_data_from_cache(self):
-        file_path = self._get_object_filepath()
+        key = self._get_object_filename()
 
-        if not os.path.isfile(file_path):
-            return False
+        data, self.cache_entry_size = self.cache_backend.load_with_size(
+            key, self.EXPIRY_TIME_TAG, memo_ns=self._get_memo_ns()
+        )
 
-        try:
-            with open(file_path, "r") as f:
-                data = json.load(f)
-        except Exception as e:
-            logging.error(
-                "Error while reading data from cache: {} - {}".format(
-                    file_path, str(e)
-                )
-            )
+        # The most recent between the entry and the negative one.
+        negative_ts = self.cache_backend.load_negative(key)
+        if negative_ts is not None:
+            if not isinstance(data, dict) or \
+                negative_ts >= data.get("ts", 0):
+                data = {"ts": negative_ts, "data": None}
+                self.cache_entry_size = 0
+
+        if not isinstance(data, dict):
             return False
 
         if "ts" not in data:
@@ -128,15 +298,33 @@ class CachedObject(object):
         if "data" not in data:
             return False
 
+        if data["data"] is not None:
+            self.cached_meta = data.get("meta") or {}
+
         epoch_time = int(time.time())
 
-        if data["ts"] <= epoch_time - self.cache_expiry_time:
-            return False
+        if data["data"] is None:
+            expiry_time = self.get_negative_expiry_time()
+        else:
+            expiry_time = self.cache_expiry_time
+
+        if data["ts"] <= epoch_time - expiry_time:
+            # Expired entries can still be used, if serving stale
+            # data is allowed and the hard limit is not reached yet.
+            stale_max_age = self.cache_backend.serve_stale.get(
+                self.EXPIRY_TIME_TAG, 0
+            )
+            if data["data"] is None or \
+                data["ts"] <= epoch_time - stale_max_age:
+                return False
+
+            self.stale = True
 
         if data["data"] is None:
             logging.debug(
                 "Cache hit: missing info {}".format(self._get_object_filepath())
             )
+            self.from_cache = True
             raise self.MISSING_INFO_EXCEPTION()
 
         self.raw_data = data["data"]
@@ -145,41 +333,203 @@ class CachedObject(object):
     def _get_data(self):
         raise NotImplementedError()
 
-    def load_data(self):
-        if not self.bypass_cache and self.load_data_from_cache():
-            logging.debug("Cache hit: {}".format(self._get_object_filepath()))
-            self.from_cache = True
-            return
+    def _load_cached_data(self):
+        if self.bypass_cache:
+            return False
+
+        stats = self.cache_backend.stats
 
-        # Children classes raise ExternalDataNoInfoError-derived exceptions
-        # when no information can be obtained for the requested resource.
-        # Here, the data is saved to the file even in case of missing info,
-        # then the original exception is re-raised.
         try:
-            self.raw_data = self._get_data()
-            self.from_cache = False
+            if not self.load_data_from_cache():
+                return False
+        except self.MISSING_INFO_EXCEPTION:
+            stats.incr(self.EXPIRY_TIME_TAG, "negative_hits")
+            raise
+
+        self.from_cache = True
+        if self.stale:
+            stats.incr(self.EXPIRY_TIME_TAG, "stale_hits")
+            logging.debug("Cache hit: {} (stale, refreshing it "
+                          "in background)".format(
+                              self._get_object_filepath()))
+            STALE_ENTRIES_REFRESHER.submit(self)
+        else:
+            stats.incr(self.EXPIRY_TIME_TAG, "hits")
+            logging.debug("Cache hit: {}".format(
+                self._get_object_filepath()))
+        return True
+
+    def _fetch_data(self):
+        """Call _get_data(), keeping track of the time spent."""
+        stats = self.cache_backend.stats
+
+        self.meta = {}
+        if self.bypass_cache:
+            # Conditional requests would lead to the cached data.
+            self.cached_meta = {}
+
+        start_time = time.time()
+        try:
+            return self._get_data()
+        except CachedDataNotModified:
+            stats.incr(self.EXPIRY_TIME_TAG, "not_modified")
+            raise
         except ExternalDataNoInfoError:
-            self.save_data_to_cache()
             raise
+        except Exception:
+            stats.incr(self.EXPIRY_TIME_TAG, "fetch_errors")
+            raise
+        finally:
+            stats.add_fetch_time(self.EXPIRY_TIME_TAG,
+                                 time.time() - start_time)
 
-        self.save_data_to_cache()
+    def _get_conditional_headers(self, url):
+        """HTTP headers used to revalidate the data fetched from url."""
+        headers = {}
 
-    def save_data_to_cache(self):
-        file_path = self._get_object_filepath()
+        if self.cached_meta.get("url") != url:
+            return headers
 
+        if self.cached_meta.get("etag"):
+            headers["If-None-Match"] = self.cached_meta["etag"]
+        if self.cached_meta.get("last_modified"):
+            headers["If-Modified-Since"] = self.cached_meta["last_modified"]
+
+        return headers
+
+    def _set_validators(self, url, content, response=None, digest=None):
+        """Set the metadata used to revalidate the data fetched from url.
+
+        When the content is read in chunks, its SHA256 hex digest
+        can be passed in place of it.
+
+        Raise CachedDataNotModified if the content is the same
+        from which the cached data was built.
+        """
+        self.meta["url"] = url
+        self.meta["sha256"] = digest or hashlib.sha256(content).hexdigest()
+
+        if response is not None:
+            for header, key in (("ETag", "etag"),
+                                ("Last-Modified", "last_modified")):
+                if response.headers.get(header):
+                    self.meta[key] = response.headers[header]
+
+        if self.cached_meta.get("url") == url and \
+            self.cached_meta.get("sha256") == self.meta["sha256"]:
+            raise CachedDataNotModified()
+
+    def load_data(self):
+        if self._load_cached_data():
+            return
+
+        # Only one process at a time fetches the object; the others
+        # wait for the lock to be released and then find the
+        # object in the cache.
+        with self.cache_backend.lock(self._get_object_filename()):
+            # The entry could have been refreshed by another process
+            # in the meantime: the in-memory copy is not used here.
+            self.cache_backend.memo.pop(self._get_object_filename())
+            if self._load_cached_data():
+                return
+
+            self.cache_backend.stats.incr(self.EXPIRY_TIME_TAG, "misses")
+
+            # Children classes raise ExternalDataNoInfoError-derived
+            # exceptions when no information can be obtained for the
+            # requested resource. Here, the data is saved to the file
+            # even in case of missing info, then the original exception
+            # is re-raised.
+            try:
+                self.raw_data = self._fetch_data()
+                self.from_cache = False
+            except CachedDataNotModified:
+                self.raw_data = self._touch_entry()
+                self.from_cache = True
+                return
+            except ExternalDataNoInfoError:
+                self.save_data_to_cache()
+                raise
+
+            self.save_data_to_cache()
+
+    def get_fresh_copy(self):
+        """A new object built using the same arguments of this one.
+
+        Only the metadata of the cached entry is copied, so that
+        the data can be revalidated at the source.
+        """
+        args, kwargs = self._init_args
+        obj = self.__class__(*args, **kwargs)
+        obj.cached_meta = dict(self.cached_meta)
+        return obj
+
+    def refresh_cache(self):
+        """Fetch the data again and save it to the cache.
+
+        Used to refresh stale entries: the data currently
+        loaded into the object is not modified.
+        """
+        with self.cache_backend.lock(self._get_object_filename()):
+            try:
+                data = self._fetch_data()
+            except CachedDataNotModified:
+                self._touch_entry()
+                return
+            except ExternalDataNoInfoError:
+                data = None
+
+            self._save_entry(data)
+
+    def _touch_entry(self):
+        """Update the timestamp of the cached entry and return its data."""
+        key = self._get_object_filename()
+
+        entry = self.cache_backend.load(key, self.EXPIRY_TIME_TAG)
+        if not isinstance(entry, dict) or entry.get("data") is None:
+            # Removed in the meantime: data must be fetched again,
+            # this time without using the previous metadata.
+            logging.debug("Cache entry not found while updating its "
+                          "timestamp: {}".format(self._get_object_filepath()))
+            self.cached_meta = {}
+            data = self._fetch_data()
+            self._save_entry(data)
+            return data
+
+        logging.debug("Cache entry not modified at the source: {}".format(
+            self._get_object_filepath()))
+
+        # Validators received with the last response take precedence.
+        meta = dict(entry.get("meta") or {})
+        meta.update(self.meta)
+        self.meta = meta
+
+        self._save_entry(entry["data"])
+        return entry["data"]
+
+    def _save_entry(self, data):
         epoch_time = int(time.time())
+        key = self._get_object_filename()
+
+        if data is None:
+            self.cache_backend.save_negative(key, epoch_time)
+            self.cache_entry_size = 0
+            return
+
+        if self.cache_backend.load_negative(key) is not None:
+            self.cache_backend.delete_negative(key)
 
         cache_data = {
             "ts": epoch_time,
-            "data": self.raw_data
+            "data": data
         }
+        if self.meta:
+            cache_data["meta"] = self.meta
 
-        try:
-            if not os.path.exists(os.path.dirname(file_path)):
-                os.makedirs(os.path.dirname(file_path))
-            with open(file_path, "w") as f:
-                json.dump(cache_data, f)
-        except Exception as e:
-            raise CachedObjectsError(
-                "Error while saving data to the cache: {}".format(str(e))
-            )
+        self.cache_entry_size = self.cache_backend.save(
+            key, cache_data, self.EXPIRY_TIME_TAG,
+            memo_ns=self._get_memo_ns()
+        )
+
+    def save_data_to_cache(self):
+        self._save_entry(self.raw_data)
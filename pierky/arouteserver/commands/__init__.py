@@ -34,6 +34,8 @@ from .configure import ConfigureCommand
 from .show_config import ShowConfigCommand
 from .ixf_member_list_from_clients import IXFMemberListFromClientsCommand
 from .check_config import CheckConfigCommand
+from .cache_warm import CacheWarmCommand
+from .cache_gc import CacheGCCommand
 
 all_commands = [
     BuildCommand,
@@ -43,6 +45,8 @@ all_commands = [
     MDCommand,
     DumpTemplateContextCommand,
     IRRASSetCommand,
+    CacheWarmCommand,
+    CacheGCCommand,
     ClientsFromPeeringDBCommand,
     ClientsFromEuroIXCommand,
     SetupCommand,
@@ -0,0 +1,95 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import sys
+
+from .base import ARouteServerCommand
+from ..cache_gc import CacheGC
+from ..config.program import program_config
+
+
+def run_cache_gc(max_size=None, max_age=None, dry_run=False):
+    """Garbage collection of the cache, as configured in arouteserver.yml.
+
+    max_size (MB) and max_age (seconds), when not None, override
+    the values from the program's configuration file.
+    """
+    if max_size is None:
+        max_size = program_config.get("cache_max_size")
+    if max_age is None:
+        max_age = program_config.get("cache_max_age")
+
+    return CacheGC(
+        cache_dir=program_config.get_dir("cache_dir"),
+        cache_backend=program_config.get("cache_backend"),
+        max_size=int(max_size) * 1024 * 1024,
+        max_age=int(max_age),
+        dry_run=dry_run
+    ).run()
+
+class CacheGCCommand(ARouteServerCommand):
+
+    COMMAND_NAME = "cache-gc"
+    COMMAND_HELP = ("Remove from the cache the objects that have not been "
+                    "used recently, accordingly to the 'cache_max_age' and "
+                    "'cache_max_size' options of the program's "
+                    "configuration file.")
+
+    NEEDS_CONFIG = True
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super(CacheGCCommand, cls).add_arguments(parser)
+
+        parser.add_argument(
+            "-o", "--output",
+            type=argparse.FileType('w'),
+            help="Output file where the summary of the removed objects "
+                 "is written. Default: stdout.",
+            default=sys.stdout,
+            dest="output_file")
+
+        parser.add_argument(
+            "--max-size",
+            type=int,
+            help="Size of the cache, in megabytes, above which the least "
+                 "recently used objects are removed. 0 = no limit. "
+                 "Overrides 'cache_max_size'.",
+            metavar="MB",
+            dest="max_size")
+
+        parser.add_argument(
+            "--max-age",
+            type=int,
+            help="Objects not used for more than this number of seconds "
+                 "are removed. 0 = no limit. Overrides 'cache_max_age'.",
+            metavar="SECONDS",
+            dest="max_age")
+
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would be removed.",
+            dest="dry_run")
+
+    def run(self):
+        result = run_cache_gc(max_size=self.args.max_size,
+                              max_age=self.args.max_age,
+                              dry_run=self.args.dry_run)
+
+        self.args.output_file.write(result.to_text() + "\n")
+
+        return True
@@ -0,0 +1,93 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import sys
+
+from .base import ARouteServerCommand
+from ..cache_warmer import CacheWarmer
+from ..config.program import program_config
+
+
+class CacheWarmCommand(ARouteServerCommand):
+
+    COMMAND_NAME = "cache-warm"
+    COMMAND_HELP = ("Fetch all the external data (PeeringDB, IRR, RPKI "
+                    "ROAs, Whois DB dumps) needed to build the route "
+                    "server configuration and store it into the cache, "
+                    "so that the following builds can use it.")
+
+    NEEDS_CONFIG = True
+
+    @classmethod
+    def add_arguments(cls, parser):
+        super(CacheWarmCommand, cls).add_arguments(parser)
+
+        parser.add_argument(
+            "-o", "--output",
+            type=argparse.FileType('w'),
+            help="Output file where the summary of the fetched data "
+                 "is written. Default: stdout.",
+            default=sys.stdout,
+            dest="output_file")
+
+        group = parser.add_argument_group(
+            title="Route server configuration",
+            description="The following arguments override those provided "
+                        "in the program's configuration file."
+        )
+
+        group.add_argument(
+            "--general",
+            help="General route server configuration file.",
+            metavar="FILE",
+            dest="cfg_general")
+
+        group.add_argument(
+            "--clients",
+            help="Route server clients configuration file.",
+            metavar="FILE",
+            dest="cfg_clients")
+
+        group.add_argument(
+            "--bogons",
+            help="Bogons configuration file.",
+            metavar="FILE",
+            dest="cfg_bogons")
+
+    def run(self):
+        warmer = CacheWarmer(
+            cfg_general=program_config.get("cfg_general"),
+            cfg_clients=program_config.get("cfg_clients"),
+            cfg_bogons=program_config.get("cfg_bogons"),
+            cache_dir=program_config.get_dir("cache_dir"),
+            cache_expiry=program_config.get("cache_expiry"),
+            cache_backend=program_config.get("cache_backend"),
+            cache_negative_expiry=program_config.get("cache_negative_expiry"),
+            cache_serializer=program_config.get("cache_serializer"),
+            cache_memory_limit=program_config.get("cache_memory_limit"),
+            bgpq3_path=program_config.get("bgpq3_path"),
+            bgpq3_host=program_config.get("bgpq3_host"),
+            bgpq3_sources=program_config.get("bgpq3_sources"),
+            bgpq3_timeout=program_config.get("bgpq3_timeout"),
+            irr_query_method=program_config.get("irr_query_method"),
+            irr_dumps=program_config.get("irr_dumps"),
+            threads=program_config.get("threads"),
+            ignore_errors=["*"]
+        )
+
+        self.args.output_file.write(warmer.warm_up_stats.to_text() + "\n")
+
+        return warmer.warm_up_stats.errors == 0
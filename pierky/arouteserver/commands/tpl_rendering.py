@@ -19,9 +19,11 @@ import os
 import sys
 
 from .base import ARouteServerCommand
+from .cache_gc import run_cache_gc
 from ..builder import ConfigBuilder, BIRDConfigBuilder, \
                       OpenBGPDConfigBuilder, TemplateContextDumper, \
                       IRRASSetBuilder
+from ..cached_objects import wait_for_stale_entries_refresh
 from ..config.program import program_config
 from ..errors import ARouteServerError, TemplateRenderingError
 
@@ -66,6 +68,15 @@ class TemplateRenderingCommands(ARouteServerCommand):
             metavar="ISSUE_ID",
             dest="ignore_errors")
 
+        parser.add_argument(
+            "--stats-file",
+            help="File where a JSON report is written, with the stats "
+                 "about the usage of the cache and the time spent "
+                 "fetching data from external sources (PeeringDB, IRR, "
+                 "RPKI ROAs, ...), by source.",
+            metavar="FILE",
+            dest="stats_file")
+
         group = parser.add_argument_group(
             title="Route server configuration",
             description="The following arguments override those provided "
@@ -159,10 +170,19 @@ class TemplateRenderingCommands(ARouteServerCommand):
             "cfg_bogons": program_config.get("cfg_bogons"),
             "cache_dir": program_config.get_dir("cache_dir"),
             "cache_expiry": program_config.get("cache_expiry"),
+            "cache_backend": program_config.get("cache_backend"),
+            "cache_serve_stale": program_config.get("cache_serve_stale"),
+            "cache_negative_expiry": program_config.get("cache_negative_expiry"),
+            "cache_serializer": program_config.get("cache_serializer"),
+            "cache_memory_limit": program_config.get("cache_memory_limit"),
             "bgpq3_path": program_config.get("bgpq3_path"),
             "bgpq3_host": program_config.get("bgpq3_host"),
             "bgpq3_sources": program_config.get("bgpq3_sources"),
             "bgpq3_timeout": program_config.get("bgpq3_timeout"),
+            "irr_query_method": program_config.get("irr_query_method"),
+            "irr_dumps": program_config.get("irr_dumps"),
+            "aggregate_prefix_lists": program_config.get("aggregate_prefix_lists"),
+            "compress_rpki_roas": program_config.get("compress_rpki_roas"),
             "rtt_getter_path": program_config.get("rtt_getter_path"),
             "template_dir": program_config.get_dir("templates_dir"),
             "template_name": program_config.get("template_name"),
@@ -170,6 +190,7 @@ class TemplateRenderingCommands(ARouteServerCommand):
             "perform_graceful_shutdown": self.args.perform_graceful_shutdown,
             "threads": program_config.get("threads"),
             "ignore_errors": self.args.ignore_errors,
+            "stats_file": self.args.stats_file,
         }
         self._set_cfg_builder_params()
 
@@ -185,6 +206,19 @@ class TemplateRenderingCommands(ARouteServerCommand):
             builder = builder_class(**self.cfg_builder_params)
             if not self.args.test_only:
                 builder.render_template(output_file=self.args.output_file)
+
+            # Stale cache entries used to build the configuration
+            # are refreshed in background while it's rendered.
+            wait_for_stale_entries_refresh()
+
+            if program_config.get("cache_gc_after_build") and \
+                not self.args.test_only:
+                # The configuration has already been built.
+                try:
+                    run_cache_gc()
+                except ARouteServerError as e:
+                    logging.error("Error during the garbage collection "
+                                  "of the cache: {}".format(str(e)))
         except TemplateRenderingError as e:
             if tpl_all_right:
                 raise
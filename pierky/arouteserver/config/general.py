@@ -20,6 +20,7 @@ from .base import ConfigParserBase, convert_deprecated
 from .validators import *
 from ..errors import ConfigError, ARouteServerError
 from ..reject_reasons import REJECT_REASONS
+from ..rtr_client import parse_rtr_server
 
 
 class ConfigParserGeneral(ConfigParserBase):
@@ -218,7 +219,7 @@ class ConfigParserGeneral(ConfigParserBase):
         c["rpki_roas"] = OrderedDict()
         r = c["rpki_roas"]
         r["source"] = ValidatorOption("source",
-            ("ripe-rpki-validator-cache", "rtr"),
+            ("ripe-rpki-validator-cache", "rtr", "rtr-client"),
             mandatory=True,
             default="ripe-rpki-validator-cache"
         )
@@ -243,6 +244,14 @@ class ConfigParserGeneral(ConfigParserBase):
             ]
         )
         r["ignore_cache_files_older_than"] = ValidatorUInt(default=21600, mandatory=True)
+        r["ripe_rpki_validator_fetch_mode"] = ValidatorOption(
+            "ripe_rpki_validator_fetch_mode", ("sequential", "freshest"),
+            mandatory=True, default="sequential"
+        )
+        r["ripe_rpki_validator_timeout"] = ValidatorUInt(default=30,
+                                                         mandatory=True)
+        r["rtr_client_server"] = ValidatorText(default="127.0.0.1:3323",
+                                               mandatory=True)
 
         c["blackhole_filtering"] = OrderedDict()
         b = c["blackhole_filtering"]
@@ -540,6 +549,14 @@ class ConfigParserGeneral(ConfigParserBase):
             filtering["irrdb"]["use_rpki_roas_as_route_objects"]["enabled"] or \
             filtering["rpki_bgp_origin_validation"]["enabled"]
 
+        rpki_roas = self.cfg["cfg"]["rpki_roas"]
+        if self.rpki_roas_needed and rpki_roas["source"] == "rtr-client":
+            try:
+                parse_rtr_server(rpki_roas["rtr_client_server"])
+            except ARouteServerError as e:
+                errors = True
+                logging.error(str(e))
+
         # Is the ARIN Origin AS feature used?
         if filtering["irrdb"]["use_arin_bulk_whois_data"]["enabled"]:
             logging.warning(
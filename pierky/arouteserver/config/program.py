@@ -26,6 +26,7 @@ import yaml
 from ..ask import Ask
 from ..irrdb import IRRDBInfo
 from ..cached_objects import CachedObject
+from ..cache_gc import CacheGC
 from ..resources import get_config_dir, get_templates_dir
 from ..errors import ConfigError, ARouteServerError, MissingFileError, \
                      ProgramConfigError
@@ -55,11 +56,23 @@ class ConfigParserProgram(object):
 
         "cache_dir": "cache",
         "cache_expiry": CachedObject.DEFAULT_EXPIRY,
+        "cache_backend": "json",
+        "cache_serve_stale": CachedObject.DEFAULT_STALE_MAX_AGE,
+        "cache_negative_expiry": CachedObject.DEFAULT_NEGATIVE_EXPIRY,
+        "cache_serializer": CachedObject.DEFAULT_SERIALIZER,
+        "cache_memory_limit": 0,
+        "cache_max_size": 0,
+        "cache_max_age": CacheGC.DEFAULT_MAX_AGE,
+        "cache_gc_after_build": False,
 
         "bgpq3_path": "bgpq4",
         "bgpq3_host": IRRDBInfo.BGPQ3_DEFAULT_HOST,
         "bgpq3_sources": IRRDBInfo.BGPQ3_DEFAULT_SOURCES,
         "bgpq3_timeout": IRRDBInfo.BGPQ3_DEFAULT_TIMEOUT,
+        "irr_query_method": IRRDBInfo.IRR_QUERY_METHOD_DEFAULT,
+        "irr_dumps": [],
+        "aggregate_prefix_lists": False,
+        "compress_rpki_roas": False,
 
         "rtt_getter_path": "",
 
@@ -131,6 +144,16 @@ class ConfigParserProgram(object):
             list_as_str = self.cfg["bgpq3_host"]
             self.cfg["bgpq3_host"] = list(map(str.strip, list_as_str.split(",")))
 
+        if isinstance(self.cfg["irr_dumps"], str):
+            list_as_str = self.cfg["irr_dumps"]
+            self.cfg["irr_dumps"] = list(map(str.strip, list_as_str.split(",")))
+
+        # relative paths of the IRR dumps -> absolute paths
+        self.cfg["irr_dumps"] = [
+            os.path.join(self.cfg["cfg_dir"], os.path.expanduser(path))
+            for path in self.cfg["irr_dumps"] or []
+        ]
+
         # relative path -> absolute path
         for cfg_key in self.PATH_KEYS:
             if not self.cfg[cfg_key]:
@@ -13,6 +13,8 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import heapq
+import itertools
 import logging
 import queue
 import time
@@ -20,6 +22,36 @@ import threading
 
 from ..errors import BuilderError, ARouteServerError
 
+class TasksQueue(queue.PriorityQueue):
+    """Queue of the tasks of an enricher.
+
+    Tasks can be added with an estimated cost: the most expensive
+    ones are returned first, so that long tasks don't end up being
+    processed last while the other threads are idle. Tasks with the
+    same cost (by default, 0) are returned in FIFO order.
+    """
+
+    def _init(self, maxsize):
+        queue.PriorityQueue._init(self, maxsize)
+        self.counter = itertools.count()
+        self.costs = []
+
+    def put(self, task, block=True, timeout=None, cost=0):
+        queue.PriorityQueue.put(self, (-cost, next(self.counter), task),
+                                block, timeout)
+        self.costs.append(cost)
+
+    def get(self, block=True, timeout=None):
+        return queue.PriorityQueue.get(self, block, timeout)[2]
+
+    def get_predicted_makespan(self, threads):
+        """Time needed to process the queued tasks with the
+        given number of threads, according to their costs."""
+        workers = [0] * max(threads, 1)
+        for cost in sorted(self.costs, reverse=True):
+            heapq.heapreplace(workers, workers[0] + cost)
+        return max(workers)
+
 class BaseConfigEnricherThread(threading.Thread):
 
     DESCR = None
@@ -112,7 +144,7 @@ class BaseConfigEnricher(object):
     def __init__(self, builder, threads):
         self.builder = builder
         self.threads = threads
-        self.tasks_q = queue.Queue()
+        self.tasks_q = TasksQueue()
         self.errors_q = queue.Queue(maxsize=1)
 
     def prepare(self):
@@ -144,6 +176,15 @@ class BaseConfigEnricher(object):
 
         self.add_tasks()
 
+        predicted_makespan = self.tasks_q.get_predicted_makespan(self.threads)
+        if predicted_makespan:
+            logging.info(
+                "Enricher '{}': {} tasks, predicted makespan {:.1f} "
+                "seconds".format(self.WORKER_THREAD_CLASS.DESCR,
+                                 self.tasks_q.qsize(), predicted_makespan)
+            )
+        makespan_start_time = time.time()
+
         for t in threads:
             t.start()
 
@@ -157,6 +198,15 @@ class BaseConfigEnricher(object):
         q_monitor.done = True
         q_monitor.join(timeout=5)
 
+        if predicted_makespan:
+            logging.info(
+                "Enricher '{}': predicted makespan {:.1f} seconds, "
+                "actual {:.1f} seconds".format(
+                    self.WORKER_THREAD_CLASS.DESCR, predicted_makespan,
+                    time.time() - makespan_start_time
+                )
+            )
+
         stop_time = int(time.time())
 
         try:
@@ -18,6 +18,7 @@ import logging
 import os
 
 from .base import BaseConfigEnricher
+from ..cache_backends import write_json_atomically
 from ..ipaddresses import IPNetwork
 from ..errors import ARouteServerError, BuilderError
 
@@ -28,8 +29,20 @@ class GenericIRRWhoisRecord_Proxy(object):
         self.path = path
         self.allow_longer_prefixes = allow_longer_prefixes
 
+        # Set by the builder when prefix lists are aggregated.
+        self.aggregated_prefixes = None
+
+    def save_prefixes(self, prefixes):
+        """Use the given entries in place of those from the file."""
+        self.aggregated_prefixes = prefixes
+
     @property
     def prefixes(self):
+        if self.aggregated_prefixes is not None:
+            return iter(self.aggregated_prefixes)
+        return self._read_prefixes()
+
+    def _read_prefixes(self):
         with open(self.path, "r") as f:
             prefix_lst = json.load(f)
             for prefix in prefix_lst:
@@ -89,6 +102,7 @@ class GenericIRRWhoisDBDumpEnricher(BaseConfigEnricher):
 
         whois_db_dump = self.PARSER_CLASS(
             cache_dir=cache_dir, cache_expiry=self.builder.cache_expiry,
+            cache_backend=self.builder.cache_backend,
             source=source)
         try:
             whois_db_dump.load_data()
@@ -131,8 +145,8 @@ class GenericIRRWhoisDBDumpEnricher(BaseConfigEnricher):
         allow_longer_prefixes = self.builder.cfg_general["filtering"]["irrdb"]["allow_longer_prefixes"]
         for asn in asn_prefixes:
             path = os.path.join(db_dir, "{}.json".format(asn))
-            with open(path, "w") as f:
-                json.dump(list(asn_prefixes[asn]), f)
+            # Other builds could be reading the same files.
+            write_json_atomically(path, list(asn_prefixes[asn]))
             target_dic = getattr(self.builder, self.BUILDER_TARGET_DICT_NAME)
             target_dic[asn] = \
                 GenericIRRWhoisRecord_Proxy(asn, path, allow_longer_prefixes)
@@ -13,21 +13,18 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import atexit
 import logging
-import shutil
-import pickle
-import tempfile
+import threading
+import time
 
 from .base import BaseConfigEnricher, BaseConfigEnricherThread
 from ..errors import BuilderError, ARouteServerError
 from ..ipaddresses import IPAddress, IPNetwork
 from ..irrdb import ASSet, RSet, AS_SET_Bundle
+from ..irrdb_store import IRRDBStore
+from ..rpsl_index import get_rpsl_dump_index
 
 
-def clear_irrdb_pickle_dir(target_dir):
-    shutil.rmtree(target_dir, ignore_errors=True)
-
 class IRRDB(object):
     """
     Container for IRRDB "records".
@@ -37,12 +34,11 @@ class IRRDB(object):
     passed to bgpq3 to retrieve prefixes and/or ASNs; bgpq3's ability
     to aggregate prefixes is used to merge the content of each object
     into a single dataset.
+    The data of all the records is kept in an IRRDBStore.
     """
 
-    def __init__(self):
-        self.irrdb_pickle_dir = tempfile.mkdtemp(suffix="_arouteserver")
-        atexit.register(clear_irrdb_pickle_dir,
-                        target_dir=self.irrdb_pickle_dir)
+    def __init__(self, memory_limit=IRRDBStore.DEFAULT_MEMORY_LIMIT):
+        self.store = IRRDBStore(memory_limit)
 
         self.records = {}
 
@@ -62,7 +58,7 @@ class IRRDB(object):
                 )
             )
 
-        new_record = IRRDBRecord(names_list, self.irrdb_pickle_dir)
+        new_record = IRRDBRecord(names_list, self.store)
 
         if new_record.id not in self.records:
             self.records[new_record.id] = new_record
@@ -93,34 +89,32 @@ class IRRDB(object):
 
 class IRRDBRecord(AS_SET_Bundle):
 
-    def __init__(self, as_set_names, irrdb_pickle_dir):
+    def __init__(self, as_set_names, store):
         AS_SET_Bundle.__init__(self, as_set_names)
 
         self.used_by = set()
 
         self.requested_objects = set()
 
-        self.irrdb_pickle_dir = irrdb_pickle_dir
-
-        self.saved_objects = []
+        self.store = store
 
-    def get_path(self, objects):
-        return "{}/pickle_{}.{}".format(self.irrdb_pickle_dir, self.id, objects)
+        # { "asns"|"prefixes": <handle of the data in the store> }
+        self.saved_objects = {}
 
     def save(self, objects, data):
-        if objects in ("asns", "prefixes"):
-            with open(self.get_path(objects), "wb") as f:
-                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
-            self.saved_objects += [objects]
+        if objects == "asns":
+            self.saved_objects[objects] = self.store.put_asns(data)
+        elif objects == "prefixes":
+            self.saved_objects[objects] = self.store.put_prefixes(data)
         else:
             raise ValueError("Unknown objects: {}".format(objects))
 
     def load(self, objects):
-        if objects in self.saved_objects:
-            with open(self.get_path(objects), "rb") as f:
-                return pickle.load(f)
-        else:
+        if objects not in self.saved_objects:
             return []
+        if objects == "asns":
+            return self.store.get_asns(self.saved_objects[objects])
+        return self.store.get_prefixes(self.saved_objects[objects])
 
     @property
     def asns(self):
@@ -136,89 +130,248 @@ class IRRDBRecord(AS_SET_Bundle):
             "name": self.name,
             "descr": self.descr,
             "used_by": ", ".join(sorted(self.used_by)),
-            "asns": self.asns,
-            "prefixes": self.prefixes
+            "asns": list(self.asns),
+            "prefixes": list(self.prefixes)
         }
 
-class IRRDBConfigEnricher_WorkerThread(BaseConfigEnricherThread):
+class IRRDBTasksCosts(object):
+    """History of the cost of the IRRDB tasks.
 
-    TARGET_FIELD = None
+    For each task (origin ASNs or IPv4/IPv6 prefixes of a bundle)
+    the time needed to fetch its data and the size of the result are
+    kept in the cache, so that the next time the most expensive tasks
+    can be scheduled first.
+    """
 
-    def __init__(self, *args, **kwargs):
-        BaseConfigEnricherThread.__init__(self, *args, **kwargs)
+    CACHE_KEY = "irrdb_tasks_costs.json"
 
-        self.ip_ver = None
-        self.irrdbtools_cfg = None
+    # Tasks not seen for longer than this are forgotten.
+    MAX_AGE = 30 * 86400
 
-    def do_task(self, task):
-        irrdb_record = task
-        used_by_descr = ", ".join(irrdb_record.used_by)
-        data = self._get_external_data(used_by_descr, irrdb_record.object_names)
-        return data
+    def __init__(self, cache_backend):
+        self.cache_backend = cache_backend
 
-    def save_data(self, task, data):
-        irrdb_record = task
-        irrdb_record.save(self.TARGET_FIELD, data)
+        self.lock = threading.Lock()
 
-class IRRDBConfigEnricher_WorkerThread_Prefixes(IRRDBConfigEnricher_WorkerThread):
+        # { "<task_key>": { "duration": <secs>, "size": <n>, "ts": <ts> } }
+        self.costs = {}
 
-    DESCR = "IRRdb prefixes"
-    TARGET_FIELD = "prefixes"
+    @staticmethod
+    def get_key(irrdb_record, target_field, ip_ver):
+        if target_field == "asns":
+            return "{}:asns".format(irrdb_record.id)
+        return "{}:prefixes{}".format(irrdb_record.id, ip_ver)
 
-    def _get_external_data(self, used_by_descr, as_set_names):
-        errors = False
-        ip_versions = [self.ip_ver] if self.ip_ver else [4, 6]
-        res = []
-        for ip_ver in ip_versions:
-            obj = RSet(as_set_names, ip_ver, **self.irrdbtools_cfg)
+    def load(self):
+        try:
+            entry = self.cache_backend.load(self.CACHE_KEY)
+        except ARouteServerError as e:
+            logging.warning("Can't load the history of the IRRDB tasks "
+                            "costs: {}".format(str(e)))
+            return
+
+        if not entry:
+            return
+
+        now = time.time()
+        self.costs = {
+            key: cost
+            for key, cost in entry["data"].items()
+            if now - cost["ts"] <= self.MAX_AGE
+        }
+
+    def save(self):
+        with self.lock:
+            entry = {"ts": int(time.time()), "data": self.costs}
             try:
-                obj.load_data()
-                prefixes = obj.prefixes
-                if not prefixes:
-                    logging.warning("No IPv{} prefixes found in "
-                                    "{} for {}".format(
-                                        ip_ver, obj.descr, used_by_descr))
-                res.extend(prefixes)
+                self.cache_backend.save(self.CACHE_KEY, entry)
             except ARouteServerError as e:
-                errors = True
-                logging.error(
-                    "Error while retrieving IPv{} prefixes "
-                    "from {} for {}: {}".format(
-                        ip_ver, obj.descr, used_by_descr, str(e)
-                    )
-                )
+                logging.warning("Can't save the history of the IRRDB tasks "
+                                "costs: {}".format(str(e)))
+
+    def update(self, key, size, duration=None):
+        """The duration is None when the data is not fetched
+        (it was in the cache): only the size is updated then."""
+        with self.lock:
+            cost = self.costs.setdefault(key, {"duration": None})
+            cost["size"] = size
+            cost["ts"] = int(time.time())
+            if duration is not None:
+                cost["duration"] = round(duration, 3)
+
+    @staticmethod
+    def _get_kind(key):
+        """"asns", "prefixes4" or "prefixes6"."""
+        return key.rpartition(":")[2]
+
+    def _get_rates(self):
+        """Seconds per item of the result, for each kind of task and
+        for all of them (None), from the tasks with a known cost."""
+        totals = {}
+        for key, cost in self.costs.items():
+            if cost["duration"] is None or not cost.get("size"):
+                continue
+            for kind in (self._get_kind(key), None):
+                total = totals.setdefault(kind, [0, 0])
+                total[0] += cost["duration"]
+                total[1] += cost["size"]
+
+        return {kind: duration / size
+                for kind, (duration, size) in totals.items()}
+
+    def get_durations(self, keys):
+        """Expected duration of the given tasks.
+
+        Tasks never fetched before, whose result size is known because
+        it was in the cache, are expected to last in proportion to it,
+        at the rate of the known tasks of the same kind. Tasks never
+        seen before are expected to last as much as the average of the
+        known ones.
+        """
+        with self.lock:
+            rates = self._get_rates()
+            costs = {key: dict(self.costs[key])
+                     for key in keys if key in self.costs}
+
+        durations = {
+            key: cost["duration"]
+            for key, cost in costs.items()
+            if cost["duration"] is not None
+        }
+
+        if durations:
+            default = sum(durations.values()) / len(durations)
+        else:
+            default = 0
 
-        if errors:
-            raise BuilderError()
+        res = {}
+        for key in keys:
+            if key in durations:
+                res[key] = durations[key]
+                continue
 
+            size = costs.get(key, {}).get("size")
+            rate = rates.get(self._get_kind(key), rates.get(None))
+            if size is not None and rate is not None:
+                res[key] = size * rate
+            else:
+                res[key] = default
         return res
 
-class IRRDBConfigEnricher_WorkerThread_ASNs(IRRDBConfigEnricher_WorkerThread):
+class IRRDBConfigEnricher_WorkerThread(BaseConfigEnricherThread):
+
+    def __init__(self, *args, **kwargs):
+        BaseConfigEnricherThread.__init__(self, *args, **kwargs)
+
+        self.ip_ver = None
+        self.irrdbtools_cfg = None
+
+    def _get_prefixes(self, used_by_descr, as_set_names, ip_ver):
+        """Returns the RSet object, once its data is loaded."""
+        obj = RSet(as_set_names, ip_ver, **self.irrdbtools_cfg)
+        try:
+            obj.load_data()
+            if not obj.prefixes:
+                logging.warning("No IPv{} prefixes found in "
+                                "{} for {}".format(
+                                    ip_ver, obj.descr, used_by_descr))
+            return obj
+        except ARouteServerError as e:
+            logging.error(
+                "Error while retrieving IPv{} prefixes "
+                "from {} for {}: {}".format(
+                    ip_ver, obj.descr, used_by_descr, str(e)
+                )
+            )
 
-    DESCR = "IRRdb origin ASNs"
-    TARGET_FIELD = "asns"
+        raise BuilderError()
 
-    def _get_external_data(self, used_by_descr, as_set_name):
-        errors = False
+    def _get_asns(self, used_by_descr, as_set_name):
+        """Returns the ASSet object, once its data is loaded."""
         obj = ASSet(as_set_name, **self.irrdbtools_cfg)
         try:
             obj.load_data()
-            asns = obj.asns
-            if not asns:
+            if not obj.asns:
                 logging.warning("No origin ASNs found in "
                                 "{} for {}".format(
                                     obj.descr, used_by_descr))
-            return asns
+            return obj
         except ARouteServerError as e:
-            errors = True
             logging.error(
                 "Error while retrieving origin ASNs from {} for {}: {}".format(
                     obj.descr, used_by_descr, str(e)
                 )
             )
 
-        if errors:
-            raise BuilderError()
+        raise BuilderError()
+
+class IRRDBConfigEnricher_WorkerThread_Combined(IRRDBConfigEnricher_WorkerThread):
+    """Each task is (<record>, "asns"|"prefixes", <ip_ver>).
+
+    Origin ASNs are saved as soon as they are fetched; prefixes are
+    saved once all the IP versions of the record have been fetched.
+    """
+
+    DESCR = "IRRdb origin ASNs and prefixes"
+
+    def __init__(self, *args, **kwargs):
+        IRRDBConfigEnricher_WorkerThread.__init__(self, *args, **kwargs)
+
+        # Shared by all the threads:
+        # { "<record_id>": { <ip_ver>: [<prefix>, ...] } }
+        self.fetched_prefixes = None
+        self.tasks_costs = None
+
+    def do_task(self, task):
+        irrdb_record, target_field, ip_ver = task
+        used_by_descr = ", ".join(irrdb_record.used_by)
+
+        start_time = time.time()
+
+        if target_field == "asns":
+            obj = self._get_asns(used_by_descr, irrdb_record.object_names)
+            res = obj.asns
+            size = len(obj.asns)
+        else:
+            obj = self._get_prefixes(used_by_descr,
+                                     irrdb_record.object_names, ip_ver)
+            # Always returned, also when no prefixes are found, to keep
+            # track of the IP versions completed for the record.
+            res = {"ip_ver": ip_ver, "prefixes": obj.prefixes}
+            size = len(obj.prefixes)
+
+        # The duration is meaningful only when data is actually fetched.
+        self.tasks_costs.update(
+            IRRDBTasksCosts.get_key(*task), size,
+            None if obj.from_cache else time.time() - start_time
+        )
+
+        return res
+
+    def save_data(self, task, data):
+        irrdb_record, target_field, _ = task
+
+        if target_field == "asns":
+            irrdb_record.save("asns", data)
+            return
+
+        fetched = self.fetched_prefixes[irrdb_record.id]
+        fetched[data["ip_ver"]] = data["prefixes"]
+
+        if len(fetched) < len(self.ip_versions):
+            return
+
+        del self.fetched_prefixes[irrdb_record.id]
+
+        prefixes = []
+        for ip_ver in self.ip_versions:
+            prefixes.extend(fetched[ip_ver])
+        if prefixes:
+            irrdb_record.save("prefixes", prefixes)
+
+    @property
+    def ip_versions(self):
+        return [self.ip_ver] if self.ip_ver else [4, 6]
 
 class IRRDBConfigEnricher(BaseConfigEnricher):
 
@@ -227,8 +380,7 @@ class IRRDBConfigEnricher(BaseConfigEnricher):
     WHITE_LIST_OBJECT_NAME_PREFIX = "WHITE_LIST_"
 
     def prepare(self):
-        # Create and populate the IRRDB() instances only once
-        # (two IRR enrichers are used, but only the first one builds it).
+        # Create and populate the IRRDB() instances only once.
         if self.builder.irrdb_info is not None:
             return
 
@@ -240,6 +392,17 @@ class IRRDBConfigEnricher(BaseConfigEnricher):
 
         self.builder.irrdb_info = IRRDB()
 
+        if self.builder.irr_query_method == "local":
+            # Only the dumps that changed since the last run are loaded.
+            try:
+                get_rpsl_dump_index(self.builder.cache_dir).update(
+                    self.builder.irr_dumps
+                )
+            except ARouteServerError as e:
+                raise BuilderError(
+                    "Can't load the local IRR dumps: {}".format(str(e))
+                )
+
         # Add to irrdb_info all the AS-SET bundles reported in the 'clients' section.
         for client in self.builder.cfg_clients.cfg["clients"]:
             client_irrdb = client["cfg"]["filtering"]["irrdb"]
@@ -363,27 +526,58 @@ class IRRDBConfigEnricher(BaseConfigEnricher):
             "bgpq3_host": self.builder.bgpq3_host,
             "bgpq3_sources": self.builder.bgpq3_sources,
             "bgpq3_timeout": self.builder.bgpq3_timeout,
+            "irr_query_method": self.builder.irr_query_method,
             "cache_dir": self.builder.cache_dir,
             "cache_expiry": self.builder.cache_expiry,
+            "cache_backend": self.builder.cache_backend,
         }
+        thread.irrdbtools_cfg["allow_longer_prefixes"] = \
+            self.builder.cfg_general["filtering"]["irrdb"]["allow_longer_prefixes"]
 
-    def add_tasks(self):
-        target_objects = self.WORKER_THREAD_CLASS.TARGET_FIELD
-
-        # Enqueuing tasks.
-        for _, as_set_record in self.builder.irrdb_info.items():
-            if target_objects in as_set_record.requested_objects:
-                self.tasks_q.put(as_set_record)
-
-class IRRDBConfigEnricher_ASNs(IRRDBConfigEnricher):
+class IRRDBConfigEnricher_Combined(IRRDBConfigEnricher):
+    """Origin ASNs and prefixes fetched in a single pass.
 
-    WORKER_THREAD_CLASS = IRRDBConfigEnricher_WorkerThread_ASNs
+    The ASNs and the prefixes of each IP version are fetched by
+    independent tasks, all scheduled on the same pool of threads,
+    so that a slow object doesn't delay the others twice.
+    """
 
-class IRRDBConfigEnricher_Prefixes(IRRDBConfigEnricher):
+    WORKER_THREAD_CLASS = IRRDBConfigEnricher_WorkerThread_Combined
 
-    WORKER_THREAD_CLASS = IRRDBConfigEnricher_WorkerThread_Prefixes
+    def __init__(self, *args, **kwargs):
+        IRRDBConfigEnricher.__init__(self, *args, **kwargs)
+        self.fetched_prefixes = {}
+        self.tasks_costs = IRRDBTasksCosts(self.builder.cache_backend)
 
     def _config_thread(self, thread):
         IRRDBConfigEnricher._config_thread(self, thread)
-        thread.irrdbtools_cfg["allow_longer_prefixes"] = \
-            self.builder.cfg_general["filtering"]["irrdb"]["allow_longer_prefixes"]
+        thread.fetched_prefixes = self.fetched_prefixes
+        thread.tasks_costs = self.tasks_costs
+
+    def add_tasks(self):
+        ip_versions = [self.builder.ip_ver] if self.builder.ip_ver else [4, 6]
+
+        tasks = []
+        for _, as_set_record in self.builder.irrdb_info.items():
+            if "asns" in as_set_record.requested_objects:
+                tasks.append((as_set_record, "asns", None))
+            if "prefixes" in as_set_record.requested_objects:
+                self.fetched_prefixes[as_set_record.id] = {}
+                for ip_ver in ip_versions:
+                    tasks.append((as_set_record, "prefixes", ip_ver))
+
+        # Enqueuing tasks: the longest ones are processed first.
+        self.tasks_costs.load()
+        durations = self.tasks_costs.get_durations(
+            [IRRDBTasksCosts.get_key(*task) for task in tasks]
+        )
+        for task in tasks:
+            self.tasks_q.put(
+                task, cost=durations[IRRDBTasksCosts.get_key(*task)]
+            )
+
+    def enrich(self):
+        try:
+            IRRDBConfigEnricher.enrich(self)
+        finally:
+            self.tasks_costs.save()
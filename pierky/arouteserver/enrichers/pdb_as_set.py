@@ -29,13 +29,15 @@ class PeeringDBConfigEnricher_ASSet_WorkerThread(BaseConfigEnricherThread):
 
         self.cache_dir = None
         self.cache_expiry = None
+        self.cache_backend = None
 
     def do_task(self, task):
         asn, _ = task
         try:
             net = PeeringDBNet(asn,
                                cache_dir=self.cache_dir,
-                               cache_expiry=self.cache_expiry)
+                               cache_expiry=self.cache_expiry,
+                               cache_backend=self.cache_backend)
             net.load_data()
         except PeeringDBNoInfoError:
             # No data found on PeeringDB.
@@ -68,8 +70,11 @@ class PeeringDBConfigEnricher_ASSet(BaseConfigEnricher):
     def _config_thread(self, thread):
         thread.cache_dir = self.builder.cache_dir
         thread.cache_expiry = self.builder.cache_expiry
+        thread.cache_backend = self.builder.cache_backend
+
+    def get_tasks(self):
+        """Return the clients that need info from PeeringDB, by ASN."""
 
-    def add_tasks(self):
         # "<asn>": <clients>
         tasks = {}
 
@@ -99,6 +104,11 @@ class PeeringDBConfigEnricher_ASSet(BaseConfigEnricher):
                 tasks[asn] = []
             tasks[asn].append(client)
 
+        return tasks
+
+    def add_tasks(self):
+        tasks = self.get_tasks()
+
         PeeringDBNet.populate_bulk_query_cache(list(tasks.keys()))
 
         for asn in tasks:
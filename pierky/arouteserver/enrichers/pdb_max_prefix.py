@@ -33,6 +33,7 @@ class PeeringDBConfigEnricher_MaxPrefix_WorkerThread(BaseConfigEnricherThread):
         self.cfg_general = None
         self.cache_dir = None
         self.cache_expiry = None
+        self.cache_backend = None
         self.general_limits = None
 
     def do_task(self, task):
@@ -41,7 +42,8 @@ class PeeringDBConfigEnricher_MaxPrefix_WorkerThread(BaseConfigEnricherThread):
         try:
             net = PeeringDBNet(asn,
                                cache_dir=self.cache_dir,
-                               cache_expiry=self.cache_expiry)
+                               cache_expiry=self.cache_expiry,
+                               cache_backend=self.cache_backend)
             net.load_data()
 
             return net.info_prefixes4 or self.general_limits["ipv4"], \
@@ -101,12 +103,15 @@ class PeeringDBConfigEnricher_MaxPrefix(BaseConfigEnricher):
         thread.cfg_general = self.builder.cfg_general
         thread.cache_dir = self.builder.cache_dir
         thread.cache_expiry = self.builder.cache_expiry
+        thread.cache_backend = self.builder.cache_backend
         thread.general_limits = {
             "ipv4": self._get_general_limit(4),
             "ipv6": self._get_general_limit(6)
         }
 
-    def add_tasks(self):
+    def get_tasks(self):
+        """Return the clients that need info from PeeringDB, by ASN."""
+
         # "<asn>": <clients>
         tasks = {}
 
@@ -145,6 +150,11 @@ class PeeringDBConfigEnricher_MaxPrefix(BaseConfigEnricher):
                     tasks[asn] = []
                 tasks[asn].append(client)
 
+        return tasks
+
+    def add_tasks(self):
+        tasks = self.get_tasks()
+
         PeeringDBNet.populate_bulk_query_cache(list(tasks.keys()))
 
         for asn in tasks:
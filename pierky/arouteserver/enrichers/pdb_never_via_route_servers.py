@@ -29,6 +29,7 @@ class NeverViaRouteServersEnricher(BaseConfigEnricher):
             peeringdb_data = PeeringDBNetNeverViaRouteServers(
                cache_dir=self.builder.cache_dir,
                cache_expiry=self.builder.cache_expiry,
+               cache_backend=self.builder.cache_backend,
             )
             peeringdb_data.load_data()
         except PeeringDBNoInfoError:
@@ -14,11 +14,13 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
+import time
 
 from .base import BaseConfigEnricher
-from ..ipaddresses import IPNetwork
 from ..errors import BuilderError
 from ..ripe_rpki_cache import RIPE_RPKI_ROAs
+from ..roa_table import parse_roa_prefix
+from ..rtr_client import RTR_RPKI_ROAs
 
 class RPKIROAsEnricher(BaseConfigEnricher):
 
@@ -43,9 +45,31 @@ class RPKIROAsEnricher(BaseConfigEnricher):
 
         return False
 
+    def _compress_roas(self):
+        start_time = time.time()
+
+        roas_before = len(self.builder.rpki_roas)
+        if not roas_before:
+            return
+
+        removed = self.builder.rpki_roas.compress()
+
+        logging.info(
+            "RPKI ROAs compression: {} redundant ROAs out of {} removed "
+            "(-{:.1f}%) in {:.1f} seconds".format(
+                removed, roas_before, removed * 100.0 / roas_before,
+                time.time() - start_time
+            )
+        )
+
     def enrich(self):
         logging.info("Updating RPKI ROAs...")
 
+        rpki_roas_cfg = self.builder.cfg_general["rpki_roas"]
+        source = rpki_roas_cfg["source"]
+        assert source in ("ripe-rpki-validator-cache", "rtr-client"), \
+            "source is not ripe-rpki-validator-cache or rtr-client"
+
         roas_cache_expiry = self.builder.cache_expiry.get(
             RIPE_RPKI_ROAs.EXPIRY_TIME_TAG,
             self.builder.cache_expiry.get(
@@ -54,7 +78,8 @@ class RPKIROAsEnricher(BaseConfigEnricher):
             )
         )
 
-        if roas_cache_expiry > 60 * 60:
+        if source == "ripe-rpki-validator-cache" and \
+                roas_cache_expiry > 60 * 60:
             logging.warning(
                 "The cache expiry time for the JSON files used to get RPKI ROAs "
                 "is set to {} seconds, which is more than 1 hour. "
@@ -97,20 +122,31 @@ class RPKIROAsEnricher(BaseConfigEnricher):
 
         afis = [4, 6] if self.builder.ip_ver is None else [self.builder.ip_ver]
 
-        rpki_roas_cfg = self.builder.cfg_general["rpki_roas"]
-        assert rpki_roas_cfg["source"] == "ripe-rpki-validator-cache", \
-            "source is not ripe-rpki-validator-cache"
-        urls = rpki_roas_cfg["ripe_rpki_validator_url"]
-        ignore_cache_files_older_than = rpki_roas_cfg["ignore_cache_files_older_than"]
-
-        ripe_cache = RIPE_RPKI_ROAs(cache_dir=self.builder.cache_dir,
-                                    cache_expiry=self.builder.cache_expiry,
-                                    ripe_rpki_validator_url=urls,
-                                    ignore_cache_files_older_than=ignore_cache_files_older_than)
-        ripe_cache.load_data()
-        roas = ripe_cache.roas
-
-        allowed_tas = rpki_roas_cfg["allowed_trust_anchors"]
+        if source == "rtr-client":
+            rtr_client = RTR_RPKI_ROAs(cache_dir=self.builder.cache_dir,
+                                       server=rpki_roas_cfg["rtr_client_server"],
+                                       cache_backend=self.builder.cache_backend)
+            rtr_client.load_data()
+            roas = rtr_client.iter_roas()
+
+            # VRPs received via RTR have already been validated
+            # by the local cache, and they don't carry the TA.
+            allowed_tas = None
+        else:
+            urls = rpki_roas_cfg["ripe_rpki_validator_url"]
+            ignore_cache_files_older_than = rpki_roas_cfg["ignore_cache_files_older_than"]
+
+            ripe_cache = RIPE_RPKI_ROAs(cache_dir=self.builder.cache_dir,
+                                        cache_expiry=self.builder.cache_expiry,
+                                        cache_backend=self.builder.cache_backend,
+                                        ripe_rpki_validator_url=urls,
+                                        ignore_cache_files_older_than=ignore_cache_files_older_than,
+                                        fetch_mode=rpki_roas_cfg["ripe_rpki_validator_fetch_mode"],
+                                        timeout=rpki_roas_cfg["ripe_rpki_validator_timeout"])
+            ripe_cache.load_data()
+            roas = ripe_cache.roas["roas"]
+
+            allowed_tas = rpki_roas_cfg["allowed_trust_anchors"]
 
         roas_cnt = {
             "total": 0,
@@ -121,7 +157,7 @@ class RPKIROAsEnricher(BaseConfigEnricher):
                 "6": 0
             }
         }
-        for roa in roas["roas"]:
+        for roa in roas:
             roas_cnt["total"] += 1
 
             asn = int(roa["asn"][2:])
@@ -129,32 +165,28 @@ class RPKIROAsEnricher(BaseConfigEnricher):
                 roas_cnt["unused"] += 1
                 continue
 
-            ta = roa["ta"]
-            if ta not in allowed_tas:
+            if allowed_tas is not None and roa["ta"] not in allowed_tas:
                 roas_cnt["invalid_ta"] += 1
                 continue
 
-            prefix = roa["prefix"]
-
-            prefix_obj = IPNetwork(prefix)
-            if prefix_obj.version not in afis:
+            ip_ver, net, length = parse_roa_prefix(roa["prefix"])
+            if ip_ver not in afis:
                 continue
 
             max_len = int(roa["maxLength"])
 
-            roa_payload = {"prefix": prefix, "length": prefix_obj.prefixlen,
-                           "max_len": max_len, "asn": asn}
+            expires = int(roa["expires"]) if "expires" in roa else None
+
+            self.builder.rpki_roas.add(ip_ver, net, length, max_len, asn,
+                                       expires)
 
-            if "expires" in roa:
-                roa_payload["expires"] = int(roa["expires"])
+            roas_cnt["used"][str(ip_ver)] += 1
 
-            prefix_len = str(prefix_obj.prefixlen)
-            if prefix_len not in self.builder.rpki_roas:
-                self.builder.rpki_roas[prefix_len] = [roa_payload]
-            else:
-                self.builder.rpki_roas[prefix_len].append(roa_payload)
+        # ROAs are sorted once here, and not at every rendering.
+        self.builder.rpki_roas.sort()
 
-            roas_cnt["used"][str(prefix_obj.version)] += 1
+        if self.builder.compress_rpki_roas:
+            self._compress_roas()
 
         stats = "RPKI ROAs: "
         stats += "{} total".format(roas_cnt["total"])
@@ -89,6 +89,21 @@ class ExternalDataNoInfoError(ARouteServerError):
 class IRRDBToolsError(ARouteServerError):
     pass
 
+class IRRdClientError(IRRDBToolsError):
+    pass
+
+class IRRdClientTimeoutError(IRRdClientError):
+    pass
+
+class IRRdClientConnectionClosedError(IRRdClientError):
+    pass
+
+class IRRdClientQueryError(IRRdClientError):
+    pass
+
+class IRRDumpsError(IRRDBToolsError):
+    pass
+
 class PeeringDBError(ARouteServerError):
     pass
 
@@ -145,6 +160,9 @@ class IXFMemberListFromClientsMergeFileError(ARouteServerError):
 class RPKIValidatorCacheError(ARouteServerError):
     pass
 
+class RTRClientError(ARouteServerError):
+    pass
+
 class ARINWhoisDBDumpError(ARouteServerError):
     pass
 
@@ -0,0 +1,363 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import re
+import threading
+
+
+ASN_RE = re.compile("^AS([0-9]+)$")
+
+# Members that can't be expanded.
+UNEXPANDABLE_SETS = ("AS-ANY", "RS-ANY")
+
+class IRRSetsMemo(object):
+    """Members of the AS-SETs and route-sets fetched during a build.
+
+    Sets are identified by the sources used to look them up and by
+    their name. Each set is fetched only once, even when it's needed
+    by more threads at the same time; its flattened content (origin
+    ASNs and prefixes) is also kept, so that bundles that include the
+    same sets are composed by union of the results.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            # { (<sources>, <name>): [<member>, ...] }
+            self.members = {}
+
+            # { (<sources>, <name>): (<asns>, <prefixes>) }
+            self.flattened = {}
+
+            # { (<sources>, <name>): <threading.Event> }
+            self.pending = {}
+
+            self.fetched = 0
+            self.reused = 0
+
+    def reserve(self, keys):
+        """Returns (keys to fetch, events to wait for).
+
+        The caller must fetch the members of the returned keys and
+        then call release() for them, whatever the result.
+        """
+        to_fetch = []
+        to_wait = []
+        with self.lock:
+            for key in keys:
+                if key in self.members:
+                    self.reused += 1
+                elif key in self.pending:
+                    to_wait.append(self.pending[key])
+                else:
+                    self.pending[key] = threading.Event()
+                    to_fetch.append(key)
+        return to_fetch, to_wait
+
+    def release(self, keys, results=None):
+        with self.lock:
+            for idx, key in enumerate(keys):
+                if results is not None:
+                    # Missing sets (None) are stored as empty ones.
+                    self.members[key] = results[idx] or []
+                    self.fetched += 1
+                self.pending.pop(key).set()
+
+    def get_members(self, key):
+        """None if the set has not been fetched."""
+        with self.lock:
+            return self.members.get(key)
+
+    def get_flattened(self, key):
+        with self.lock:
+            return self.flattened.get(key)
+
+    def set_flattened(self, key, value):
+        with self.lock:
+            self.flattened[key] = value
+
+    def get_summary(self):
+        with self.lock:
+            return ("IRR sets: {} fetched, {} reused, {} flattened".format(
+                self.fetched, self.reused, len(self.flattened)))
+
+IRR_SETS_MEMO = IRRSetsMemo()
+
+class IRRExpander(object):
+    """Recursive expansion of AS-SETs and route-sets, member by member.
+
+    The direct members of the sets are fetched level by level, using
+    pipelined ``!i`` queries, and are kept in :data:`IRR_SETS_MEMO`,
+    so that sets shared by more bundles are fetched and flattened
+    only once per build. Sets already visited are not expanded again,
+    which also breaks loops; nesting deeper than ``max_depth`` levels
+    is ignored.
+
+    The flattened content of the nested sets is kept too, but only
+    for those whose expansion is complete: sets that lead to a loop
+    or to a level deeper than ``max_depth`` would get a partial result
+    if they were flattened starting from another point of the loop
+    or from a higher level.
+    """
+
+    MAX_DEPTH = 20
+
+    def __init__(self, client, max_depth=MAX_DEPTH, memo=IRR_SETS_MEMO):
+        self.client = client
+        self.max_depth = max_depth
+        self.memo = memo
+
+    @staticmethod
+    def parse_member(member):
+        """Returns (kind, value): kind is "asn", "prefix" or "set"."""
+        member = member.upper()
+
+        match = ASN_RE.match(member)
+        if match:
+            return "asn", int(match.group(1))
+
+        if "/" in member:
+            return "prefix", member
+
+        # Range operators applied to sets are not supported:
+        # the whole content of the set is used.
+        return "set", member.split("^")[0]
+
+    def _fetch_members(self, names, sources):
+        keys = [(sources, name) for name in names]
+
+        while True:
+            to_fetch, to_wait = self.memo.reserve(keys)
+
+            if to_fetch:
+                try:
+                    results = self.client.query(
+                        ["!i{}".format(name) for _, name in to_fetch],
+                        sources
+                    )
+                except Exception:
+                    self.memo.release(to_fetch)
+                    raise
+                self.memo.release(to_fetch, results)
+
+            for event in to_wait:
+                event.wait()
+
+            res = {}
+            for key in keys:
+                members = self.memo.get_members(key)
+                if members is None:
+                    # Another thread failed to fetch it: try again.
+                    break
+                res[key[1]] = members
+            else:
+                return res
+
+    def _flatten(self, name, sources):
+        key = (sources, name)
+        flattened = self.memo.get_flattened(key)
+        if flattened is not None:
+            return flattened
+
+        asns = set()
+        prefixes = set()
+
+        # Direct members and nested sets of each expanded set, used
+        # to flatten the nested sets too, and flattened content of
+        # the nested sets that were already in the memo.
+        direct = {}
+        nested = {}
+        known = {}
+
+        visited = set([name])
+        level = [name]
+        depth = 0
+        while level:
+            if depth == self.max_depth:
+                logging.warning(
+                    "The expansion of {} reached the maximum depth ({}): "
+                    "{} nested sets have not been expanded: {}".format(
+                        name, self.max_depth, len(level),
+                        ", ".join(sorted(level)[:5]) +
+                        (", ..." if len(level) > 5 else "")
+                    )
+                )
+                break
+            depth += 1
+
+            members = self._fetch_members(level, sources)
+
+            next_level = []
+            for set_name in level:
+                direct_asns = set()
+                direct_prefixes = set()
+                direct[set_name] = (direct_asns, direct_prefixes)
+                nested[set_name] = []
+
+                for member in members[set_name]:
+                    kind, value = self.parse_member(member)
+
+                    if kind == "asn":
+                        asns.add(value)
+                        direct_asns.add(value)
+                        continue
+
+                    if kind == "prefix":
+                        prefixes.add(value)
+                        direct_prefixes.add(value)
+                        continue
+
+                    if value in UNEXPANDABLE_SETS:
+                        continue
+                    nested[set_name].append(value)
+
+                    if value in visited:
+                        continue
+                    visited.add(value)
+
+                    flattened = self.memo.get_flattened((sources, value))
+                    if flattened is not None:
+                        known[value] = flattened
+                        asns.update(flattened[0])
+                        prefixes.update(flattened[1])
+                        continue
+
+                    next_level.append(value)
+
+            level = next_level
+
+        self._set_nested_flattened(name, sources, direct, nested, known)
+
+        flattened = (frozenset(asns), frozenset(prefixes))
+        self.memo.set_flattened(key, flattened)
+        return flattened
+
+    def _set_nested_flattened(self, name, sources, direct, nested, known):
+        """Keep the flattened content of the nested sets of 'name'.
+
+        The graph of the sets is walked depth-first; a set is complete
+        when it doesn't lead back to a set that is still being walked
+        (a loop), nor to a set that has not been expanded (because of
+        the maximum depth), nor to an incomplete set.
+        """
+        # { <name>: (<asns>, <prefixes>) or None if incomplete }
+        done = dict(known)
+
+        # [ [<name>, <iterator of nested sets>, <complete>] ]
+        stack = [[name, iter(nested[name]), True]]
+        walking = set([name])
+
+        while stack:
+            frame = stack[-1]
+            set_name, nested_sets, _ = frame
+
+            for nested_set in nested_sets:
+                if nested_set in walking:
+                    frame[2] = False
+                elif nested_set in done:
+                    # Already flattened, maybe before this expansion.
+                    if done[nested_set] is None:
+                        frame[2] = False
+                elif nested_set not in direct:
+                    # Not expanded because of the maximum depth.
+                    frame[2] = False
+                else:
+                    stack.append([nested_set, iter(nested[nested_set]),
+                                  True])
+                    walking.add(nested_set)
+                    break
+            else:
+                stack.pop()
+                walking.remove(set_name)
+
+                if not frame[2]:
+                    done[set_name] = None
+                    if stack:
+                        stack[-1][2] = False
+                    continue
+
+                asns = set(direct[set_name][0])
+                prefixes = set(direct[set_name][1])
+                for nested_set in nested[set_name]:
+                    asns.update(done[nested_set][0])
+                    prefixes.update(done[nested_set][1])
+                flattened = (frozenset(asns), frozenset(prefixes))
+                done[set_name] = flattened
+
+                # The root set is kept by the caller.
+                if set_name != name:
+                    self.memo.set_flattened((sources, set_name), flattened)
+
+    def expand(self, names, sources):
+        """Returns (asns, prefixes) of the given objects."""
+        asns = set()
+        prefixes = set()
+
+        for name in names:
+            kind, value = self.parse_member(name)
+
+            if kind == "asn":
+                asns.add(value)
+            elif kind == "prefix":
+                prefixes.add(value)
+            elif value not in UNEXPANDABLE_SETS:
+                flattened = self._flatten(value, sources)
+                asns.update(flattened[0])
+                prefixes.update(flattened[1])
+
+        return asns, prefixes
+
+    def get_objects(self, names, sources):
+        """Returns (sets, asns): names of the sets the given objects
+        are expanded from, including those not found, and the ASNs
+        they contain."""
+        sets = set()
+        asns = set()
+
+        level = []
+        for name in names:
+            kind, value = self.parse_member(name)
+            if kind == "asn":
+                asns.add(value)
+            elif kind == "set" and value not in UNEXPANDABLE_SETS and \
+                    value not in sets:
+                sets.add(value)
+                level.append(value)
+
+        depth = 0
+        while level and depth < self.max_depth:
+            depth += 1
+
+            members = self._fetch_members(level, sources)
+
+            next_level = []
+            for set_name in level:
+                for member in members[set_name]:
+                    kind, value = self.parse_member(member)
+
+                    if kind == "asn":
+                        asns.add(value)
+                    elif kind == "set" and value not in UNEXPANDABLE_SETS \
+                            and value not in sets:
+                        sets.add(value)
+                        next_level.append(value)
+
+            level = next_level
+
+        return sets, asns
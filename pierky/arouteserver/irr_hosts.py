@@ -0,0 +1,213 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import deque
+import threading
+import time
+
+
+class IRRHostStats(object):
+
+    def __init__(self):
+        # Durations of the last successful queries.
+        self.latencies = deque(maxlen=IRRHostsHealth.SAMPLES)
+
+        # The same, for each kind of query (see record_success).
+        self.kind_latencies = {}
+
+        # Outcome (True = success) of the last queries.
+        self.outcomes = deque(maxlen=IRRHostsHealth.SAMPLES)
+
+        # Time until which the host is not used, after a timeout.
+        self.excluded_until = None
+        self.backoff = 0
+
+    def get_percentile(self, percentile, kind=None):
+        if kind is None:
+            latencies = self.latencies
+        else:
+            latencies = self.kind_latencies.get(kind)
+        if not latencies:
+            return None
+        latencies = sorted(latencies)
+        idx = int(round(percentile / 100.0 * (len(latencies) - 1)))
+        return latencies[idx]
+
+    @property
+    def error_rate(self):
+        if not self.outcomes:
+            return 0
+        return self.outcomes.count(False) / float(len(self.outcomes))
+
+class IRRHostsHealth(object):
+    """Health of the IRRD hosts, shared by all the IRR queries.
+
+    Latency and outcome of the recent queries are tracked for each
+    host, so that the fastest healthy hosts are used first.
+
+    It can be used as the set of the hosts that timed out: hosts
+    added to it are not used (``host in ...`` is True) until a backoff
+    period expires; then, they are probed again by the next query,
+    and excluded again, for twice the time, if they still time out.
+
+    Slow queries can be hedged (sent to another host too); only a
+    small share of the queries sent since the object was created (or
+    cleared) is hedged, so that the load on the hosts stays the same.
+    """
+
+    # N. of queries used to work out latency and error rate.
+    SAMPLES = 50
+
+    # Hosts whose error rate is higher than this are used last.
+    MAX_ERROR_RATE = 0.5
+
+    # Min n. of successful queries needed to hedge the queries.
+    MIN_HEDGING_SAMPLES = 10
+
+    # Queries are never hedged before this time.
+    MIN_HEDGING_DELAY = 1
+
+    # Max share of the queries that can be hedged.
+    MAX_HEDGED_QUERIES = 0.05
+
+    BACKOFF_MIN = 300
+    BACKOFF_MAX = 3600
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+        self.queries_cnt = 0
+        self.hedged_queries_cnt = 0
+
+    def _get_stats(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = IRRHostStats()
+        return self.hosts[host]
+
+    def clear(self):
+        with self.lock:
+            self.hosts = {}
+            self.queries_cnt = 0
+            self.hedged_queries_cnt = 0
+
+    def __contains__(self, host):
+        """True if the host is excluded."""
+        with self.lock:
+            stats = self.hosts.get(host)
+            if not stats or stats.excluded_until is None:
+                return False
+            return time.time() < stats.excluded_until
+
+    def add(self, host):
+        """Exclude the host, because a query timed out."""
+        with self.lock:
+            stats = self._get_stats(host)
+            stats.outcomes.append(False)
+            self.queries_cnt += 1
+
+            now = time.time()
+            if stats.excluded_until is not None and \
+                    now < stats.excluded_until:
+                # Already excluded by another query.
+                return
+
+            stats.backoff = min(max(stats.backoff * 2, self.BACKOFF_MIN),
+                                self.BACKOFF_MAX)
+            stats.excluded_until = now + stats.backoff
+
+    def get_backoff(self, host):
+        with self.lock:
+            return self._get_stats(host).backoff
+
+    def record_success(self, host, latency, kind=None):
+        """Record a successful query.
+
+        The kind of the query (for example, "asns" or "prefixes4")
+        is used to work out the hedging delay on the basis of the
+        latency of similar queries.
+        """
+        with self.lock:
+            stats = self._get_stats(host)
+            stats.latencies.append(latency)
+            stats.outcomes.append(True)
+            self.queries_cnt += 1
+
+            if kind is not None:
+                if kind not in stats.kind_latencies:
+                    stats.kind_latencies[kind] = deque(maxlen=self.SAMPLES)
+                stats.kind_latencies[kind].append(latency)
+
+            # A host that answers after its backoff period is back.
+            stats.excluded_until = None
+            stats.backoff = 0
+
+    def record_error(self, host):
+        with self.lock:
+            self._get_stats(host).outcomes.append(False)
+            self.queries_cnt += 1
+
+    def sort_hosts(self, hosts):
+        """The hosts that are not excluded, healthiest first.
+
+        Hosts that have not been used yet are tried after the healthy
+        ones, but before those with too many errors; the configured
+        order is kept for the hosts with the same score.
+        """
+        hosts = [host for host in hosts if host not in self]
+
+        with self.lock:
+            def get_score(idx_host):
+                idx, host = idx_host
+                stats = self.hosts.get(host)
+                if not stats:
+                    return (False, True, 0, idx)
+                return (stats.error_rate > self.MAX_ERROR_RATE,
+                        False,
+                        stats.get_percentile(50) or 0,
+                        idx)
+
+            return [host for _, host in sorted(enumerate(hosts),
+                                               key=get_score)]
+
+    def get_hedging_delay(self, host, kind=None):
+        """Time after which a query is hedged, or None.
+
+        It's the p95 latency of the queries of the same kind.
+        """
+        with self.lock:
+            stats = self.hosts.get(host)
+            if not stats:
+                return None
+            if kind is None:
+                latencies = stats.latencies
+            else:
+                latencies = stats.kind_latencies.get(kind, ())
+            if len(latencies) < self.MIN_HEDGING_SAMPLES:
+                return None
+            return max(stats.get_percentile(95, kind),
+                       self.MIN_HEDGING_DELAY)
+
+    def start_hedging(self):
+        """True if one more query can be hedged.
+
+        It must be called before sending the hedged query.
+        """
+        with self.lock:
+            max_hedged = max(1, self.queries_cnt * self.MAX_HEDGED_QUERIES)
+            if self.hedged_queries_cnt + 1 > max_hedged:
+                return False
+            self.hedged_queries_cnt += 1
+            return True
@@ -0,0 +1,357 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import socket
+import threading
+import time
+
+from .errors import IRRdClientError, IRRdClientTimeoutError, \
+                    IRRdClientConnectionClosedError, IRRdClientQueryError
+from .irr_expander import IRRExpander, IRR_SETS_MEMO
+from .prefix_tree import PrefixTree
+from .version import __version__
+
+
+IRRD_DEFAULT_PORT = 43
+
+def parse_irrd_host(host):
+    """Split 'host[:port]' (or '[ipv6]:port') into (host, port)."""
+    if host.startswith("["):
+        addr, _, port = host[1:].partition("]")
+        port = port.lstrip(":")
+        return addr, int(port) if port else IRRD_DEFAULT_PORT
+    if host.count(":") == 1:
+        addr, port = host.split(":")
+        return addr, int(port)
+    return host, IRRD_DEFAULT_PORT
+
+def is_valid_asn(asn):
+    """False for the ASNs that bgpq4 skips by default (no *-p*).
+
+    Private, reserved and documentation ASNs, AS0 and AS_TRANS.
+    """
+    if asn == 0 or asn == 23456:
+        return False
+    if 64496 <= asn <= 131071:
+        return False
+    if asn >= 4200000000:
+        return False
+    return True
+
+class IRRdConnection(object):
+    """Persistent connection to an IRRd server.
+
+    The connection is put in multiple-commands mode (``!!``) so that
+    it can be used for any number of queries; queries are pipelined:
+    a window of them is sent at once, then the responses are read
+    in the same order.
+    """
+
+    PIPELINE_WINDOW = 100
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        self.sources = None
+        self.last_used = time.time()
+
+        try:
+            self.sock = socket.create_connection((host, port),
+                                                 timeout=timeout)
+        except socket.timeout:
+            raise IRRdClientTimeoutError(
+                "timeout while connecting to {}".format(self.descr)
+            )
+        except OSError as e:
+            raise IRRdClientError(
+                "can't connect to {}: {}".format(self.descr, str(e))
+            )
+        self.rfile = self.sock.makefile("rb")
+
+        # Multiple-commands mode (no response), then client
+        # identification, that not all the servers support.
+        try:
+            self.query(["!!", "!nARouteServer-{}".format(__version__)],
+                       expect_response=[False, True])
+        except IRRdClientQueryError:
+            pass
+        except Exception:
+            self.close()
+            raise
+
+    @property
+    def descr(self):
+        return "{}:{}".format(self.host, self.port)
+
+    def close(self):
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+    def _read_line(self):
+        line = self.rfile.readline()
+        if not line:
+            raise IRRdClientConnectionClosedError(
+                "connection closed by {}".format(self.descr)
+            )
+        return line.rstrip(b"\r\n")
+
+    def _read_response(self, query):
+        """Read the response to the given query.
+
+        Returns the list of the items returned by the server,
+        or None if the key was not found.
+        Returns an exception instance if the server returned an
+        error: the connection can still be used.
+        """
+        line = self._read_line()
+        code = line[:1]
+
+        if code == b"A":
+            try:
+                length = int(line[1:])
+            except ValueError:
+                raise IRRdClientError(
+                    "invalid response from {}: {}".format(
+                        self.descr, line.decode("utf-8", "replace")
+                    )
+                )
+            data = self.rfile.read(length)
+            if len(data) < length:
+                raise IRRdClientConnectionClosedError(
+                    "connection closed by {}".format(self.descr)
+                )
+            line = self._read_line()
+            if line != b"C":
+                raise IRRdClientError(
+                    "invalid response from {}: {}".format(
+                        self.descr, line.decode("utf-8", "replace")
+                    )
+                )
+            return data.decode("utf-8", "replace").split()
+
+        if code == b"C":
+            return []
+
+        if code == b"D":
+            return None
+
+        if code == b"E":
+            # Multiple copies of the key.
+            return []
+
+        if code == b"F":
+            return IRRdClientQueryError(
+                "error returned by {} for '{}': {}".format(
+                    self.descr, query,
+                    line[1:].decode("utf-8", "replace").strip()
+                )
+            )
+
+        raise IRRdClientError(
+            "invalid response from {}: {}".format(
+                self.descr, line.decode("utf-8", "replace")
+            )
+        )
+
+    def query(self, queries, expect_response=None):
+        results = []
+        error = None
+
+        try:
+            for start in range(0, len(queries), self.PIPELINE_WINDOW):
+                window = queries[start:start + self.PIPELINE_WINDOW]
+
+                self.sock.sendall(
+                    "".join(query + "\n" for query in window).encode("utf-8")
+                )
+
+                for idx, query in enumerate(window):
+                    if expect_response and not expect_response[start + idx]:
+                        continue
+                    res = self._read_response(query)
+                    if isinstance(res, IRRdClientQueryError):
+                        error = error or res
+                        res = None
+                    results.append(res)
+        except socket.timeout:
+            raise IRRdClientTimeoutError(
+                "timeout while waiting for the response from {}".format(
+                    self.descr
+                )
+            )
+        except ConnectionError as e:
+            raise IRRdClientConnectionClosedError(
+                "connection to {} closed: {}".format(self.descr, str(e))
+            )
+        except OSError as e:
+            raise IRRdClientError(
+                "error while querying {}: {}".format(self.descr, str(e))
+            )
+        finally:
+            self.last_used = time.time()
+
+        if error:
+            raise error
+
+        return results
+
+    def set_sources(self, sources):
+        if sources == self.sources:
+            return
+        self.query(["!s{}".format(sources)])
+        self.sources = sources
+
+class IRRdConnectionPool(object):
+    """Small pool of persistent connections to an IRRd server."""
+
+    MAX_CONNECTIONS = 4
+
+    # Connections idle for longer than this are not reused,
+    # since they could have been closed by the server.
+    MAX_IDLE_TIME = 30
+
+    def __init__(self, host, timeout, max_connections=MAX_CONNECTIONS):
+        self.host, self.port = parse_irrd_host(host)
+        self.timeout = timeout
+
+        self.lock = threading.Lock()
+        self.semaphore = threading.BoundedSemaphore(max_connections)
+        self.idle = []
+
+    def get(self):
+        """Returns (connection, reused)."""
+        self.semaphore.acquire()
+        try:
+            with self.lock:
+                while self.idle:
+                    conn = self.idle.pop()
+                    if time.time() - conn.last_used < self.MAX_IDLE_TIME:
+                        return conn, True
+                    conn.close()
+
+            return IRRdConnection(self.host, self.port, self.timeout), False
+        except Exception:
+            self.semaphore.release()
+            raise
+
+    def put(self, conn):
+        with self.lock:
+            self.idle.append(conn)
+        self.semaphore.release()
+
+    def discard(self, conn):
+        conn.close()
+        self.semaphore.release()
+
+    def close(self):
+        with self.lock:
+            for conn in self.idle:
+                conn.close()
+            self.idle = []
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_irrd_connection_pool(host, timeout):
+    """Pools are shared by all the objects that query the same host."""
+    with _pools_lock:
+        key = (host, timeout)
+        if key not in _pools:
+            _pools[key] = IRRdConnectionPool(host, timeout)
+        return _pools[key]
+
+def close_irrd_connection_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+class IRRdClient(object):
+    """IRRd whois client, used in place of bgpq4.
+
+    It returns the same data that bgpq4 would return for the
+    same objects: origin ASNs of AS-SETs and prefixes of AS-SETs
+    and route-sets (``!g``, ``!6``), aggregated using the same logic
+    of bgpq4. Sets are expanded by :class:`IRRExpander`.
+    """
+
+    def __init__(self, host, timeout, memo=IRR_SETS_MEMO):
+        self.pool = get_irrd_connection_pool(host, timeout)
+        self.memo = memo
+
+    def query(self, queries, sources):
+        while True:
+            conn, reused = self.pool.get()
+            try:
+                conn.set_sources(sources)
+                res = conn.query(queries)
+            except IRRdClientQueryError:
+                # Errors returned by the server for a query
+                # don't invalidate the connection.
+                self.pool.put(conn)
+                raise
+            except IRRdClientConnectionClosedError:
+                self.pool.discard(conn)
+                if reused:
+                    # The server closed a connection that was idle
+                    # in the pool: try again using a new one.
+                    continue
+                raise
+            except Exception:
+                self.pool.discard(conn)
+                raise
+
+            self.pool.put(conn)
+            return res
+
+    def _expand(self, names, sources):
+        """Returns (asns, prefixes) of the given objects."""
+        asns, prefixes = IRRExpander(self, memo=self.memo).expand(names,
+                                                                  sources)
+        return set(asn for asn in asns if is_valid_asn(asn)), prefixes
+
+    def get_asns(self, names, sources):
+        """Origin ASNs of the given objects, as bgpq4 -f 1 -l asn_list."""
+        asns, _ = self._expand(names, sources)
+        return {"asn_list": sorted(asns)}
+
+    def get_prefixes(self, names, ip_ver, sources, refine=None):
+        """Prefixes of the given objects, as bgpq4 -A -l prefix_list."""
+        asns, prefixes = self._expand(names, sources)
+
+        query = "!g" if ip_ver == 4 else "!6"
+        queries = ["{}AS{}".format(query, asn) for asn in sorted(asns)]
+        if queries:
+            for origin_prefixes in self.query(queries, sources):
+                prefixes.update(origin_prefixes or [])
+
+        tree = PrefixTree(ip_ver)
+        for prefix in prefixes:
+            try:
+                tree.add(prefix)
+            except ValueError:
+                # Invalid prefixes are skipped by bgpq4 too.
+                continue
+
+        if refine:
+            tree.refine(refine)
+        tree.aggregate()
+
+        return {"prefix_list": tree.to_prefix_list()}
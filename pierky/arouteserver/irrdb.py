@@ -13,19 +13,61 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import concurrent.futures
 import hashlib
 import json
 import logging
 import re
+import socket
 import subprocess
+import threading
+import time
 
-from .cached_objects import CachedObject
+from .cached_objects import CachedObject, CachedDataNotModified
 from .config.validators import ValidatorPrefixListEntry
-from .errors import IRRDBToolsError
+from .errors import IRRDBToolsError, IRRdClientTimeoutError, IRRDumpsError
 from .ipaddresses import IPNetwork
+from .irr_expander import IRRExpander, IRRSetsMemo
+from .irr_hosts import IRRHostsHealth
+from .irrd_client import IRRdClient
+from .rpsl_index import RPSLDumpClient, get_rpsl_dump_index
 
 
-TIMEDOUT_IRR_HOSTS = set()
+# Hosts that timed out are excluded for a while; latency and error
+# rate of the hosts are also tracked here, to use the healthiest first.
+TIMEDOUT_IRR_HOSTS = IRRHostsHealth()
+
+# Used to run the queries that are hedged, and the original ones,
+# which are sent to a host each.
+HEDGING_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=32)
+
+# The query that is being run by the current thread.
+_RUNNING_QUERY = threading.local()
+
+
+class RunningIRRQuery(object):
+    """A query that can be cancelled by another thread.
+
+    The bgpq3/bgpq4 process started to run it is killed when the
+    query is cancelled.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.proc = None
+        self.cancelled = False
+
+    def set_process(self, proc):
+        with self.lock:
+            self.proc = proc
+            if self.cancelled:
+                proc.kill()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.proc is not None and self.proc.poll() is None:
+                self.proc.kill()
 
 
 class AS_SET_Bundle(object):
@@ -121,6 +163,15 @@ class IRRDBInfo(CachedObject, AS_SET_Bundle):
     BGPQ3_DEFAULT_TIMEOUT = 120
     EXPIRY_TIME_TAG = "irr_as_sets"
 
+    # How IRR objects are expanded:
+    # - bgpq: by running bgpq4/bgpq3 (bgpq3_path);
+    # - native: by querying the IRRd servers directly, over
+    #   persistent connections shared by all the objects;
+    # - local: by using the index of the local RPSL dumps
+    #   (irr_dumps), without querying any server.
+    IRR_QUERY_METHODS = ("bgpq", "native", "local")
+    IRR_QUERY_METHOD_DEFAULT = "bgpq"
+
     def __init__(self, object_names, *args, **kwargs):
         assert isinstance(object_names, list)
 
@@ -130,6 +181,15 @@ class IRRDBInfo(CachedObject, AS_SET_Bundle):
         self.bgpq3_sources = kwargs.get("bgpq3_sources",
                                         self.BGPQ3_DEFAULT_SOURCES)
         self.bgpq3_timeout = kwargs.get("bgpq3_timeout", self.BGPQ3_DEFAULT_TIMEOUT)
+        self.irr_query_method = kwargs.get("irr_query_method") or \
+            self.IRR_QUERY_METHOD_DEFAULT
+
+        if self.irr_query_method not in self.IRR_QUERY_METHODS:
+            raise IRRDBToolsError(
+                "Unknown IRR query method: '{}'; it must be one of {}.".format(
+                    self.irr_query_method, ", ".join(self.IRR_QUERY_METHODS)
+                )
+            )
 
         self.bgpq = "bgpq4" if "bgpq4" in self.bgpq3_path else "bgpq3"
 
@@ -155,6 +215,10 @@ class IRRDBInfo(CachedObject, AS_SET_Bundle):
                                 stdout=subprocess.PIPE,
                                 stderr=subprocess.PIPE)
 
+        query = getattr(_RUNNING_QUERY, "query", None)
+        if query is not None:
+            query.set_process(proc)
+
         try:
             out, err = proc.communicate(timeout=self.bgpq3_timeout)
         except subprocess.TimeoutExpired:
@@ -192,12 +256,212 @@ class IRRDBInfo(CachedObject, AS_SET_Bundle):
 
         return out
 
+    def _query_irrd(self, client):
+        """Same data returned by bgpq4 for the arguments of _run_query."""
+        raise NotImplementedError()
+
+    def _get_irr_markers(self, client, generation):
+        """Objects of the local IRR dumps index from which the bundle
+        has been expanded, along with the generation of the index at
+        that time; used by _check_if_modified() to tell whether any of
+        them changed since then. None if they are not available.
+        """
+        try:
+            sets, asns = IRRExpander(client, memo=client.memo).get_objects(
+                self._get_bgpq3_names(), self._get_bgpq3_sources()
+            )
+        except Exception as e:
+            logging.debug("Can't get the IRR markers for {}: {}".format(
+                self.descr, str(e)))
+            return None
+
+        return {
+            "method": "local",
+            "names": self._get_bgpq3_names(),
+            "sources": self._get_bgpq3_sources(),
+            "generation": generation,
+            "sets": sorted(sets),
+            "origins": self._get_irr_markers_origins(asns)
+        }
+
+    def _get_irr_markers_origins(self, asns):
+        """Keys of the origins whose route objects are used too."""
+        return []
+
+    def _check_if_modified(self):
+        """Raise CachedDataNotModified if none of the IRR objects from
+        which the cached entry was built changed since then.
+
+        Only the local IRR dumps index keeps track of the changes of
+        each object: IRRd hosts report serials for whole sources only,
+        which change every few minutes.
+        """
+        if self.irr_query_method != "local":
+            return
+
+        cached_markers = self.cached_meta.get("irr_markers")
+        if not cached_markers or \
+                cached_markers.get("method") != "local" or \
+                "generation" not in cached_markers or \
+                cached_markers.get("names") != self._get_bgpq3_names() or \
+                cached_markers.get("sources") != self._get_bgpq3_sources():
+            return
+
+        index = get_rpsl_dump_index(self.cache_dir)
+        try:
+            generation = index.get_generation()
+            changes = index.get_changes(cached_markers["generation"])
+        except IRRDumpsError as e:
+            logging.debug("Can't check if the IRR objects of {} changed: "
+                          "{}".format(self.descr, str(e)))
+            return
+
+        if changes["set"].intersection(cached_markers["sets"]) or \
+                changes["origin"].intersection(cached_markers["origins"]):
+            return
+
+        logging.debug("IRR objects used to expand {} not changed".format(
+            self.descr))
+        self.meta["irr_markers"] = dict(cached_markers, generation=generation)
+        raise CachedDataNotModified()
+
+    def _run_local_query(self):
+        index = get_rpsl_dump_index(self.cache_dir)
+        client = RPSLDumpClient(index)
+        try:
+            # Taken before the expansion, so that changes made
+            # in the meantime are not missed next time.
+            generation = index.get_generation()
+            res = self._query_irrd(client)
+        except IRRDBToolsError:
+            raise
+        except Exception as e:
+            raise IRRDBToolsError(
+                "Error while expanding {} using the local IRR dumps: "
+                "{}".format(", ".join(self.object_names), str(e))
+            )
+
+        markers = self._get_irr_markers(client, generation)
+        if markers:
+            self.meta["irr_markers"] = markers
+        return res
+
+    def _get_cmd(self, host, args):
+        cmd = [self.bgpq3_path]
+        cmd += ["-h", host]
+        cmd += ["-S", self._get_bgpq3_sources()]
+        if "bgpq4" not in self.bgpq3_path:
+            cmd += ["-3"]
+        cmd += ["-j"]
+        cmd += args
+        return cmd
+
+    def _get_query_kind(self):
+        """Queries of the same kind have similar latencies."""
+        return None
+
+    def _query_host(self, host, args, hedge=False, query=None):
+        """Run the query using the given host.
+
+        The outcome and the duration of the query are used to keep
+        track of the health of the host, unless the query is cancelled.
+        """
+        start_time = time.time()
+        _RUNNING_QUERY.query = query
+        try:
+            if self.irr_query_method == "native":
+                client = IRRdClient(host, self.bgpq3_timeout)
+                if hedge:
+                    # Sets being fetched by the original query
+                    # must not be waited for.
+                    client.memo = IRRSetsMemo()
+                res = self._query_irrd(client)
+            else:
+                out = self._run_cmd(self._get_cmd(host, args))
+                res = json.loads(out.decode("utf-8"))
+        except (subprocess.TimeoutExpired, IRRdClientTimeoutError):
+            if query is None or not query.cancelled:
+                TIMEDOUT_IRR_HOSTS.add(host)
+            raise
+        except Exception:
+            if query is None or not query.cancelled:
+                TIMEDOUT_IRR_HOSTS.record_error(host)
+            raise
+        finally:
+            _RUNNING_QUERY.query = None
+
+        if query is None or not query.cancelled:
+            TIMEDOUT_IRR_HOSTS.record_success(host, time.time() - start_time,
+                                              self._get_query_kind())
+        return res
+
+    def _query_host_hedged(self, host, hedge_host, args):
+        """Run the query using the given host; if it takes longer
+        than the usual (p95) latency of the same kind of queries on
+        that host, the same query is also sent to hedge_host, and the
+        first result is used. The other query is cancelled."""
+        delay = None
+        if hedge_host:
+            delay = TIMEDOUT_IRR_HOSTS.get_hedging_delay(
+                host, self._get_query_kind())
+        if delay is None:
+            return self._query_host(host, args)
+
+        queries = {}
+
+        def run(host, hedge=False):
+            query = RunningIRRQuery()
+            future = HEDGING_EXECUTOR.submit(self._query_host, host, args,
+                                             hedge, query)
+            queries[future] = query
+            return future
+
+        primary = run(host)
+        try:
+            try:
+                return primary.result(timeout=delay)
+            except concurrent.futures.TimeoutError:
+                pass
+
+            if not TIMEDOUT_IRR_HOSTS.start_hedging():
+                return primary.result()
+
+            logging.info(
+                "The IRR query for {} on {} is taking longer than "
+                "{:.1f} seconds: the same query is also sent to {}".format(
+                    self.descr, host, delay, hedge_host
+                )
+            )
+            hedge = run(hedge_host, True)
+
+            pending = [primary, hedge]
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    pending.remove(future)
+                    if future.exception() is None:
+                        return future.result()
+
+            logging.warning(
+                "The IRR query for {} sent to {} failed too: {}".format(
+                    self.descr, hedge_host, str(hedge.exception())
+                )
+            )
+            raise primary.exception()
+        finally:
+            # The query that is still running, if any, is not needed.
+            for future, query in queries.items():
+                if not future.done():
+                    query.cancel()
+
     def _run_query(self, args):
-        hosts_to_use = [
-            host
-            for host in self.bgpq3_host
-            if host not in TIMEDOUT_IRR_HOSTS
-        ]
+        if self.irr_query_method == "local":
+            return self._run_local_query()
+
+        # Healthiest hosts first.
+        hosts_to_use = TIMEDOUT_IRR_HOSTS.sort_hosts(self.bgpq3_host)
 
         if not hosts_to_use:
             raise IRRDBToolsError(
@@ -205,28 +469,20 @@ class IRRDBInfo(CachedObject, AS_SET_Bundle):
                 "to use to perform the IRR queries."
             )
 
-        num_of_hosts = len(hosts_to_use)
+        while hosts_to_use:
+            host = hosts_to_use.pop(0)
 
-        attempt_n = 0
-        for host in hosts_to_use:
-            attempt_n += 1
-
-            cmd = [self.bgpq3_path]
-            cmd += ["-h", host]
-            cmd += ["-S", self._get_bgpq3_sources()]
-            if "bgpq4" not in self.bgpq3_path:
-                cmd += ["-3"]
-            cmd += ["-j"]
-            cmd += args
+            cmd = self._get_cmd(host, args)
 
             try:
-                out = self._run_cmd(cmd)
-
-                return json.loads(out.decode("utf-8"))
+                return self._query_host_hedged(
+                    host, hosts_to_use[0] if hosts_to_use else None, args
+                )
             except subprocess.TimeoutExpired:
                 err_msg = (
                     "{} timed out while running the following command: '{}' "
                     "The host {} will not be used for the next IRR queries. "
+                    "It will be probed again in {} seconds. "
                     "The timeout is {} seconds; to modify it, please "
                     "edit the program's configuration file (usually "
                     "arouteserver.yml) and change the 'bgpq3_timeout' setting."
@@ -234,19 +490,45 @@ class IRRDBInfo(CachedObject, AS_SET_Bundle):
                     self.bgpq,
                     " ".join(cmd),
                     host,
+                    TIMEDOUT_IRR_HOSTS.get_backoff(host),
                     self.bgpq3_timeout
                 )
-                TIMEDOUT_IRR_HOSTS.add(host)
-            except Exception as e:
+            except IRRdClientTimeoutError as e:
                 err_msg = (
-                    "Error while parsing {} output "
-                    "for the following command: '{}': {}".format(
-                        self.bgpq,
-                        " ".join(cmd), str(e)
-                    )
+                    "The IRRd client timed out: {}. "
+                    "The host {} will not be used for the next IRR queries. "
+                    "It will be probed again in {} seconds. "
+                    "The timeout is {} seconds; to modify it, please "
+                    "edit the program's configuration file (usually "
+                    "arouteserver.yml) and change the 'bgpq3_timeout' setting."
+                ).format(
+                    str(e),
+                    host,
+                    TIMEDOUT_IRR_HOSTS.get_backoff(host),
+                    self.bgpq3_timeout
                 )
+            except Exception as e:
+                if self.irr_query_method == "native":
+                    err_msg = (
+                        "Error while querying {} using the IRRd client: "
+                        "{}".format(host, str(e))
+                    )
+                else:
+                    err_msg = (
+                        "Error while parsing {} output "
+                        "for the following command: '{}': {}".format(
+                            self.bgpq,
+                            " ".join(cmd), str(e)
+                        )
+                    )
+
+            # A hedged query could have made the next host time out.
+            hosts_to_use = [
+                host for host in hosts_to_use
+                if host not in TIMEDOUT_IRR_HOSTS
+            ]
 
-            if attempt_n == num_of_hosts:
+            if not hosts_to_use:
                 raise IRRDBToolsError(
                     "{} - No more attempts will be performed, all the "
                     "hosts in the list failed.".format(err_msg)
@@ -282,6 +564,8 @@ class ASSet(IRRDBInfo):
             re.match("^AS[0-9]+$", object_names[0]):
             return [int(object_names[0][2:])]
 
+        self._check_if_modified()
+
         query_args = []
         query_args += ["-f", "1"]
         query_args += ["-l", "asn_list"]
@@ -298,6 +582,13 @@ class ASSet(IRRDBInfo):
 
         return data["asn_list"]
 
+    def _get_query_kind(self):
+        return "asns"
+
+    def _query_irrd(self, client):
+        return client.get_asns(self._get_bgpq3_names(),
+                               self._get_bgpq3_sources())
+
 class RSet(IRRDBInfo):
 
     def __init__(self, object_names, ip_ver, allow_longer_prefixes, **kwargs):
@@ -323,6 +614,8 @@ class RSet(IRRDBInfo):
         )
 
     def _get_data(self):
+        self._check_if_modified()
+
         query_args = []
         query_args += ["-4"] if self.ip_ver == 4 else ["-6"]
         query_args += ["-A"]
@@ -341,27 +634,129 @@ class RSet(IRRDBInfo):
                 )
             )
 
-        return [self._parse_prefix(prefix) for prefix in data["prefix_list"]]
+        return parse_prefix_list(data["prefix_list"])
 
-    def _parse_prefix(self, raw):
-        prefix = IPNetwork(raw["prefix"])
-        res = {
-            "prefix": prefix.ip,
-            "length": prefix.prefixlen,
-            "exact": raw["exact"] if "exact" in raw else False
-        }
-        if res["exact"]:
-            res["ge"] = None
-            res["le"] = None
+    def _get_query_kind(self):
+        return "prefixes{}".format(self.ip_ver)
+
+    def _get_irr_markers_origins(self, asns):
+        return ["{}:{}".format(asn, self.ip_ver) for asn in sorted(asns)]
+
+    def _query_irrd(self, client):
+        refine = None
+        if self.allow_longer_prefixes:
+            refine = 32 if self.ip_ver == 4 else 128
+
+        return client.get_prefixes(self._get_bgpq3_names(), self.ip_ver,
+                                   self._get_bgpq3_sources(), refine=refine)
+
+def parse_prefix(raw):
+    """Build a prefix list entry out of an item of the prefix_list
+    returned by bgpq4 (-A -l prefix_list)."""
+    prefix = IPNetwork(raw["prefix"])
+    res = {
+        "prefix": prefix.ip,
+        "length": prefix.prefixlen,
+        "exact": raw["exact"] if "exact" in raw else False
+    }
+    if res["exact"]:
+        res["ge"] = None
+        res["le"] = None
+    else:
+        if "greater-equal" in raw:
+            res["ge"] = raw["greater-equal"]
         else:
-            if "greater-equal" in raw:
-                res["ge"] = raw["greater-equal"]
-            else:
-                res["ge"] = None
+            res["ge"] = None
 
-            if "less-equal" in raw:
-                res["le"] = raw["less-equal"]
-            else:
-                res["le"] = None
+        if "less-equal" in raw:
+            res["le"] = raw["less-equal"]
+        else:
+            res["le"] = None
 
-        return ValidatorPrefixListEntry().validate(res)
+    return ValidatorPrefixListEntry().validate(res)
+
+def _is_canonical_uint(s):
+    return s.isascii() and s.isdigit() and (s[0] != "0" or s == "0")
+
+def _parse_prefix_fast(raw):
+    """Same of parse_prefix(), for the items already in canonical form.
+
+    Returns None for the items that can't be handled here: they must
+    be parsed (and validated) by parse_prefix().
+    """
+    prefix = raw.get("prefix")
+    if not isinstance(prefix, str):
+        return None
+
+    addr, _, length = prefix.partition("/")
+    if not _is_canonical_uint(length):
+        return None
+
+    if ":" in addr:
+        if "." in addr:
+            # IPv4-embedded IPv6 addresses are not formatted
+            # the same way everywhere.
+            return None
+        family, max_length = socket.AF_INET6, 128
+    else:
+        family, max_length = socket.AF_INET, 32
+
+    try:
+        packed = socket.inet_pton(family, addr)
+    except (OSError, ValueError):
+        return None
+
+    # Only addresses that are already in their normal form.
+    if socket.inet_ntop(family, packed) != addr:
+        return None
+
+    length = int(length)
+    if length > max_length:
+        return None
+    if int.from_bytes(packed, "big") & ((1 << (max_length - length)) - 1):
+        return None
+
+    exact = raw.get("exact", False)
+    if not isinstance(exact, bool):
+        return None
+
+    ge = le = None
+    if not exact:
+        ge = raw.get("greater-equal")
+        le = raw.get("less-equal")
+        for value in (ge, le):
+            if value is None:
+                continue
+            if not isinstance(value, int) or isinstance(value, bool):
+                return None
+            # A value of 0 is left to the validator too.
+            if value == 0 or not length <= value <= max_length:
+                return None
+        if ge is not None and le is not None and ge > le:
+            return None
+
+    return {
+        "prefix": addr,
+        "length": length,
+        "exact": exact,
+        "ge": ge,
+        "le": le,
+        "comment": None,
+        "max_length": max_length
+    }
+
+def parse_prefix_list(raw_prefixes):
+    """Build the prefix list entries out of the prefix_list returned
+    by bgpq4 (-A -l prefix_list).
+
+    The result is the same of parse_prefix() for each item, but the
+    items in canonical form, nearly all of them, are parsed without
+    building ipaddress and validator objects.
+    """
+    res = []
+    for raw in raw_prefixes:
+        entry = _parse_prefix_fast(raw)
+        if entry is None:
+            entry = parse_prefix(raw)
+        res.append(entry)
+    return res
@@ -0,0 +1,182 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from array import array
+import ipaddress
+import mmap
+import struct
+import tempfile
+import threading
+
+
+class IRRDBPrefixList(object):
+    """Read-only list of prefixes backed by a packed table.
+
+    Each row of the table holds the IP version, the prefix length,
+    the exact/ge/le attributes and the network address of a prefix;
+    entries are built only when they are accessed, in the same format
+    of the validated prefix list entries (:class:`ValidatorPrefixListEntry`).
+    """
+
+    # ip_ver, length, exact, ge, le, padding, address
+    ROW = struct.Struct("<BBBBB3x16s")
+
+    # Value used in the ge/le columns for None.
+    NONE = 255
+
+    def __init__(self, buf, comments=None):
+        self.buf = buf
+        self.comments = comments or {}
+
+    @classmethod
+    def pack(cls, prefixes):
+        """Returns (buffer, comments) for the given entries."""
+        buf = bytearray(cls.ROW.size * len(prefixes))
+        comments = {}
+        for idx, entry in enumerate(prefixes):
+            ip = ipaddress.ip_address(entry["prefix"])
+            cls.ROW.pack_into(
+                buf, idx * cls.ROW.size,
+                ip.version,
+                entry["length"],
+                1 if entry.get("exact") else 0,
+                cls.NONE if entry.get("ge") is None else entry["ge"],
+                cls.NONE if entry.get("le") is None else entry["le"],
+                ip.packed
+            )
+            if entry.get("comment") is not None:
+                comments[idx] = entry["comment"]
+        return bytes(buf), comments
+
+    def __len__(self):
+        return len(self.buf) // self.ROW.size
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("prefix list index out of range")
+
+        ip_ver, length, exact, ge, le, packed = self.ROW.unpack_from(
+            self.buf, idx * self.ROW.size
+        )
+        if ip_ver == 4:
+            ip = ipaddress.IPv4Address(packed[:4])
+        else:
+            ip = ipaddress.IPv6Address(packed)
+        return {
+            "prefix": str(ip),
+            "length": length,
+            "comment": self.comments.get(idx),
+            "max_length": ip.max_prefixlen,
+            "exact": bool(exact),
+            "ge": None if ge == self.NONE else ge,
+            "le": None if le == self.NONE else le
+        }
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __bool__(self):
+        return len(self) > 0
+
+class IRRDBStore(object):
+    """Compact storage of the IRRDB expansion results.
+
+    ASNs are kept as sorted arrays of integers and prefixes as packed
+    tables (:class:`IRRDBPrefixList`); the results are stored only once
+    and then shared, read-only, by all the consumers.
+
+    Up to ``memory_limit`` bytes are kept in memory; the data stored
+    after that limit is reached is written to a temporary file, which
+    is then memory-mapped.
+    """
+
+    DEFAULT_MEMORY_LIMIT = 256 * 1024 * 1024
+
+    # Offsets of the data in the spill file are aligned to this.
+    ALIGNMENT = 8
+
+    def __init__(self, memory_limit=DEFAULT_MEMORY_LIMIT):
+        self.memory_limit = memory_limit
+
+        self.lock = threading.Lock()
+        self.memory_used = 0
+
+        self.spill_file = None
+        self.spill_size = 0
+        self.mmap = None
+
+    def _put(self, data):
+        """Returns the handle to use to retrieve the data."""
+        with self.lock:
+            if self.memory_used + len(data) <= self.memory_limit:
+                self.memory_used += len(data)
+                return data
+
+            if self.spill_file is None:
+                self.spill_file = tempfile.TemporaryFile(
+                    suffix="_arouteserver"
+                )
+
+            offset = self.spill_size
+            self.spill_file.seek(offset)
+            self.spill_file.write(data)
+            padding = -len(data) % self.ALIGNMENT
+            if padding:
+                self.spill_file.write(b"\0" * padding)
+            self.spill_size += len(data) + padding
+            return (offset, len(data))
+
+    def _get(self, handle):
+        if not isinstance(handle, tuple):
+            return handle
+
+        offset, length = handle
+        if length == 0:
+            return b""
+
+        with self.lock:
+            if self.mmap is None or len(self.mmap) < offset + length:
+                # The file has grown since it was mapped: the previous
+                # map is left to the views that are still using it.
+                self.spill_file.flush()
+                self.mmap = mmap.mmap(self.spill_file.fileno(),
+                                      self.spill_size,
+                                      access=mmap.ACCESS_READ)
+            return memoryview(self.mmap)[offset:offset + length]
+
+    def put_asns(self, asns):
+        return self._put(array("I", sorted(asns)).tobytes())
+
+    def get_asns(self, handle):
+        return memoryview(self._get(handle)).cast("I")
+
+    def put_prefixes(self, prefixes):
+        buf, comments = IRRDBPrefixList.pack(prefixes)
+        return self._put(buf), comments
+
+    def get_prefixes(self, handle):
+        buf_handle, comments = handle
+        return IRRDBPrefixList(self._get(buf_handle), comments)
+
+    def close(self):
+        with self.lock:
+            self.mmap = None
+            if self.spill_file is not None:
+                self.spill_file.close()
+                self.spill_file = None
+            self.spill_size = 0
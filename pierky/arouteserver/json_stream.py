@@ -0,0 +1,154 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import codecs
+import json
+
+
+WHITESPACE = " \t\r\n"
+DELIMITERS = WHITESPACE + ",]}"
+
+class JSONObjectStream(object):
+    """Incremental reader of a JSON document whose root is an object.
+
+    The document is read from an iterable of chunks of UTF-8 encoded
+    bytes (the body of an HTTP response, a file read in blocks, ...)
+    and only the data needed to decode the current value is kept in
+    memory.
+
+    :meth:`iter_items` yields the (key, value) pairs of the root
+    object, in the same order in which they are found in the
+    document. Arrays are returned as iterators of their elements,
+    that are decoded only when they are consumed: this allows to
+    process huge lists of items one at a time.
+
+    ValueError is raised if the document is not valid.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.json_decoder = json.JSONDecoder()
+
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+        self.keys = {}
+
+    def _fill(self):
+        """Read the next chunk; False when the document is over."""
+        if self.eof:
+            return False
+
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            data = self.text_decoder.decode(b"", final=True)
+        else:
+            data = self.text_decoder.decode(chunk)
+
+        # What was already consumed is dropped.
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """Next non-whitespace char, None at the end of the document."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return None
+
+    def _expect(self, chars):
+        char = self._peek()
+        if char is None or char not in chars:
+            raise ValueError(
+                "expected {}, found {}".format(
+                    " or ".join("'{}'".format(c) for c in chars),
+                    "end of document" if char is None else "'{}'".format(char)
+                )
+            )
+        self.pos += 1
+        return char
+
+    def _decode_value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                # The value could be truncated at the end of the buffer.
+                if not self._fill():
+                    raise
+                continue
+
+            # A number may continue in the next chunk: it's complete
+            # only when it's followed by a delimiter.
+            if isinstance(value, (int, float)) and not self.eof and \
+                    (end == len(self.buf) or self.buf[end] not in DELIMITERS):
+                self._fill()
+                continue
+
+            self.pos = end
+            return value
+
+    def _iter_array(self):
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+
+        while True:
+            value = self._decode_value()
+            if isinstance(value, dict):
+                # Elements are decoded one at a time, so their keys
+                # are not shared like json.loads does: the same
+                # string is used here for the same key.
+                value = {self.keys.setdefault(key, key): item
+                         for key, item in value.items()}
+            yield value
+            if self._expect(",]") == "]":
+                return
+
+    def iter_items(self):
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+
+        while True:
+            if self._peek() != '"':
+                self._expect('"')
+            key = self._decode_value()
+            self._expect(":")
+
+            if self._peek() == "[":
+                array = self._iter_array()
+                yield key, array
+                # Elements that were not consumed are skipped.
+                for _ in array:
+                    pass
+            else:
+                yield key, self._decode_value()
+
+            if self._expect(",}") == "}":
+                break
+
+        if self._peek() is not None:
+            raise ValueError("extra data after the root object")
@@ -0,0 +1,245 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import ipaddress
+
+
+class PrefixListAggregator(object):
+    """Merge the entries of a prefix list into fewer equivalent ones.
+
+    Each entry of a prefix list (in the format returned by
+    :class:`ValidatorPrefixListEntry`) matches the routes that are
+    more specific of its prefix, with a length in the range given by
+    its ge/le attributes. The aggregator returns a list of entries
+    that matches exactly the same routes, built by:
+
+    - merging the ranges of the entries for the same prefix, when
+      they overlap or are adjacent;
+
+    - dropping (or shrinking) the ranges already matched by the
+      entries of a less specific prefix;
+
+    - replacing sibling prefixes with the same range by their
+      parent prefix, with that range (10.0.0.0/24 and 10.0.1.0/24
+      become 10.0.0.0/23{24,24}).
+
+    Entries with a comment are kept as they are.
+    """
+
+    def __init__(self, ip_ver):
+        assert ip_ver in (4, 6)
+        self.ip_ver = ip_ver
+        self.bits = 32 if ip_ver == 4 else 128
+
+        # { (net, length): [[low, hi, original entry or None], ...] }
+        self.ranges = {}
+
+    @staticmethod
+    def _normalize(ranges):
+        """Sort and merge the ranges that overlap or are adjacent."""
+        ranges.sort(key=lambda r: r[0])
+        res = []
+        for rng in ranges:
+            if res and rng[0] <= res[-1][1] + 1:
+                last = res[-1]
+                if rng[1] > last[1]:
+                    last[1] = rng[1]
+                last[2] = None
+                continue
+            res.append(rng)
+        return res
+
+    def add(self, entry):
+        ip = ipaddress.ip_address(entry["prefix"])
+        length = entry["length"]
+
+        if entry["exact"]:
+            low = hi = length
+        else:
+            low = entry["ge"] or length
+            hi = entry["le"] or self.bits
+
+        key = (int(ip), length)
+        ranges = self.ranges.setdefault(key, [])
+        ranges.append([low, hi, entry])
+        if len(ranges) > 1:
+            self.ranges[key] = self._normalize(ranges)
+
+    def __len__(self):
+        return sum(len(ranges) for ranges in self.ranges.values())
+
+    def _contains(self, parent, child):
+        net, length = parent
+        child_net, child_length = child
+        if child_length < length:
+            return False
+        if length == 0:
+            return True
+        shift = self.bits - length
+        return (net >> shift) == (child_net >> shift)
+
+    def _remove_covered(self):
+        """Drop or shrink the ranges matched by less specific prefixes.
+
+        Returns True if something changed.
+        """
+        changed = False
+
+        # Parents come before their children in this order.
+        ancestors = []
+        for key in sorted(self.ranges):
+            while ancestors and not self._contains(ancestors[-1], key):
+                ancestors.pop()
+
+            covering = sorted(
+                (rng[0], rng[1])
+                for ancestor in ancestors
+                for rng in self.ranges[ancestor]
+            )
+
+            ranges = []
+            for rng in self.ranges[key]:
+                low, hi = rng[0], rng[1]
+                for cov_low, cov_hi in covering:
+                    if cov_low <= low <= cov_hi:
+                        low = cov_hi + 1
+                for cov_low, cov_hi in reversed(covering):
+                    if cov_low <= hi <= cov_hi:
+                        hi = cov_low - 1
+                if low > hi:
+                    changed = True
+                    continue
+                if (low, hi) != (rng[0], rng[1]):
+                    changed = True
+                    rng = [low, hi, None]
+                ranges.append(rng)
+
+            if ranges:
+                self.ranges[key] = ranges
+                ancestors.append(key)
+            else:
+                del self.ranges[key]
+
+        return changed
+
+    def _merge_siblings(self):
+        """Replace sibling prefixes with the same range by their parent.
+
+        Returns True if something changed.
+        """
+        changed = False
+
+        by_length = {}
+        for net, length in self.ranges:
+            by_length.setdefault(length, set()).add(net)
+
+        # Longest prefixes first, so that the parents built out of
+        # two siblings can be merged again with their own siblings.
+        for length in range(max(by_length, default=0), 0, -1):
+            bit = 1 << (self.bits - length)
+
+            for net in sorted(by_length.get(length, [])):
+                key = (net, length)
+                sibling = (net | bit, length)
+                if net & bit or key not in self.ranges or \
+                        sibling not in self.ranges:
+                    continue
+
+                sibling_ranges = set((r[0], r[1])
+                                     for r in self.ranges[sibling])
+                common = [(r[0], r[1]) for r in self.ranges[key]
+                          if (r[0], r[1]) in sibling_ranges]
+                if not common:
+                    continue
+
+                changed = True
+                for node in (key, sibling):
+                    ranges = [r for r in self.ranges[node]
+                              if (r[0], r[1]) not in common]
+                    if ranges:
+                        self.ranges[node] = ranges
+                    else:
+                        del self.ranges[node]
+
+                parent = (net, length - 1)
+                ranges = self.ranges.get(parent, []) + \
+                    [[low, hi, None] for low, hi in common]
+                self.ranges[parent] = self._normalize(ranges)
+                by_length.setdefault(length - 1, set()).add(net)
+
+        return changed
+
+    def aggregate(self):
+        while True:
+            changed = self._remove_covered()
+            changed = self._merge_siblings() or changed
+            if not changed:
+                break
+
+    def _build_entry(self, net, length, low, hi):
+        if self.ip_ver == 4:
+            ip = ipaddress.IPv4Address(net)
+        else:
+            ip = ipaddress.IPv6Address(net)
+
+        exact = low == hi == length
+        return {
+            "prefix": str(ip),
+            "length": length,
+            "exact": exact,
+            "ge": low if not exact and low > length else None,
+            "le": hi if not exact and hi < self.bits else None,
+            "comment": None,
+            "max_length": self.bits
+        }
+
+    def to_prefix_list(self):
+        res = []
+        for net, length in sorted(self.ranges):
+            for low, hi, entry in self.ranges[(net, length)]:
+                if entry is None:
+                    entry = self._build_entry(net, length, low, hi)
+                res.append(entry)
+        return res
+
+def aggregate_prefix_list(prefix_list):
+    """Returns the aggregated entries of the prefix list.
+
+    When no entries can be merged, the original list is returned.
+    """
+    prefix_list = list(prefix_list)
+
+    aggregators = {
+        4: PrefixListAggregator(4),
+        6: PrefixListAggregator(6)
+    }
+    commented = []
+
+    for entry in prefix_list:
+        if entry.get("comment"):
+            commented.append(entry)
+            continue
+        ip_ver = 6 if ":" in entry["prefix"] else 4
+        aggregators[ip_ver].add(entry)
+
+    for aggregator in aggregators.values():
+        aggregator.aggregate()
+
+    if len(aggregators[4]) + len(aggregators[6]) + len(commented) >= \
+            len(prefix_list):
+        return prefix_list
+
+    return aggregators[4].to_prefix_list() + \
+        aggregators[6].to_prefix_list() + commented
@@ -0,0 +1,362 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import ipaddress
+import re
+
+
+class PrefixTreeNode(object):
+
+    __slots__ = ("net", "length", "l", "r", "son", "is_glue",
+                 "is_aggregate", "aggregate_low", "aggregate_hi")
+
+    def __init__(self, net, length, is_glue=False):
+        self.net = net
+        self.length = length
+
+        self.l = None
+        self.r = None
+
+        # Additional aggregate entry for the same prefix,
+        # with a different range of lengths.
+        self.son = None
+
+        self.is_glue = is_glue
+        self.is_aggregate = False
+        self.aggregate_low = 0
+        self.aggregate_hi = 0
+
+class PrefixTree(object):
+    """Radix tree of prefixes, used to build bgpq4-like prefix lists.
+
+    It implements the same logic used by bgpq4 to refine (*-R*)
+    and aggregate (*-A*) the prefixes, so that the entries that
+    are returned by :meth:`to_prefix_list` are the same that
+    bgpq4 would return in its JSON output (*-j -l prefix_list*).
+    """
+
+    RANGE_OPERATOR = re.compile(r"^\^(?:(-|\+)|([0-9]+)(?:-([0-9]+))?)$")
+
+    def __init__(self, ip_ver):
+        assert ip_ver in (4, 6)
+        self.ip_ver = ip_ver
+        self.bits = 32 if ip_ver == 4 else 128
+        self.head = None
+
+    def _bit(self, net, idx):
+        return (net >> (self.bits - 1 - idx)) & 1
+
+    def _mask(self, net, length):
+        if length == 0:
+            return 0
+        return net & (((1 << length) - 1) << (self.bits - length))
+
+    def _common_bits(self, net_a, net_b, max_len):
+        diff = (net_a ^ net_b) >> (self.bits - max_len) if max_len else 0
+        if not diff:
+            return max_len
+        return max_len - diff.bit_length()
+
+    def _replace(self, parent, old, new):
+        if parent is None:
+            self.head = new
+        elif parent.l is old:
+            parent.l = new
+        else:
+            parent.r = new
+
+    def _set_child(self, parent, child):
+        if self._bit(child.net, parent.length):
+            parent.r = child
+        else:
+            parent.l = child
+
+    def _insert(self, net, length):
+        # New nodes have no entries yet: see add().
+        node = PrefixTreeNode(net, length, is_glue=True)
+
+        if self.head is None:
+            self.head = node
+            return node
+
+        parent = None
+        chead = self.head
+        while True:
+            common = self._common_bits(net, chead.net,
+                                       min(length, chead.length))
+
+            if common == length and common == chead.length:
+                # Same prefix.
+                return chead
+
+            if common == chead.length:
+                # The current node covers the new one.
+                child = chead.r if self._bit(net, chead.length) else chead.l
+                if child is None:
+                    self._set_child(chead, node)
+                    return node
+                parent = chead
+                chead = child
+                continue
+
+            if common == length:
+                # The new node covers the current one.
+                self._set_child(node, chead)
+                self._replace(parent, chead, node)
+                return node
+
+            glue = PrefixTreeNode(self._mask(net, common), common,
+                                  is_glue=True)
+            self._set_child(glue, chead)
+            self._set_child(glue, node)
+            self._replace(parent, chead, glue)
+            return node
+
+    def _get_entries(self, node):
+        """Exact match and ranges of lengths of the node's prefix."""
+        exact = False
+        ranges = []
+        entry = node
+        while entry:
+            if not entry.is_glue:
+                if entry.is_aggregate:
+                    ranges.append((entry.aggregate_low, entry.aggregate_hi))
+                else:
+                    exact = True
+            entry = entry.son
+        return exact, ranges
+
+    def _set_entries(self, node, exact, ranges):
+        """Store the entries of the node's prefix.
+
+        Ranges that overlap or are adjacent are merged; the exact
+        match is kept apart, unless a range that starts from the
+        length of the prefix covers it. The first entry is stored
+        in the node, the other ones in its son chain.
+        """
+        merged = []
+        for low, hi in sorted(ranges):
+            if merged and low <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+            else:
+                merged.append((low, hi))
+
+        if merged and merged[0][0] == node.length:
+            exact = False
+
+        node.is_glue = False
+        node.son = None
+        entry = node
+        if exact:
+            node.is_aggregate = False
+        else:
+            low, hi = merged.pop(0)
+            node.is_aggregate = True
+            node.aggregate_low = low
+            node.aggregate_hi = hi
+
+        for low, hi in merged:
+            entry.son = self._new_aggregate(node, low, hi)
+            entry = entry.son
+
+    def add(self, prefix):
+        """Add a prefix, optionally followed by an RPSL range operator.
+
+        Examples: ``192.0.2.0/24``, ``10.0.0.0/8^16-24``.
+        """
+        range_op = None
+        if "^" in prefix:
+            prefix, range_op = prefix.split("^", 1)
+            range_op = "^" + range_op
+
+        obj = ipaddress.ip_network(prefix, strict=False)
+        if obj.version != self.ip_ver:
+            return False
+
+        length = obj.prefixlen
+        node = self._insert(int(obj.network_address), length)
+        exact, ranges = self._get_entries(node)
+
+        if not range_op:
+            exact = True
+        else:
+            match = self.RANGE_OPERATOR.match(range_op)
+            if not match:
+                raise ValueError(
+                    "invalid range operator: {}".format(range_op)
+                )
+            op, low, hi = match.groups()
+            if op == "-":
+                low, hi = length + 1, self.bits
+            elif op == "+":
+                low, hi = length, self.bits
+            else:
+                low = int(low)
+                hi = int(hi) if hi else low
+            if low < length or hi < low or hi > self.bits:
+                raise ValueError(
+                    "invalid range operator: {}".format(range_op)
+                )
+            if low == hi == length:
+                exact = True
+            else:
+                ranges.append((low, hi))
+
+        self._set_entries(node, exact, ranges)
+        return True
+
+    def _iter_nodes(self, node):
+        # Iterative version of the pre-order traversal used by bgpq4:
+        # node, left branch, son, right branch.
+        stack = [node] if node else []
+        while stack:
+            node = stack.pop()
+            yield node
+            for child in (node.r, node.son, node.l):
+                if child:
+                    stack.append(child)
+
+    def _refine_node(self, node, refine):
+        if not node.is_glue and node.length < refine:
+            node.is_aggregate = True
+            node.aggregate_low = node.length
+            node.aggregate_hi = refine
+            for child in (node.l, node.r):
+                if child:
+                    for sub_node in self._iter_nodes(child):
+                        if sub_node.length <= refine:
+                            sub_node.is_glue = True
+                    self._refine_node(child, refine)
+        elif not node.is_glue and node.length == refine:
+            for child in (node.l, node.r):
+                if child:
+                    for sub_node in self._iter_nodes(child):
+                        sub_node.is_glue = True
+        elif node.is_glue:
+            for child in (node.r, node.l):
+                if child:
+                    self._refine_node(child, refine)
+
+    def refine(self, refine):
+        """Allow more specific prefixes, up to the given length (*-R*)."""
+        if self.head:
+            self._refine_node(self.head, refine)
+
+    @staticmethod
+    def _new_aggregate(node, low, hi):
+        res = PrefixTreeNode(node.net, node.length)
+        res.is_aggregate = True
+        res.aggregate_low = low
+        res.aggregate_hi = hi
+        return res
+
+    def _aggregate_node(self, node):
+        if node.l:
+            self._aggregate_node(node.l)
+        if node.r:
+            self._aggregate_node(node.r)
+
+        l, r = node.l, node.r
+        if not l or not r:
+            return
+
+        if not r.is_aggregate and not l.is_aggregate and \
+            not r.is_glue and not l.is_glue and \
+                r.length == l.length:
+
+            if r.length == node.length + 1:
+                node.is_aggregate = True
+                r.is_glue = True
+                l.is_glue = True
+                node.aggregate_hi = r.length
+                if node.is_glue:
+                    node.is_glue = False
+                    node.aggregate_low = r.length
+                else:
+                    node.aggregate_low = node.length
+
+            if r.son and l.son and \
+                r.son.is_aggregate and l.son.is_aggregate and \
+                r.son.aggregate_hi == l.son.aggregate_hi and \
+                r.son.aggregate_low == l.son.aggregate_low and \
+                    r.length == node.length + 1:
+                node.son = self._new_aggregate(node, r.son.aggregate_low,
+                                               r.son.aggregate_hi)
+                r.son.is_glue = True
+                l.son.is_glue = True
+
+        elif r.is_aggregate and l.is_aggregate and \
+            r.aggregate_hi == l.aggregate_hi and \
+                r.aggregate_low == l.aggregate_low:
+
+            if r.length != node.length + 1:
+                return
+
+            if node.is_glue:
+                r.is_glue = True
+                l.is_glue = True
+                node.is_aggregate = True
+                node.is_glue = False
+                node.aggregate_hi = r.aggregate_hi
+                node.aggregate_low = r.aggregate_low
+            elif r.length == r.aggregate_low:
+                r.is_glue = True
+                l.is_glue = True
+                node.is_aggregate = True
+                node.aggregate_hi = r.aggregate_hi
+                node.aggregate_low = node.length
+            else:
+                node.son = self._new_aggregate(node, r.aggregate_low,
+                                               r.aggregate_hi)
+                r.is_glue = True
+                l.is_glue = True
+                if r.son and l.son and \
+                    r.son.aggregate_hi == l.son.aggregate_hi and \
+                        r.son.aggregate_low == l.son.aggregate_low:
+                    node.son.son = self._new_aggregate(
+                        node, r.son.aggregate_low, r.son.aggregate_hi
+                    )
+                    r.son.is_glue = True
+                    l.son.is_glue = True
+
+    def aggregate(self):
+        """Aggregate the prefixes (*-A*)."""
+        if self.head:
+            self._aggregate_node(self.head)
+
+    def _format_prefix(self, node):
+        if self.ip_ver == 4:
+            ip = ipaddress.IPv4Address(node.net)
+        else:
+            ip = ipaddress.IPv6Address(node.net)
+        return "{}/{}".format(ip, node.length)
+
+    def to_prefix_list(self):
+        """Entries in the same format of bgpq4's JSON output."""
+        res = []
+        for node in self._iter_nodes(self.head):
+            if node.is_glue:
+                continue
+
+            entry = {"prefix": self._format_prefix(node)}
+            if node.is_aggregate:
+                entry["exact"] = False
+                if node.aggregate_low > node.length:
+                    entry["greater-equal"] = node.aggregate_low
+                entry["less-equal"] = node.aggregate_hi
+            else:
+                entry["exact"] = True
+            res.append(entry)
+        return res
@@ -30,6 +30,8 @@ class RegistroBRWhoisDBDump(CachedObject):
 
     EXPIRY_TIME_TAG = "registrobr_whois_db_dump"
 
+    USE_CACHE_MEMO = False
+
     def __init__(self, *args, **kwargs):
         CachedObject.__init__(self, *args, **kwargs)
 
@@ -13,24 +13,114 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import json
+import calendar
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import hashlib
 import logging
 import datetime
+import threading
+import time
 
 import requests
 
-from .cached_objects import CachedObject
+from .cached_objects import CachedObject, CachedDataNotModified
 from .errors import RPKIValidatorCacheError
 from .ipaddresses import IPNetwork
+from .json_stream import JSONObjectStream
 
 
+class _FetchCancelled(Exception):
+    pass
+
+class _SourceFetch(object):
+    """Fetch of one of the URLs, in the 'freshest' mode.
+
+    The fetch is suspended as soon as the build time of the file is
+    known, until it's decided whether the file must be used or not.
+    """
+
+    def __init__(self, roas, url):
+        # Each fetch sets its own metadata.
+        self.fetcher = copy.copy(roas)
+        self.fetcher.meta = {}
+
+        self.url = url
+
+        self.buildtime_dt_utc = None
+        self.metadata_time = None
+
+        self.result = None
+        self.not_modified = False
+        self.error = None
+        self.cancelled = False
+
+        # Set when the build time is known or the fetch is over.
+        self.reported = threading.Event()
+        self.resumed = threading.Event()
+        self.done = threading.Event()
+        self.use_it = False
+
+        self.start_time = None
+        self.total_time = None
+
+    def _on_metadata(self, buildtime_dt_utc):
+        self.buildtime_dt_utc = buildtime_dt_utc
+        self.metadata_time = time.time() - self.start_time
+        self.reported.set()
+
+        self.resumed.wait()
+        if not self.use_it:
+            raise _FetchCancelled()
+
+    def resume(self, use_it):
+        self.use_it = use_it
+        self.resumed.set()
+
+    @property
+    def suspended(self):
+        return self.reported.is_set() and not self.done.is_set()
+
+    def run(self):
+        self.start_time = time.time()
+        try:
+            self.result = self.fetcher._get_data_from_url(
+                self.url, on_metadata=self._on_metadata
+            )
+        except CachedDataNotModified:
+            self.not_modified = True
+        except _FetchCancelled:
+            self.cancelled = True
+        except Exception as e:
+            self.error = e
+        finally:
+            self.total_time = time.time() - self.start_time
+            self.done.set()
+            self.reported.set()
+
 class RIPE_RPKI_ROAs(CachedObject):
 
     EXPIRY_TIME_TAG = "ripe_rpki_roas"
 
+    USE_CACHE_MEMO = False
+
     DEFAULT_URL = "https://console.rpki-client.org/vrps.json"
     DEFAULT_IGNORE_FILES_OLDER_THAN = 21600
 
+    # 'sequential': URLs are tried one at a time, the first one
+    # that works is used.
+    # 'freshest': URLs are fetched concurrently, the most recent
+    # file is used.
+    FETCH_MODES = ("sequential", "freshest")
+    DEFAULT_FETCH_MODE = "sequential"
+
+    # Timeout (seconds) of the HTTP connection and of each read.
+    DEFAULT_TIMEOUT = 30
+
+    # Size of the blocks in which files and HTTP responses are read.
+    CHUNK_SIZE = 65536
+
     def __init__(self, *args, **kwargs):
         CachedObject.__init__(self, *args, **kwargs)
 
@@ -42,6 +132,17 @@ class RIPE_RPKI_ROAs(CachedObject):
             self.DEFAULT_IGNORE_FILES_OLDER_THAN
         )
 
+        self.fetch_mode = kwargs.get("fetch_mode", self.DEFAULT_FETCH_MODE)
+        if self.fetch_mode not in self.FETCH_MODES:
+            raise RPKIValidatorCacheError(
+                "Unknown fetch mode for the RPKI cache files: '{}'; "
+                "it must be one of {}.".format(
+                    self.fetch_mode, ", ".join(self.FETCH_MODES)
+                )
+            )
+
+        self.timeout = kwargs.get("timeout", self.DEFAULT_TIMEOUT)
+
         self.roas = {}
 
     def load_data(self):
@@ -49,7 +150,17 @@ class RIPE_RPKI_ROAs(CachedObject):
 
         CachedObject.load_data(self)
 
-        self.roas = self.raw_data
+        # ROAs that expired after the data was fetched are
+        # discarded here; this happens when the cached copy
+        # is used, or when the source was not modified.
+        timestamp_now_utc = int(datetime.datetime.timestamp(self._get_utc_now()))
+        self.roas = {
+            "roas": [
+                roa for roa in self.raw_data["roas"]
+                if "expires" not in roa or
+                int(roa["expires"]) >= timestamp_now_utc
+            ]
+        }
 
     def _get_object_filename(self):
         return "ripe-rpki-cache.json"
@@ -58,62 +169,96 @@ class RIPE_RPKI_ROAs(CachedObject):
     def _get_utc_now():
         return datetime.datetime.utcnow()
 
-    def _get_data_from_url(self, url):
-        if url.lower().startswith(("http://", "https://")):
-            logging.debug("Fetching RPKI ROAs from {}".format(url))
-            try:
-                response = requests.get(url,
-                                        headers={'Accept': 'text/json'})
-                response.raise_for_status()
-                raw = response.content
-            except requests.exceptions.HTTPError as e:
-                raise RPKIValidatorCacheError(
-                    "HTTP error while retrieving ROAs from "
-                    "RIPE RPKI Validator cache ({}): "
-                    "{}".format(
-                        url, str(e)
-                    )
-                )
-            except Exception as e:
-                raise RPKIValidatorCacheError(
-                    "Error while retrieving ROAs from "
-                    "RIPE RPKI Validator cache ({}): {}".format(
-                        url, str(e)
-                    )
+    @staticmethod
+    def _dt_to_ts(dt_utc):
+        return calendar.timegm(dt_utc.timetuple()) if dt_utc else None
+
+    @staticmethod
+    def _ts_to_dt(ts):
+        return datetime.datetime.utcfromtimestamp(ts) if ts else None
+
+    def _check_dates(self, url, buildtime_dt_utc, valid_dt_utc):
+        if buildtime_dt_utc and buildtime_dt_utc < self._get_utc_now() - datetime.timedelta(
+            seconds=self.ignore_cache_files_older_than
+        ):
+            raise RPKIValidatorCacheError(
+                "The RPKI cache file from {} was built at {} UTC, "
+                "so it was generated more than {} seconds ago "
+                "(ignore_cache_files_older_than), hence "
+                "it will be ignored.".format(
+                    url,
+                    buildtime_dt_utc,
+                    self.ignore_cache_files_older_than
                 )
-        else:
-            logging.debug("Loading RPKI ROAs from {} file".format(url))
-            try:
-                raw = open(url, "rb").read()
-            except Exception as e:
-                raise RPKIValidatorCacheError(
-                    "Error while reading ROAs from file "
-                    "{}: {}".format(
-                        url, str(e)
-                    )
+            )
+
+        if valid_dt_utc and valid_dt_utc < self._get_utc_now():
+            raise RPKIValidatorCacheError(
+                "The RPKI cache file from {} is valid till {} UTC, "
+                "hence it will be ignored.".format(
+                    url,
+                    valid_dt_utc
                 )
+            )
+
+    def _not_modified(self, url, on_metadata=None):
+        logging.debug("RPKI ROAs from {} not modified".format(url))
 
+        # Dates are checked again, since they could be
+        # no longer valid for the cached copy of the file.
+        buildtime_dt_utc = self._ts_to_dt(self.cached_meta.get("buildtime"))
+        self._check_dates(
+            url,
+            buildtime_dt_utc,
+            self._ts_to_dt(self.cached_meta.get("valid"))
+        )
+        if on_metadata:
+            on_metadata(buildtime_dt_utc)
+        raise CachedDataNotModified()
+
+    def _iter_response_chunks(self, url, response, hasher):
         try:
-            roas = json.loads(raw.decode("utf-8"))
-        except Exception as e:
+            for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                hasher.update(chunk)
+                yield chunk
+        except requests.exceptions.RequestException as e:
             raise RPKIValidatorCacheError(
-                "Error while parsing ROAs from "
+                "Error while retrieving ROAs from "
                 "RIPE RPKI Validator cache ({}): {}".format(
                     url, str(e)
                 )
             )
+        finally:
+            response.close()
 
-        if "roas" not in roas:
-            raise RPKIValidatorCacheError("missing 'roas' root element")
-        if not isinstance(roas["roas"], list):
-            raise RPKIValidatorCacheError("'roas' root element is not a list")
+    def _iter_file_chunks(self, url, hasher):
+        try:
+            with open(url, "rb") as f:
+                while True:
+                    chunk = f.read(self.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    yield chunk
+        except OSError as e:
+            raise RPKIValidatorCacheError(
+                "Error while reading ROAs from file "
+                "{}: {}".format(
+                    url, str(e)
+                )
+            )
+
+    def _parse_metadata(self, url, metadata):
+        """Returns (buildtime, valid), as UTC datetime objects."""
+        if not isinstance(metadata, dict):
+            return None, None
 
         buildtime_dt_utc = None
 
-        if "metadata" in roas and "buildtime" in roas["metadata"]:
+        if "buildtime" in metadata:
             # rpki-client format.
 
-            buildtime = roas["metadata"]["buildtime"]
+            buildtime = metadata["buildtime"]
 
             try:
                 buildtime_dt_utc = datetime.datetime.strptime(
@@ -128,10 +273,10 @@ class RIPE_RPKI_ROAs(CachedObject):
                     )
                 )
 
-        elif "metadata" in roas and "generated" in roas["metadata"]:
+        elif "generated" in metadata:
             # OctoRPKI format.
 
-            generated = roas["metadata"]["generated"]
+            generated = metadata["generated"]
 
             try:
                 buildtime_dt_utc = datetime.datetime.utcfromtimestamp(int(generated))
@@ -143,26 +288,12 @@ class RIPE_RPKI_ROAs(CachedObject):
                     )
                 )
 
-        if buildtime_dt_utc and buildtime_dt_utc < self._get_utc_now() - datetime.timedelta(
-            seconds=self.ignore_cache_files_older_than
-        ):
-            raise RPKIValidatorCacheError(
-                "The RPKI cache file from {} was built at {} UTC, "
-                "so it was generated more than {} seconds ago "
-                "(ignore_cache_files_older_than), hence "
-                "it will be ignored.".format(
-                    url,
-                    buildtime_dt_utc,
-                    self.ignore_cache_files_older_than
-                )
-            )
-
         valid_dt_utc = None
 
-        if "metadata" in roas and "valid" in roas["metadata"]:
+        if "valid" in metadata:
             # OctoRPKI format.
 
-            valid = roas["metadata"]["valid"]
+            valid = metadata["valid"]
 
             try:
                 valid_dt_utc = datetime.datetime.utcfromtimestamp(int(valid))
@@ -174,84 +305,291 @@ class RIPE_RPKI_ROAs(CachedObject):
                     )
                 )
 
-        if valid_dt_utc and valid_dt_utc < self._get_utc_now():
-            raise RPKIValidatorCacheError(
-                "The RPKI cache file from {} is valid till {} UTC, "
-                "hence it will be ignored.".format(
-                    url,
-                    valid_dt_utc
+        return buildtime_dt_utc, valid_dt_utc
+
+    @staticmethod
+    def _validate_roa(roa, timestamp_now_utc):
+        """Returns the normalized ROA, or None if it's expired.
+
+        Raises ValueError if the ROA is not valid.
+        """
+        if not isinstance(roa, dict):
+            raise ValueError("not an object")
+
+        if "expires" in roa:
+            expires = roa["expires"]
+            if not isinstance(expires, int):
+                if not expires.isdigit():
+                    raise ValueError("invalid expires")
+                else:
+                    expires = int(expires)
+            if expires < timestamp_now_utc:
+                return None
+
+        asn = roa.get("asn", None)
+        if asn is None:
+            raise ValueError("missing ASN")
+        if isinstance(asn, int):
+            roa["asn"] = "AS{}".format(asn)
+        elif asn.isdigit():
+            roa["asn"] = "AS{}".format(asn)
+        else:
+            if not asn.startswith("AS"):
+                raise ValueError("invalid ASN: " + asn)
+            if not asn[2:].isdigit():
+                raise ValueError("invalid ASN: " + asn)
+
+        if "ta" not in roa:
+            raise ValueError("missing trust anchor")
+
+        prefix = roa.get("prefix", None)
+        if not prefix:
+            raise ValueError("missing prefix")
+        try:
+            IPNetwork(prefix)
+        except:
+            raise ValueError("invalid prefix: " + prefix)
+
+        max_len = roa.get("maxLength", None)
+        if max_len is None:
+            raise ValueError("missing maxLength")
+        if not isinstance(max_len, int):
+            if not max_len.isdigit():
+                raise ValueError("invalid maxLength: " + max_len)
+            else:
+                roa["maxLength"] = int(max_len)
+
+        return roa
+
+    def _get_data_from_url(self, url, on_metadata=None):
+        """Fetch and parse the file.
+
+        on_metadata, if given, is called with the build time of the
+        file (None if unknown) once it has been checked, before
+        the ROAs are parsed.
+        """
+        response = None
+        hasher = hashlib.sha256()
+
+        if url.lower().startswith(("http://", "https://")):
+            logging.debug("Fetching RPKI ROAs from {}".format(url))
+            headers = {'Accept': 'text/json'}
+            headers.update(self._get_conditional_headers(url))
+            try:
+                # The body is read and parsed while it's received.
+                response = requests.get(url, headers=headers, stream=True,
+                                        timeout=self.timeout)
+                if response.status_code != 304:
+                    response.raise_for_status()
+            except requests.exceptions.HTTPError as e:
+                raise RPKIValidatorCacheError(
+                    "HTTP error while retrieving ROAs from "
+                    "RIPE RPKI Validator cache ({}): "
+                    "{}".format(
+                        url, str(e)
+                    )
                 )
-            )
+            except Exception as e:
+                raise RPKIValidatorCacheError(
+                    "Error while retrieving ROAs from "
+                    "RIPE RPKI Validator cache ({}): {}".format(
+                        url, str(e)
+                    )
+                )
+
+            if response.status_code == 304:
+                response.close()
+                self._not_modified(url, on_metadata)
+
+            chunks = self._iter_response_chunks(url, response, hasher)
+        else:
+            logging.debug("Loading RPKI ROAs from {} file".format(url))
+
+            # Local files are hashed before being parsed, so that
+            # they are not parsed at all if they were not modified.
+            file_hasher = hashlib.sha256()
+            for _ in self._iter_file_chunks(url, file_hasher):
+                pass
+            try:
+                self._set_validators(url, None,
+                                     digest=file_hasher.hexdigest())
+            except CachedDataNotModified:
+                self._not_modified(url, on_metadata)
+
+            chunks = self._iter_file_chunks(url, hasher)
 
         max_invalid_roas = 10
         invalid = 0
         timestamp_now_utc = int(datetime.datetime.timestamp(self._get_utc_now()))
 
+        buildtime_dt_utc = None
+        valid_dt_utc = None
+        roas_found = False
+        metadata_reported = False
+
         result = {"roas": []}
-        for roa in roas["roas"]:
-            try:
-                if "expires" in roa:
-                    expires = roa["expires"]
-                    if not isinstance(expires, int):
-                        if not expires.isdigit():
-                            raise ValueError("invalid expires")
-                        else:
-                            expires = int(expires)
-                    if expires < timestamp_now_utc:
-                        continue
 
-                asn = roa.get("asn", None)
-                if asn is None:
-                    raise ValueError("missing ASN")
-                if isinstance(asn, int):
-                    roa["asn"] = "AS{}".format(asn)
-                elif asn.isdigit():
-                    roa["asn"] = "AS{}".format(asn)
-                else:
-                    if not asn.startswith("AS"):
-                        raise ValueError("invalid ASN: " + asn)
-                    if not asn[2:].isdigit():
-                        raise ValueError("invalid ASN: " + asn)
-
-                if "ta" not in roa:
-                    raise ValueError("missing trust anchor")
-
-                prefix = roa.get("prefix", None)
-                if not prefix:
-                    raise ValueError("missing prefix")
-                try:
-                    IPNetwork(prefix)
-                except:
-                    raise ValueError("invalid prefix: " + prefix)
-
-                max_len = roa.get("maxLength", None)
-                if max_len is None:
-                    raise ValueError("missing maxLength")
-                if not isinstance(max_len, int):
-                    if not max_len.isdigit():
-                        raise ValueError("invalid maxLength: " + max_len)
-                    else:
-                        roa["maxLength"] = int(max_len)
-
-                result["roas"].append(roa)
-
-            except ValueError as e:
-                logging.warning("Invalid ROA: {}, {}".format(
-                    str(roa), str(e)
-                ))
-
-                invalid += 1
-                if invalid > max_invalid_roas:
+        # Only the accepted ROAs are kept in memory, while the
+        # file is parsed.
+        try:
+            for key, value in JSONObjectStream(chunks).iter_items():
+                if key == "metadata":
+                    buildtime_dt_utc, valid_dt_utc = self._parse_metadata(
+                        url, value
+                    )
+
+                    # Files that are too old are discarded before
+                    # their ROAs are parsed.
+                    self._check_dates(url, buildtime_dt_utc, valid_dt_utc)
+
+                    if on_metadata and not metadata_reported:
+                        metadata_reported = True
+                        on_metadata(buildtime_dt_utc)
+                    continue
+
+                if key != "roas":
+                    continue
+
+                if on_metadata and not metadata_reported:
+                    # The file has no metadata, or they come
+                    # after the ROAs.
+                    metadata_reported = True
+                    on_metadata(None)
+
+                if not isinstance(value, Iterator):
                     raise RPKIValidatorCacheError(
-                        "More than {} invalid ROAs have been found. "
-                        "Aborting.".format(max_invalid_roas)
+                        "'roas' root element is not a list"
                     )
+                roas_found = True
+
+                for roa in value:
+                    try:
+                        roa = self._validate_roa(roa, timestamp_now_utc)
+                    except ValueError as e:
+                        logging.warning("Invalid ROA: {}, {}".format(
+                            str(roa), str(e)
+                        ))
+
+                        invalid += 1
+                        if invalid > max_invalid_roas:
+                            raise RPKIValidatorCacheError(
+                                "More than {} invalid ROAs have been found. "
+                                "Aborting.".format(max_invalid_roas)
+                            )
+
+                        continue
+
+                    if roa is not None:
+                        result["roas"].append(roa)
+        except ValueError as e:
+            raise RPKIValidatorCacheError(
+                "Error while parsing ROAs from "
+                "RIPE RPKI Validator cache ({}): {}".format(
+                    url, str(e)
+                )
+            )
+        finally:
+            if response is not None:
+                response.close()
+
+        if not roas_found:
+            raise RPKIValidatorCacheError("missing 'roas' root element")
 
-                continue
+        try:
+            self._set_validators(url, None, response,
+                                 digest=hasher.hexdigest())
+        except CachedDataNotModified:
+            self._not_modified(url)
+
+        self.meta["buildtime"] = self._dt_to_ts(buildtime_dt_utc)
+        self.meta["valid"] = self._dt_to_ts(valid_dt_utc)
 
         return result
 
+    def _raise_no_data(self, errors):
+        exc_msg = "Impossible to load RPKI ROAs:\n"
+        for url, err in errors:
+            exc_msg += " - while trying {}: {}\n".format(url, err)
+        raise RPKIValidatorCacheError(exc_msg)
+
+    def _get_data_from_freshest_url(self):
+        fetches = [_SourceFetch(self, url) for url in self.urls]
+
+        with ThreadPoolExecutor(max_workers=len(fetches)) as executor:
+            for fetch in fetches:
+                executor.submit(fetch.run)
+
+            try:
+                for fetch in fetches:
+                    fetch.reported.wait()
+
+                # The most recent files first; files without build
+                # time last, in the same order of the configuration.
+                candidates = sorted(
+                    [fetch for fetch in fetches if fetch.suspended],
+                    key=lambda fetch: (
+                        fetch.buildtime_dt_utc is None,
+                        -self._dt_to_ts(fetch.buildtime_dt_utc)
+                        if fetch.buildtime_dt_utc else 0
+                    )
+                )
+
+                selected = None
+                for fetch in candidates:
+                    fetch.resume(use_it=True)
+                    fetch.done.wait()
+                    if fetch.error is None:
+                        selected = fetch
+                        break
+            finally:
+                # The fetches that are still suspended are cancelled.
+                for fetch in fetches:
+                    fetch.resume(use_it=False)
+
+        errors = []
+        for fetch in fetches:
+            if fetch.error is not None:
+                if isinstance(fetch.error, RPKIValidatorCacheError):
+                    logging.warning(str(fetch.error))
+                else:
+                    logging.error(
+                        "Error while fetching RPKI ROAs from {}: {}".format(
+                            fetch.url, str(fetch.error)
+                        ),
+                        exc_info=fetch.error
+                    )
+                errors.append((fetch.url, str(fetch.error)))
+
+            if fetch.metadata_time is not None:
+                latency = "build time {} UTC, received in {:.2f} seconds".format(
+                    fetch.buildtime_dt_utc or "unknown", fetch.metadata_time
+                )
+            else:
+                latency = "failed after {:.2f} seconds".format(fetch.total_time)
+            if fetch is selected:
+                latency += ", used (completed in {:.2f} seconds)".format(
+                    fetch.total_time
+                )
+            elif fetch.cancelled:
+                latency += ", cancelled"
+            logging.info("RPKI ROAs from {}: {}".format(fetch.url, latency))
+
+        if selected is None:
+            self._raise_no_data(errors)
+
+        if selected.not_modified:
+            raise CachedDataNotModified()
+
+        self.meta = selected.fetcher.meta
+        logging.info(
+            "RPKI ROAs loaded successfully from {}".format(selected.url)
+        )
+        return selected.result
+
     def _get_data(self):
+        if self.fetch_mode == "freshest":
+            return self._get_data_from_freshest_url()
+
         # List of (url, error)
         errors = []
         for url in self.urls:
@@ -265,7 +603,4 @@ class RIPE_RPKI_ROAs(CachedObject):
                 logging.warning(str(e))
                 errors.append((url, str(e)))
 
-        exc_msg = "Impossible to load RPKI ROAs:\n"
-        for url, err in errors:
-            exc_msg += " - while trying {}: {}\n".format(url, err)
-        raise RPKIValidatorCacheError(exc_msg)
+        self._raise_no_data(errors)
@@ -0,0 +1,306 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from array import array
+from collections import namedtuple
+import heapq
+import ipaddress
+import socket
+
+
+# Rows yielded by ROATable; expires is None for the ROAs without
+# an expiry time.
+ROA = namedtuple("ROA", ["prefix", "length", "max_len", "asn", "expires"])
+
+def _get_roa_sort_key(roa):
+    return (roa.length, roa.prefix, roa.asn)
+
+def parse_roa_prefix(prefix):
+    """Returns (IP version, network address as int, length).
+
+    Prefixes in the usual "<ip>/<len>" form are parsed without
+    building ipaddress objects. ValueError is raised for invalid
+    prefixes, like ipaddress.ip_network() does.
+    """
+    addr, _, length = prefix.partition("/")
+    if length.isascii() and length.isdigit():
+        family = socket.AF_INET6 if ":" in addr else socket.AF_INET
+        try:
+            packed = socket.inet_pton(family, addr)
+        except OSError:
+            packed = None
+
+        if packed is not None:
+            bits = len(packed) * 8
+            length = int(length)
+            net = int.from_bytes(packed, "big")
+            if length <= bits and not net & ((1 << (bits - length)) - 1):
+                return (4 if bits == 32 else 6), net, length
+
+    # Anything else is left to ipaddress, that raises the error.
+    obj = ipaddress.ip_network(prefix)
+    return obj.version, int(obj.network_address), obj.prefixlen
+
+class _ROAFamilyTable(object):
+    """ROAs of one address family, stored in typed arrays.
+
+    IPv6 addresses are split in two 64 bit halves.
+    An expiry time of 0 means that the ROA has no expiry time.
+
+    The prefixes formatted as strings, needed to sort the ROAs, are
+    kept once sorted, so that they are not formatted again at every
+    iteration.
+    """
+
+    def __init__(self, ip_ver):
+        self.ip_ver = ip_ver
+
+        if ip_ver == 4:
+            self.addrs = (array("I"),)
+        else:
+            self.addrs = (array("Q"), array("Q"))
+        self.lengths = array("B")
+        self.max_lens = array("B")
+        self.asns = array("I")
+        self.expires = array("q")
+
+        self.sorted = True
+        self.prefixes = []
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, net, length, max_len, asn, expires):
+        if self.ip_ver == 4:
+            self.addrs[0].append(net)
+        else:
+            self.addrs[0].append(net >> 64)
+            self.addrs[1].append(net & 0xFFFFFFFFFFFFFFFF)
+        self.lengths.append(length)
+        self.max_lens.append(max_len)
+        self.asns.append(asn)
+        self.expires.append(expires or 0)
+
+        self.sorted = False
+        self.prefixes = None
+
+    def _get_net(self, idx):
+        if self.ip_ver == 4:
+            return self.addrs[0][idx]
+        return (self.addrs[0][idx] << 64) | self.addrs[1][idx]
+
+    def _get_prefix(self, idx):
+        net = self._get_net(idx)
+        if self.ip_ver == 4:
+            ip = "{}.{}.{}.{}".format(net >> 24, (net >> 16) & 0xFF,
+                                      (net >> 8) & 0xFF, net & 0xFF)
+        else:
+            ip = ipaddress.IPv6Address(net).compressed
+        return "{}/{}".format(ip, self.lengths[idx])
+
+    def sort(self):
+        if self.sorted:
+            return
+
+        prefixes = [self._get_prefix(idx) for idx in range(len(self))]
+
+        # Prefixes are sorted as strings, so that the configurations
+        # are built in the same order in which they have always been.
+        order = sorted(
+            range(len(self)),
+            key=lambda idx: (self.lengths[idx], prefixes[idx],
+                             self.asns[idx])
+        )
+
+        self.prefixes = [prefixes[idx] for idx in order]
+
+        self.addrs = tuple(array(addrs.typecode, [addrs[idx] for idx in order])
+                           for addrs in self.addrs)
+        for attr in ("lengths", "max_lens", "asns", "expires"):
+            values = getattr(self, attr)
+            setattr(self, attr,
+                    array(values.typecode, [values[idx] for idx in order]))
+
+        self.sorted = True
+
+    def _keep(self, keep):
+        """Keep only the ROAs for which keep[idx] is True."""
+        self.addrs = tuple(
+            array(addrs.typecode,
+                  [addr for addr, kept in zip(addrs, keep) if kept])
+            for addrs in self.addrs
+        )
+        for attr in ("lengths", "max_lens", "asns", "expires"):
+            values = getattr(self, attr)
+            setattr(self, attr,
+                    array(values.typecode,
+                          [value for value, kept in zip(values, keep)
+                           if kept]))
+        if self.prefixes is not None:
+            self.prefixes = [prefix for prefix, kept
+                             in zip(self.prefixes, keep) if kept]
+
+    def compress(self):
+        """Remove the redundant ROAs; returns how many were removed.
+
+        A ROA is redundant when another ROA for the same ASN covers
+        its prefix with a max length that is not shorter, and it does
+        not expire before it: any route that is covered or matched
+        by the first ROA is covered or matched by the second one too,
+        so the outcome of the validation does not change.
+        """
+        bits = 32 if self.ip_ver == 4 else 128
+
+        def expires_after(a, b):
+            # 0 = no expiry time.
+            return a == 0 or (b != 0 and a >= b)
+
+        # Within the same ASN, less specific prefixes come before their
+        # more specific ones; for the same prefix, the ROAs with the
+        # widest max length and the latest expiry time come first.
+        order = sorted(
+            range(len(self)),
+            key=lambda idx: (self.asns[idx], self._get_net(idx),
+                             self.lengths[idx], -self.max_lens[idx],
+                             self.expires[idx] != 0, -self.expires[idx])
+        )
+
+        keep = [True] * len(self)
+        removed = 0
+
+        # (net, length, max_len, expires) of the ROAs that cover the
+        # current one.
+        ancestors = []
+        last_asn = None
+
+        for idx in order:
+            asn = self.asns[idx]
+            net = self._get_net(idx)
+            length = self.lengths[idx]
+            max_len = self.max_lens[idx]
+            expires = self.expires[idx]
+
+            if asn != last_asn:
+                ancestors = []
+                last_asn = asn
+
+            while ancestors:
+                anc_net, anc_length = ancestors[-1][0], ancestors[-1][1]
+                shift = bits - anc_length
+                if (anc_net >> shift) == (net >> shift):
+                    break
+                ancestors.pop()
+
+            if any(anc_max_len >= max_len and
+                   expires_after(anc_expires, expires)
+                   for _, _, anc_max_len, anc_expires in ancestors):
+                keep[idx] = False
+                removed += 1
+                continue
+
+            ancestors.append((net, length, max_len, expires))
+
+        if removed:
+            self._keep(keep)
+
+        return removed
+
+    def __iter__(self):
+        self.sort()
+
+        for prefix, length, max_len, asn, expires in zip(
+                self.prefixes, self.lengths, self.max_lens, self.asns,
+                self.expires):
+            yield ROA(prefix, length, max_len, asn, expires or None)
+
+class ROATable(object):
+    """Compact table of RPKI ROAs.
+
+    Prefix, prefix length, max length, origin ASN and expiry time
+    of the ROAs are kept in typed arrays, one set of arrays for
+    each address family, that take a fraction of the memory needed
+    by a dict for each ROA.
+
+    Iterating over the table yields a :data:`ROA` named tuple for each
+    ROA, used by the templates::
+
+        ROA(prefix="<ip>/<len>", length=<len>, max_len=<max_len>,
+            asn=<asn>, expires=<unix timestamp> or None)
+
+    ROAs are sorted by prefix length, prefix and origin ASN. They are
+    sorted only once, by :meth:`sort` or by the first iteration after
+    the last ROA has been added.
+    """
+
+    def __init__(self):
+        self.families = {
+            4: _ROAFamilyTable(4),
+            6: _ROAFamilyTable(6)
+        }
+
+    def add(self, ip_ver, net, length, max_len, asn, expires=None):
+        """Add a ROA.
+
+        Args:
+            ip_ver (int): the IP version of its prefix.
+
+            net (int): the network address of its prefix.
+
+            length (int): the length of its prefix.
+
+            max_len (int): its max length.
+
+            asn (int): the authorized origin ASN.
+
+            expires (int): its expiry time (unix timestamp), or None.
+        """
+        self.families[ip_ver].add(net, length, max_len, asn, expires)
+
+    def sort(self):
+        for family in self.families.values():
+            family.sort()
+
+    def compress(self):
+        """Remove the ROAs that are redundant.
+
+        A ROA is redundant when a ROA for the same ASN, that does not
+        expire before it, covers its prefix and all the lengths up to
+        its max length. Removing it does not change the outcome of
+        the validation of any route.
+
+        Returns the number of ROAs that have been removed.
+        """
+        return sum(family.compress() for family in self.families.values())
+
+    def __len__(self):
+        return sum(len(family) for family in self.families.values())
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def iter_roas(self, ip_ver=None):
+        """ROAs of the given address family, or all of them if None."""
+        if ip_ver is not None:
+            return iter(self.families[ip_ver])
+
+        if not self.families[6]:
+            return iter(self.families[4])
+        if not self.families[4]:
+            return iter(self.families[6])
+        return heapq.merge(self.families[4], self.families[6],
+                           key=_get_roa_sort_key)
+
+    def __iter__(self):
+        return self.iter_roas()
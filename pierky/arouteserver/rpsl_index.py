@@ -0,0 +1,512 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import glob
+import gzip
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from .errors import IRRDumpsError
+from .irr_expander import IRR_SETS_MEMO
+from .irrd_client import IRRdClient
+
+
+ASN_RE = re.compile("^AS([0-9]+)$")
+
+SET_CLASSES = ("as-set", "route-set")
+ROUTE_CLASSES = ("route", "route6")
+
+def open_rpsl_dump(path):
+    """Open the file in text mode; gzip files are decompressed
+    while they are read."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+def iter_rpsl_objects(f, classes=SET_CLASSES + ROUTE_CLASSES):
+    """Parse RPSL objects from a file, one at a time.
+
+    Yields (class, key, attributes) for the objects of the given
+    classes, where attributes is a dict { "<name>": ["<value>", ...] }.
+    Comments are removed and continuation lines are joined to the
+    value of the attribute they belong to.
+    """
+    obj_class = None
+    attrs = None
+    last_attr = None
+
+    def build():
+        return obj_class, attrs[obj_class][0], attrs
+
+    for line in f:
+        line = line.rstrip("\n")
+
+        if not line.strip():
+            if obj_class:
+                yield build()
+            obj_class = None
+            attrs = None
+            last_attr = None
+            continue
+
+        if line[0] in ("%", "#"):
+            continue
+
+        if line[0] in (" ", "\t", "+"):
+            # Continuation line.
+            if attrs is not None and last_attr:
+                value = line[1:].split("#", 1)[0].strip()
+                if value:
+                    attrs[last_attr][-1] += " " + value
+            continue
+
+        if attrs is None:
+            # First line of the object: its class.
+            attrs = {}
+            name = line.partition(":")[0].strip().lower()
+            if name not in classes:
+                # Not interesting: all its lines are skipped.
+                continue
+            obj_class = name
+
+        if obj_class is None:
+            continue
+
+        name, sep, value = line.partition(":")
+        if not sep:
+            continue
+        last_attr = name.strip().lower()
+        attrs.setdefault(last_attr, []).append(
+            value.split("#", 1)[0].strip()
+        )
+
+    if obj_class:
+        yield build()
+
+def split_values(values):
+    res = []
+    for value in values or []:
+        res.extend(_ for _ in re.split(r"[\s,]+", value) if _)
+    return res
+
+class RPSLDumpIndex(object):
+    """On-disk index of the objects found in RPSL dump files.
+
+    Members of as-set and route-set objects, origins of route and
+    route6 objects and their maintainers are stored in a SQLite
+    database, so that IRR objects can be expanded without querying
+    any IRRd server. Dumps are read in streaming; when the index is
+    updated, only the dumps whose size or modification time changed
+    are loaded again.
+
+    The content of each set and the route objects of each origin
+    (for each IP version) are summarized by a digest: when a dump is
+    loaded again, the sets and the origins whose digest changed are
+    recorded along with a generation number, which is increased at
+    every update. This allows to tell whether the objects from which
+    an IRR bundle has been expanded changed since then.
+    """
+
+    DB_FILENAME = "irr_dumps.sqlite3"
+
+    # Number of rows inserted at once while loading a dump.
+    BATCH_SIZE = 10000
+
+    def __init__(self, cache_dir):
+        self.db_path = os.path.join(cache_dir, self.DB_FILENAME)
+        self._local = threading.local()
+
+        # { <since>: <changed keys> }, for the current generation.
+        self._changes_lock = threading.Lock()
+        self._changes = {}
+        self._changes_generation = None
+
+    def _get_conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS dumps ("
+                    "  path TEXT PRIMARY KEY,"
+                    "  size INTEGER NOT NULL,"
+                    "  mtime_ns INTEGER NOT NULL,"
+                    "  loaded_at INTEGER NOT NULL,"
+                    "  objects INTEGER NOT NULL"
+                    ")"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sets ("
+                    "  dump TEXT NOT NULL,"
+                    "  source TEXT NOT NULL,"
+                    "  name TEXT NOT NULL,"
+                    "  members TEXT NOT NULL,"
+                    "  mntners TEXT NOT NULL"
+                    ")"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS routes ("
+                    "  dump TEXT NOT NULL,"
+                    "  source TEXT NOT NULL,"
+                    "  origin INTEGER NOT NULL,"
+                    "  ip_ver INTEGER NOT NULL,"
+                    "  prefix TEXT NOT NULL,"
+                    "  mntners TEXT NOT NULL"
+                    ")"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS digests ("
+                    "  dump TEXT NOT NULL,"
+                    "  kind TEXT NOT NULL,"
+                    "  key TEXT NOT NULL,"
+                    "  digest INTEGER NOT NULL"
+                    ")"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS changes ("
+                    "  kind TEXT NOT NULL,"
+                    "  key TEXT NOT NULL,"
+                    "  generation INTEGER NOT NULL,"
+                    "  PRIMARY KEY (kind, key)"
+                    ")"
+                )
+                for table, columns in (("sets", "name"),
+                                       ("sets", "dump"),
+                                       ("routes", "origin, ip_ver"),
+                                       ("routes", "dump"),
+                                       ("digests", "dump"),
+                                       ("changes", "generation")):
+                    conn.execute(
+                        "CREATE INDEX IF NOT EXISTS {table}_{name} "
+                        "ON {table} ({columns})".format(
+                            table=table, columns=columns,
+                            name=columns.replace(", ", "_")
+                        )
+                    )
+        except sqlite3.Error as e:
+            raise IRRDumpsError(
+                "Error while opening the IRR dumps index {}: {}".format(
+                    self.db_path, str(e)
+                )
+            )
+
+        self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _iter_rows(path, f, stats):
+        for obj_class, key, attrs in iter_rpsl_objects(f):
+            source = (attrs.get("source") or [""])[0].upper()
+            mntners = " ".join(split_values(attrs.get("mnt-by")))
+
+            stats["objects"] += 1
+
+            if obj_class in SET_CLASSES:
+                members = split_values(attrs.get("members")) + \
+                    split_values(attrs.get("mp-members"))
+                yield "sets", (path, source, key.upper(),
+                               " ".join(members), mntners)
+                continue
+
+            origin = ASN_RE.match(
+                (attrs.get("origin") or [""])[0].upper()
+            )
+            if not origin:
+                continue
+            yield "routes", (path, source, int(origin.group(1)),
+                             6 if ":" in key else 4, key, mntners)
+
+    @staticmethod
+    def _add_digest(digests, table, row):
+        """Add the row to the digest of its set or origin.
+
+        Digests are the sum of the hashes of the rows, so that they
+        don't depend on the order of the objects within the dump.
+        Maintainers don't affect the expansion of the objects.
+        """
+        if table == "sets":
+            _, source, name, members, _ = row
+            key = ("set", name)
+            data = "{} {}".format(source, members)
+        else:
+            _, source, origin, ip_ver, prefix, _ = row
+            key = ("origin", "{}:{}".format(origin, ip_ver))
+            data = "{} {}".format(source, prefix)
+
+        row_hash = int.from_bytes(
+            hashlib.blake2b(data.encode("utf-8"), digest_size=8).digest(),
+            "big"
+        )
+        digests[key] = (digests.get(key, 0) + row_hash) % (2 ** 63)
+
+    @staticmethod
+    def _get_digests(conn, path):
+        return {
+            (kind, key): digest
+            for kind, key, digest in conn.execute(
+                "SELECT kind, key, digest FROM digests WHERE dump = ?",
+                (path,)
+            )
+        }
+
+    @staticmethod
+    def _get_generation(conn):
+        generation = conn.execute(
+            "SELECT MAX(generation) FROM changes"
+        ).fetchone()[0]
+        return generation or 0
+
+    def _record_changes(self, conn, old_digests, new_digests):
+        changed = [
+            key for key in set(old_digests) | set(new_digests)
+            if old_digests.get(key) != new_digests.get(key)
+        ]
+        if not changed:
+            return
+
+        generation = self._get_generation(conn) + 1
+        conn.executemany(
+            "INSERT OR REPLACE INTO changes VALUES (?, ?, ?)",
+            [(kind, key, generation) for kind, key in changed]
+        )
+
+    def _load_dump(self, conn, path, st):
+        start_time = time.time()
+        stats = {"objects": 0}
+
+        queries = {
+            "sets": "INSERT INTO sets VALUES (?, ?, ?, ?, ?)",
+            "routes": "INSERT INTO routes VALUES (?, ?, ?, ?, ?, ?)",
+        }
+
+        with conn:
+            old_digests = self._get_digests(conn, path)
+
+            conn.execute("DELETE FROM sets WHERE dump = ?", (path,))
+            conn.execute("DELETE FROM routes WHERE dump = ?", (path,))
+            conn.execute("DELETE FROM digests WHERE dump = ?", (path,))
+
+            digests = {}
+            batches = {table: [] for table in queries}
+            with open_rpsl_dump(path) as f:
+                for table, row in self._iter_rows(path, f, stats):
+                    self._add_digest(digests, table, row)
+                    batches[table].append(row)
+                    if len(batches[table]) >= self.BATCH_SIZE:
+                        conn.executemany(queries[table], batches[table])
+                        batches[table] = []
+            for table, rows in batches.items():
+                if rows:
+                    conn.executemany(queries[table], rows)
+
+            conn.executemany(
+                "INSERT INTO digests VALUES (?, ?, ?, ?)",
+                [(path, kind, key, digest)
+                 for (kind, key), digest in digests.items()]
+            )
+            self._record_changes(conn, old_digests, digests)
+
+            conn.execute(
+                "INSERT OR REPLACE INTO dumps VALUES (?, ?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime_ns, int(time.time()),
+                 stats["objects"])
+            )
+
+        logging.info("IRR dump {} loaded: {} objects in {:.1f} "
+                     "seconds".format(path, stats["objects"],
+                                      time.time() - start_time))
+
+    @staticmethod
+    def get_paths(dumps):
+        paths = []
+        for pattern in dumps or []:
+            matches = sorted(glob.glob(os.path.expanduser(pattern)))
+            if not matches:
+                raise IRRDumpsError(
+                    "No IRR dump files found at {}".format(pattern)
+                )
+            paths.extend(os.path.abspath(path) for path in matches)
+        return paths
+
+    def update(self, dumps):
+        """Load the dumps that changed since the last update.
+
+        The objects of the dumps that are no longer in the list
+        are removed from the index.
+        """
+        paths = self.get_paths(dumps)
+
+        conn = self._get_conn()
+
+        try:
+            loaded = {
+                path: (size, mtime_ns)
+                for path, size, mtime_ns in conn.execute(
+                    "SELECT path, size, mtime_ns FROM dumps"
+                )
+            }
+
+            for path in set(loaded) - set(paths):
+                logging.info("Removing the objects of the IRR dump {} "
+                             "from the index".format(path))
+                with conn:
+                    old_digests = self._get_digests(conn, path)
+                    for table in ("sets", "routes", "digests"):
+                        conn.execute(
+                            "DELETE FROM {} WHERE dump = ?".format(table),
+                            (path,)
+                        )
+                    conn.execute("DELETE FROM dumps WHERE path = ?",
+                                 (path,))
+                    self._record_changes(conn, old_digests, {})
+
+            for path in paths:
+                st = os.stat(path)
+                if loaded.get(path) == (st.st_size, st.st_mtime_ns):
+                    logging.debug("IRR dump {} not changed".format(path))
+                    continue
+                self._load_dump(conn, path, st)
+        except (OSError, sqlite3.Error) as e:
+            raise IRRDumpsError(
+                "Error while updating the IRR dumps index {}: {}".format(
+                    self.db_path, str(e)
+                )
+            )
+
+    def get_generation(self):
+        """Generation of the index: it's increased by the updates
+        that change any set or origin."""
+        try:
+            return self._get_generation(self._get_conn())
+        except sqlite3.Error as e:
+            raise IRRDumpsError(
+                "Error while reading the IRR dumps index {}: {}".format(
+                    self.db_path, str(e)
+                )
+            )
+
+    def get_changes(self, since):
+        """Sets and origins changed after the given generation.
+
+        Returns { "set": set(<name>), "origin": set("<asn>:<ip_ver>") }.
+        """
+        try:
+            conn = self._get_conn()
+            generation = self._get_generation(conn)
+
+            with self._changes_lock:
+                if self._changes_generation != generation:
+                    self._changes = {}
+                    self._changes_generation = generation
+                if since in self._changes:
+                    return self._changes[since]
+
+            changes = {"set": set(), "origin": set()}
+            for kind, key in conn.execute(
+                "SELECT kind, key FROM changes WHERE generation > ?",
+                (since,)
+            ):
+                changes[kind].add(key)
+        except sqlite3.Error as e:
+            raise IRRDumpsError(
+                "Error while reading the IRR dumps index {}: {}".format(
+                    self.db_path, str(e)
+                )
+            )
+
+        with self._changes_lock:
+            if self._changes_generation == generation:
+                self._changes[since] = changes
+        return changes
+
+    def get_set_members(self, name, sources):
+        """Members of the set, from the first source that has it.
+
+        None if the set is not found.
+        """
+        rows = self._get_conn().execute(
+            "SELECT source, members FROM sets WHERE name = ?",
+            (name.upper(),)
+        ).fetchall()
+
+        by_source = {source: members for source, members in rows}
+        for source in sources:
+            if source in by_source:
+                return by_source[source].split()
+        return None
+
+    def get_origin_prefixes(self, asn, ip_ver, sources):
+        rows = self._get_conn().execute(
+            "SELECT DISTINCT prefix FROM routes "
+            "WHERE origin = ? AND ip_ver = ? AND source IN ({})".format(
+                ", ".join("?" * len(sources))
+            ),
+            [asn, ip_ver] + list(sources)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_rpsl_dump_index(cache_dir):
+    with _indexes_lock:
+        if cache_dir not in _indexes:
+            _indexes[cache_dir] = RPSLDumpIndex(cache_dir)
+        return _indexes[cache_dir]
+
+class RPSLDumpClient(IRRdClient):
+    """Same interface of :class:`IRRdClient`, but queries are
+    answered using the objects of an :class:`RPSLDumpIndex`."""
+
+    def __init__(self, index, memo=IRR_SETS_MEMO):
+        self.index = index
+        self.memo = memo
+
+    def _query(self, query, sources):
+        if query.startswith("!i"):
+            return self.index.get_set_members(query[2:], sources)
+
+        if query.startswith("!g") or query.startswith("!6"):
+            match = ASN_RE.match(query[2:].upper())
+            if match:
+                return self.index.get_origin_prefixes(
+                    int(match.group(1)), 4 if query[1] == "g" else 6,
+                    sources
+                )
+            return None
+
+        raise IRRDumpsError("Unsupported query: {}".format(query))
+
+    def query(self, queries, sources):
+        sources = [source.strip().upper()
+                   for source in sources.split(",") if source.strip()]
+        try:
+            return [self._query(query, sources) for query in queries]
+        except sqlite3.Error as e:
+            raise IRRDumpsError(
+                "Error while querying the IRR dumps index {}: {}".format(
+                    self.index.db_path, str(e)
+                )
+            )
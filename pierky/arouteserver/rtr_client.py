@@ -0,0 +1,609 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+import ipaddress
+import logging
+import os
+import re
+import socket
+import struct
+import time
+
+from .cache_backends import write_atomically
+from .cache_serializers import get_cache_serializer, deserialize
+from .errors import RTRClientError
+
+
+# RFC 8210 (version 1) and RFC 6810 (version 0).
+SUPPORTED_VERSIONS = (1, 0)
+
+SERIAL_NOTIFY = 0
+SERIAL_QUERY = 1
+RESET_QUERY = 2
+CACHE_RESPONSE = 3
+IPV4_PREFIX = 4
+IPV6_PREFIX = 6
+END_OF_DATA = 7
+CACHE_RESET = 8
+ROUTER_KEY = 9
+ERROR_REPORT = 10
+# draft-ietf-sidrops-8210bis
+ASPA = 11
+
+# Error codes of the Error Report PDU.
+ERR_UNSUPPORTED_VERSION = 4
+
+ERROR_CODES = {
+    0: "Corrupt Data",
+    1: "Internal Error",
+    2: "No Data Available",
+    3: "Invalid Request",
+    4: "Unsupported Protocol Version",
+    5: "Unsupported PDU Type",
+    6: "Withdrawal of Unknown Record",
+    7: "Duplicate Announcement Received",
+    8: "Unexpected Protocol Version",
+}
+
+HEADER = struct.Struct("!BBHI")
+SERIAL = struct.Struct("!I")
+IPV4_PREFIX_BODY = struct.Struct("!BBBxII")
+IPV6_PREFIX_BODY = struct.Struct("!BBBx16sI")
+END_OF_DATA_V1_BODY = struct.Struct("!IIII")
+
+# PDUs longer than this are considered corrupt.
+MAX_PDU_LEN = 65536
+
+# Used when the server does not tell how long data can be
+# kept (RFC 6810), and default value of RFC 8210.
+DEFAULT_EXPIRE_INTERVAL = 7200
+
+class _UnsupportedVersion(Exception):
+    pass
+
+def parse_rtr_server(server):
+    """Split 'host:port' or '[IPv6 address]:port' into (host, port)."""
+    match = re.match(r"^\[([^\]]+)\]:(\d+)$", server) or \
+        re.match(r"^([^:\[\]]+):(\d+)$", server)
+    if not match or not 0 < int(match.group(2)) < 65536:
+        raise RTRClientError(
+            "Invalid RTR server '{}': it must be in the "
+            "'host:port' format, or '[address]:port' for "
+            "IPv6 addresses.".format(server)
+        )
+    return match.group(1), int(match.group(2))
+
+def _get_vrp_key(net, length, max_len, asn):
+    return (net << 48) | (length << 40) | (max_len << 32) | asn
+
+def _parse_vrp_key(key):
+    return (key >> 48, (key >> 40) & 0xFF, (key >> 32) & 0xFF,
+            key & 0xFFFFFFFF)
+
+class RTRConnection(object):
+    """A session with an RTR server, using one version of the protocol.
+
+    The number of bytes received is kept in received_bytes.
+    """
+
+    def __init__(self, host, port, version, timeout):
+        self.host = host
+        self.port = port
+        self.version = version
+
+        try:
+            self.sock = socket.create_connection((host, port), timeout)
+        except OSError as e:
+            raise RTRClientError(
+                "Can't connect to the RTR server {}:{}: {}".format(
+                    host, port, str(e)
+                )
+            )
+        self.f = self.sock.makefile("rb")
+
+        self.received_bytes = 0
+
+    def close(self):
+        self.f.close()
+        self.sock.close()
+
+    def send(self, pdu_type, field, body=b""):
+        pdu = HEADER.pack(self.version, pdu_type, field,
+                          HEADER.size + len(body)) + body
+        try:
+            self.sock.sendall(pdu)
+        except OSError as e:
+            raise RTRClientError(
+                "Error while sending data to the RTR server: {}".format(str(e))
+            )
+
+    def _read(self, size):
+        try:
+            data = self.f.read(size)
+        except OSError as e:
+            raise RTRClientError(
+                "Error while reading data from the RTR server: {}".format(
+                    str(e)
+                )
+            )
+        if len(data) != size:
+            raise RTRClientError(
+                "The RTR server closed the connection unexpectedly"
+            )
+        self.received_bytes += size
+        return data
+
+    def read_pdu(self):
+        """Return (pdu_type, header field, body) of the next PDU."""
+        version, pdu_type, field, length = HEADER.unpack(
+            self._read(HEADER.size)
+        )
+        if not HEADER.size <= length <= MAX_PDU_LEN:
+            raise RTRClientError(
+                "Invalid length of PDU type {} "
+                "received from the RTR server: {}".format(pdu_type, length)
+            )
+        body = self._read(length - HEADER.size)
+
+        if pdu_type == ERROR_REPORT:
+            self._raise_error_report(field, body)
+
+        if version != self.version:
+            if version < self.version:
+                # The server only speaks an older version.
+                raise _UnsupportedVersion()
+            raise RTRClientError(
+                "The RTR server replied using version {} of "
+                "the protocol instead of {}".format(version, self.version)
+            )
+
+        return pdu_type, field, body
+
+    @staticmethod
+    def _raise_error_report(code, body):
+        if code == ERR_UNSUPPORTED_VERSION:
+            raise _UnsupportedVersion()
+
+        text = ""
+        try:
+            pdu_len = SERIAL.unpack_from(body)[0]
+            text_len = SERIAL.unpack_from(body, 4 + pdu_len)[0]
+            text_start = 4 + pdu_len + 4
+            text = body[text_start:text_start + text_len].decode("utf-8")
+        except (struct.error, UnicodeDecodeError):
+            pass
+
+        raise RTRClientError(
+            "The RTR server returned an error: {}{}".format(
+                ERROR_CODES.get(code, "code {}".format(code)),
+                " - {}".format(text) if text else ""
+            )
+        )
+
+class RTRClient(object):
+    """Client of the RPKI to Router protocol (RFC 8210 and RFC 6810).
+
+    :meth:`sync` updates an :class:`RTRState` with the VRPs of the
+    server: when the state already holds the data of a session with
+    the server, only the changes since its serial number are
+    requested (Serial Query), otherwise the full set of VRPs is
+    fetched (Reset Query).
+
+    Version 1 of the protocol is used, unless the server only
+    supports version 0.
+    """
+
+    DEFAULT_TIMEOUT = 30
+
+    def __init__(self, host, port, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+        # Bytes received during the last sync.
+        self.received_bytes = 0
+
+    def sync(self, state):
+        """Update the state; return True if it was an incremental update."""
+        self.received_bytes = 0
+
+        for version in SUPPORTED_VERSIONS:
+            try:
+                return self._sync(state, version)
+            except _UnsupportedVersion:
+                logging.debug(
+                    "RTR server {}:{} does not support version {} "
+                    "of the protocol".format(self.host, self.port, version)
+                )
+
+        raise RTRClientError(
+            "The RTR server {}:{} does not support any of the "
+            "versions of the protocol implemented here ({})".format(
+                self.host, self.port,
+                ", ".join(map(str, SUPPORTED_VERSIONS))
+            )
+        )
+
+    @contextmanager
+    def _connect(self, version):
+        conn = RTRConnection(self.host, self.port, version, self.timeout)
+        try:
+            yield conn
+        finally:
+            self.received_bytes += conn.received_bytes
+            conn.close()
+
+    def _sync(self, state, version):
+        with self._connect(version) as conn:
+            if state.session_id is not None and state.version == version:
+                conn.send(SERIAL_QUERY, state.session_id,
+                          SERIAL.pack(state.serial))
+
+                res = self._read_data(conn)
+                if res is None:
+                    logging.info("RTR server {}:{}: cache reset, all the "
+                                 "VRPs will be fetched again".format(
+                                     self.host, self.port))
+                elif res[0] != state.session_id:
+                    logging.info("RTR server {}:{}: session ID changed, all "
+                                 "the VRPs will be fetched again".format(
+                                     self.host, self.port))
+                elif not state.apply_delta(res[2]):
+                    logging.warning("RTR server {}:{}: the changes received "
+                                    "are not consistent with the local VRPs, "
+                                    "all the VRPs will be fetched again".format(
+                                        self.host, self.port))
+                else:
+                    state.set_end_of_data(version, res[0], res[1])
+                    return True
+
+            conn.send(RESET_QUERY, 0)
+
+            res = self._read_data(conn)
+            if res is None:
+                raise RTRClientError(
+                    "The RTR server {}:{} replied with a Cache Reset "
+                    "to a Reset Query".format(self.host, self.port)
+                )
+
+            session_id, end_of_data, changes = res
+            if any(not announced for announced, _, _ in changes):
+                raise RTRClientError(
+                    "The RTR server {}:{} sent a withdrawal in "
+                    "response to a Reset Query".format(self.host, self.port)
+                )
+
+            state.set_vrps(changes)
+            state.set_end_of_data(version, session_id, end_of_data)
+            return False
+
+    def _read_data(self, conn):
+        """Read the response to a query.
+
+        Return None if the server replied with a Cache Reset,
+        otherwise (session ID, end of data info, changes), where
+        changes is a list of (announced, ip_ver, VRP key).
+        """
+        session_id = None
+        changes = []
+
+        while True:
+            pdu_type, field, body = conn.read_pdu()
+
+            if pdu_type in (SERIAL_NOTIFY, ROUTER_KEY, ASPA):
+                # Not relevant here.
+                continue
+
+            if pdu_type == CACHE_RESET and session_id is None:
+                return None
+
+            if pdu_type == CACHE_RESPONSE and session_id is None:
+                session_id = field
+                continue
+
+            if session_id is None:
+                raise RTRClientError(
+                    "Unexpected PDU type {} received from the RTR "
+                    "server {}:{} before the Cache Response".format(
+                        pdu_type, self.host, self.port
+                    )
+                )
+
+            try:
+                if pdu_type == IPV4_PREFIX:
+                    flags, length, max_len, net, asn = \
+                        IPV4_PREFIX_BODY.unpack(body)
+                    ip_ver = 4
+                elif pdu_type == IPV6_PREFIX:
+                    flags, length, max_len, net, asn = \
+                        IPV6_PREFIX_BODY.unpack(body)
+                    net = int.from_bytes(net, "big")
+                    ip_ver = 6
+                elif pdu_type == END_OF_DATA:
+                    if field != session_id:
+                        raise RTRClientError(
+                            "The session ID of the End of Data PDU received "
+                            "from the RTR server {}:{} doesn't match the "
+                            "one of the Cache Response".format(
+                                self.host, self.port
+                            )
+                        )
+                    if conn.version == 0:
+                        serial = SERIAL.unpack(body)[0]
+                        expire = DEFAULT_EXPIRE_INTERVAL
+                    else:
+                        serial, _, _, expire = END_OF_DATA_V1_BODY.unpack(body)
+                    return session_id, (serial, expire), changes
+                else:
+                    raise RTRClientError(
+                        "Unexpected PDU type {} received from the "
+                        "RTR server {}:{}".format(pdu_type, self.host,
+                                                  self.port)
+                    )
+            except struct.error:
+                raise RTRClientError(
+                    "Invalid PDU type {} received from the RTR "
+                    "server {}:{}".format(pdu_type, self.host, self.port)
+                )
+
+            bits = 32 if ip_ver == 4 else 128
+            if not length <= max_len <= bits:
+                raise RTRClientError(
+                    "Invalid prefix length/max length {}/{} received from "
+                    "the RTR server {}:{}".format(length, max_len,
+                                                  self.host, self.port)
+                )
+
+            changes.append((bool(flags & 1), ip_ver,
+                            _get_vrp_key(net, length, max_len, asn)))
+
+class RTRState(object):
+    """VRPs received from an RTR server, with the info of the session.
+
+    VRPs are kept in one set for each address family, encoded as
+    integers that hold prefix, length, max length and origin ASN:
+    they are saved to and loaded from a file using the binary cache
+    serializer.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, server):
+        self.server = server
+
+        self.version = None
+        self.session_id = None
+        self.serial = None
+        self.expire = DEFAULT_EXPIRE_INTERVAL
+        self.last_update = None
+
+        self.vrps = {4: set(), 6: set()}
+
+    def __len__(self):
+        return len(self.vrps[4]) + len(self.vrps[6])
+
+    @classmethod
+    def load(cls, path, server):
+        """Load the state from the file, or return an empty one."""
+        state = cls(server)
+
+        if not os.path.exists(path):
+            return state
+
+        try:
+            with open(path, "rb") as f:
+                data = deserialize(f.read())
+
+            if data["format_version"] != cls.FORMAT_VERSION:
+                raise ValueError("format version {} not supported".format(
+                    data["format_version"]))
+        except Exception as e:
+            logging.warning("The RTR state file {} can't be used, all the "
+                            "VRPs will be fetched again: {}".format(path, str(e)))
+            return state
+
+        if data["server"] != server:
+            # The server has been changed.
+            return state
+
+        state.version = data["version"]
+        state.session_id = data["session_id"]
+        state.serial = data["serial"]
+        state.expire = data["expire"]
+        state.last_update = data["last_update"]
+        state.vrps = {4: data["vrps4"], 6: data["vrps6"]}
+        return state
+
+    def save(self, path):
+        """Write the state to the file and return its size."""
+        data = {
+            "format_version": self.FORMAT_VERSION,
+            "server": self.server,
+            "version": self.version,
+            "session_id": self.session_id,
+            "serial": self.serial,
+            "expire": self.expire,
+            "last_update": self.last_update,
+            "vrps4": self.vrps[4],
+            "vrps6": self.vrps[6],
+        }
+        raw = get_cache_serializer("binary").dumps(data)
+        try:
+            write_atomically(path, raw)
+        except OSError as e:
+            raise RTRClientError(
+                "Error while saving the RTR state file {}: {}".format(
+                    path, str(e)
+                )
+            )
+        return len(raw)
+
+    def set_vrps(self, changes):
+        self.vrps = {4: set(), 6: set()}
+        for _, ip_ver, key in changes:
+            self.vrps[ip_ver].add(key)
+
+    def apply_delta(self, changes):
+        """Apply the changes; False if they are not consistent.
+
+        Changes are applied all or none: if one of them announces
+        a VRP that is already known or withdraws one that is not,
+        the state is left unchanged.
+        """
+        applied = []
+        consistent = True
+
+        for announced, ip_ver, key in changes:
+            vrps = self.vrps[ip_ver]
+            if announced == (key in vrps):
+                consistent = False
+                break
+            if announced:
+                vrps.add(key)
+            else:
+                vrps.remove(key)
+            applied.append((announced, vrps, key))
+
+        if not consistent:
+            for announced, vrps, key in reversed(applied):
+                if announced:
+                    vrps.remove(key)
+                else:
+                    vrps.add(key)
+
+        return consistent
+
+    def set_end_of_data(self, version, session_id, end_of_data):
+        self.version = version
+        self.session_id = session_id
+        self.serial, self.expire = end_of_data
+        self.last_update = int(time.time())
+
+    def is_expired(self):
+        """True if data is older than the expire interval of the server."""
+        return self.last_update is None or \
+            self.last_update + self.expire < time.time()
+
+    def iter_roas(self):
+        """ROAs in the same format of the RIPE RPKI Validator cache."""
+        for ip_ver, ip_class in ((4, ipaddress.IPv4Address),
+                                 (6, ipaddress.IPv6Address)):
+            for key in self.vrps[ip_ver]:
+                net, length, max_len, asn = _parse_vrp_key(key)
+                yield {
+                    "prefix": "{}/{}".format(ip_class(net).compressed, length),
+                    "maxLength": max_len,
+                    "asn": "AS{}".format(asn)
+                }
+
+class RTR_RPKI_ROAs(object):
+    """RPKI ROAs fetched from a local RTR server.
+
+    The VRPs are kept in a state file within the cache directory,
+    so that at every run only the changes since the previous one
+    are requested to the server. When the server can't be reached,
+    the data from the state file is used, as long as it's not older
+    than the expire interval set by the server.
+    """
+
+    def __init__(self, cache_dir, server, cache_backend=None,
+                 timeout=RTRClient.DEFAULT_TIMEOUT):
+        self.cache_dir = cache_dir
+        self.server = server
+        self.cache_backend = cache_backend
+        self.timeout = timeout
+
+        self.host, self.port = parse_rtr_server(server)
+
+        self.state = None
+
+        # Same meaning of the CachedObject's attributes: from_cache
+        # is True when the server can't be reached and the data from
+        # the state file is used.
+        self.from_cache = False
+        self.cache_entry_size = 0
+
+    # Used by the cache garbage collector too.
+    STATE_FILES_PATTERN = "rtr-client-*.state"
+
+    def _get_state_filename(self):
+        return "rtr-client-{}-{}.state".format(
+            re.sub(r"[^\w.-]", "_", self.host), self.port
+        )
+
+    def _get_state_path(self):
+        return os.path.join(self.cache_dir, self._get_state_filename())
+
+    def _lock(self):
+        if self.cache_backend is None:
+            @contextmanager
+            def dummy():
+                yield
+            return dummy()
+        return self.cache_backend.lock(self._get_state_filename())
+
+    def load_data(self):
+        logging.debug("Loading RPKI ROAs from the RTR server {}...".format(
+            self.server))
+
+        with self._lock():
+            path = self._get_state_path()
+            state = RTRState.load(path, self.server)
+
+            client = RTRClient(self.host, self.port, self.timeout)
+            try:
+                incremental = client.sync(state)
+            except RTRClientError as e:
+                if state.is_expired():
+                    raise RTRClientError(
+                        "Can't get RPKI ROAs from the RTR server {}, and "
+                        "no recent local copy is available: {}".format(
+                            self.server, str(e)
+                        )
+                    )
+
+                # Changes are applied to the state only when they
+                # have been completely received.
+                self.from_cache = True
+                try:
+                    self.cache_entry_size = os.path.getsize(path)
+                except OSError:
+                    self.cache_entry_size = 0
+                logging.warning(
+                    "Can't get RPKI ROAs from the RTR server {}, the "
+                    "local copy of the data received at {} will be "
+                    "used: {}".format(
+                        self.server,
+                        time.strftime("%Y-%m-%d %H:%M:%S UTC",
+                                      time.gmtime(state.last_update)),
+                        str(e)
+                    )
+                )
+            else:
+                logging.info(
+                    "RPKI ROAs: {} update from the RTR server {}, "
+                    "serial {}, {} bytes received".format(
+                        "incremental" if incremental else "full",
+                        self.server, state.serial, client.received_bytes
+                    )
+                )
+                if os.path.isdir(self.cache_dir):
+                    self.cache_entry_size = state.save(path)
+
+        self.state = state
+
+    def iter_roas(self):
+        return self.state.iter_roas()
@@ -24,8 +24,7 @@ from pierky.arouteserver.arin_db_dump import ARINWhoisDBDump
 from pierky.arouteserver.registro_br_db_dump import RegistroBRWhoisDBDump
 from pierky.arouteserver.cached_objects import CachedObject
 from pierky.arouteserver.config.validators import ValidatorPrefixListEntry
-from pierky.arouteserver.enrichers.irrdb import IRRDBConfigEnricher_ASNs, \
-                                                IRRDBConfigEnricher_Prefixes
+from pierky.arouteserver.enrichers.irrdb import IRRDBConfigEnricher_Combined
 from pierky.arouteserver.enrichers.rtt import RTTGetterConfigEnricher
 from pierky.arouteserver.ipaddresses import IPNetwork
 from pierky.arouteserver.irrdb import ASSet, RSet
@@ -145,15 +144,14 @@ class MockedEnv(object):
                 if prefixes:
                     record.save("prefixes", prefixes)
 
-        mock_ASSet = mock.patch.object(
-            IRRDBConfigEnricher_ASNs, "enrich", autospec=True
-        ).start()
-        mock_ASSet.side_effect = _mock_ASSet
+        def _mock_Combined(self):
+            _mock_ASSet(self)
+            _mock_RSet(self)
 
-        mock_RSet = mock.patch.object(
-            IRRDBConfigEnricher_Prefixes, "enrich", autospec=True
+        mock_Combined = mock.patch.object(
+            IRRDBConfigEnricher_Combined, "enrich", autospec=True
         ).start()
-        mock_RSet.side_effect = _mock_RSet
+        mock_Combined.side_effect = _mock_Combined
 
     def do_mock_cached_objects(mocked_env):
 
@@ -281,8 +279,7 @@ class MockedEnv(object):
 
         - irrdb:
 
-          Mock IRRDBConfigEnricher_ASNs and IRRDBConfigEnricher_Prefixes
-          enrich() method.
+          Mock IRRDBConfigEnricher_Combined enrich() method.
 
           It uses base_inst.DATA, base_inst.AS_SET and base_inst.R_SET to
           read ASNs and prefixes and to save them into IRRDB records:
@@ -0,0 +1,211 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tempfile
+try:
+    import mock
+except ImportError:
+    import unittest.mock as mock
+import time
+import unittest
+
+from pierky.arouteserver.cache_backends import get_cache_backend
+from pierky.arouteserver.cache_gc import CacheGC
+from pierky.arouteserver.cached_objects import CachedObject
+from pierky.arouteserver.enrichers.irrdb import IRRDBTasksCosts
+
+
+class FakeCachedObject(CachedObject):
+
+    def __init__(self, name, data, **kwargs):
+        CachedObject.__init__(self, **kwargs)
+        self.name = name
+        self.data = data
+
+    def _get_object_filename(self):
+        return "fake_{}.json".format(self.name)
+
+    def _get_data(self):
+        return self.data
+
+
+class TestCacheGC_Base(unittest.TestCase):
+
+    __test__ = False
+
+    CACHE_BACKEND = None
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+        self.now = time.time()
+
+    def tearDown(self):
+        mock.patch.stopall()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def add_entry(self, name, size, age):
+        with mock.patch("time.time", return_value=self.now - age):
+            FakeCachedObject(
+                name, "x" * size, cache_dir=self.temp_dir,
+                cache_backend=self.CACHE_BACKEND
+            ).load_data()
+
+        if self.CACHE_BACKEND == "json":
+            path = os.path.join(self.temp_dir, "fake_{}.json".format(name))
+            os.utime(path, (self.now - age, self.now - age))
+
+    def get_keys(self):
+        backend = get_cache_backend(self.temp_dir, self.CACHE_BACKEND)
+        return sorted(entry.key for entry in backend.iter_entries())
+
+    def run_gc(self, **kwargs):
+        return CacheGC(self.temp_dir, cache_backend=self.CACHE_BACKEND,
+                       **kwargs).run()
+
+    def test_010_max_age(self):
+        """{}: entries not used recently are removed"""
+        self.add_entry("a", 10, 100)
+        self.add_entry("b", 10, 10000)
+
+        result = self.run_gc(max_age=1000)
+
+        self.assertEqual(self.get_keys(), ["fake_a.json"])
+        self.assertEqual(result.removed, 1)
+        self.assertGreaterEqual(result.removed_bytes, 10)
+
+    def test_020_max_size(self):
+        """{}: least recently used entries removed to fit the budget"""
+        self.add_entry("a", 1000, 300)
+        self.add_entry("b", 1000, 100)
+        self.add_entry("c", 1000, 200)
+
+        self.run_gc(max_size=2500)
+
+        self.assertEqual(self.get_keys(), ["fake_b.json", "fake_c.json"])
+
+    def test_030_dry_run(self):
+        """{}: dry run"""
+        self.add_entry("a", 10, 10000)
+
+        result = self.run_gc(max_age=1000, dry_run=True)
+
+        self.assertEqual(self.get_keys(), ["fake_a.json"])
+        self.assertEqual(result.removed, 1)
+        self.assertIn("would remove 1 objects", result.to_text())
+
+    def test_040_access_time(self):
+        """{}: loaded entries are not removed"""
+        self.add_entry("a", 10, 10000)
+        self.add_entry("b", 10, 10000)
+
+        obj = FakeCachedObject("a", "not used", cache_dir=self.temp_dir,
+                               cache_backend=self.CACHE_BACKEND,
+                               cache_expiry=100000)
+        obj.load_data()
+        self.assertTrue(obj.from_cache)
+
+        self.run_gc(max_age=1000)
+
+        self.assertEqual(self.get_keys(), ["fake_a.json"])
+
+    def test_050_whois_db_files(self):
+        """{}: Whois DB files and temporary files"""
+        db_dir = os.path.join(self.temp_dir, "arin_db")
+        os.mkdir(db_dir)
+        for name, age in (("AS1.json", 100), ("AS2.json", 10000),
+                          (".AS1.json.abc.tmp", 10000),
+                          (".AS3.json.abc.tmp", 10)):
+            path = os.path.join(db_dir, name)
+            with open(path, "w") as f:
+                f.write("[]")
+            os.utime(path, (self.now - age, self.now - age))
+
+        result = self.run_gc(max_age=1000)
+
+        self.assertEqual(sorted(os.listdir(db_dir)),
+                         [".AS3.json.abc.tmp", "AS1.json"])
+        self.assertEqual(result.kinds["whois_db_files"]["removed"], 1)
+        self.assertEqual(result.kinds["temp_files"]["removed"], 1)
+
+    def test_060_not_entries(self):
+        """{}: history of the IRRDB tasks costs is kept"""
+        self.add_entry("a", 10, 10000)
+        backend = get_cache_backend(self.temp_dir, self.CACHE_BACKEND)
+        with mock.patch("time.time", return_value=self.now - 10000):
+            backend.save(IRRDBTasksCosts.CACHE_KEY,
+                         {"ts": int(self.now - 10000), "data": {}})
+        path = os.path.join(self.temp_dir, IRRDBTasksCosts.CACHE_KEY)
+        if self.CACHE_BACKEND == "json":
+            os.utime(path, (self.now - 10000, self.now - 10000))
+
+        result = self.run_gc(max_age=1000)
+
+        self.assertEqual(self.get_keys(), [IRRDBTasksCosts.CACHE_KEY])
+        self.assertEqual(result.removed, 1)
+
+    def test_070_rtr_state_files(self):
+        """{}: RTR client state files"""
+        for name, age in (("rtr-client-a-323.state", 100),
+                          ("rtr-client-b-323.state", 10000)):
+            path = os.path.join(self.temp_dir, name)
+            with open(path, "w") as f:
+                f.write("{}")
+            os.utime(path, (self.now - age, self.now - age))
+
+        result = self.run_gc(max_age=1000)
+
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.temp_dir)
+                   if name.endswith(".state")),
+            ["rtr-client-a-323.state"]
+        )
+        self.assertEqual(result.kinds["rtr_state_files"]["removed"], 1)
+
+class TestCacheGC_JSON(TestCacheGC_Base):
+
+    __test__ = True
+
+    CACHE_BACKEND = "json"
+
+    SHORT_DESCR = "Cache GC, JSON"
+
+class TestCacheGC_SQLite(TestCacheGC_Base):
+
+    __test__ = True
+
+    CACHE_BACKEND = "sqlite"
+
+    SHORT_DESCR = "Cache GC, SQLite"
+
+    def test_100_compact(self):
+        """{}: database compacted"""
+        for name in ("a", "b", "c"):
+            self.add_entry(name, 100000, 10000)
+
+        def get_size():
+            return sum(
+                os.path.getsize(os.path.join(self.temp_dir, name))
+                for name in os.listdir(self.temp_dir)
+                if name.startswith("cache.sqlite3")
+            )
+
+        size_before = get_size()
+
+        self.run_gc(max_age=1000)
+
+        self.assertEqual(self.get_keys(), [])
+        self.assertLess(get_size(), size_before - 200000)
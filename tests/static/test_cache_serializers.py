@@ -0,0 +1,98 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import unittest
+
+from pierky.arouteserver.cache_serializers import CACHE_SERIALIZERS, \
+                                                  BinarySerializer, \
+                                                  CacheSerializer, \
+                                                  deserialize, \
+                                                  get_cache_serializer
+from pierky.arouteserver.cached_objects import normalize_serializers
+from pierky.arouteserver.errors import CachedObjectsError, \
+                                       CachedObjectsExpiryTimeConfigurationError
+
+
+class TestCacheSerializers(unittest.TestCase):
+
+    DATA = {
+        "ts": 1234567890,
+        "data": {
+            "roas": [
+                {"asn": "AS1", "prefix": "192.0.2.0/24", "maxLength": 24,
+                 "ta": "ripe", "expires": 1234567890},
+                {"asn": "AS2", "prefix": "2001:db8::/32", "maxLength": 48,
+                 "ta": "àèìòù"}
+            ]
+        },
+        "meta": None
+    }
+
+    def test_010_round_trip(self):
+        """Cache serializers: round trip"""
+        for name in CACHE_SERIALIZERS:
+            raw = get_cache_serializer(name).dumps(self.DATA)
+            self.assertIsInstance(raw, bytes)
+            self.assertEqual(deserialize(raw), self.DATA, name)
+
+    def test_020_legacy_json(self):
+        """Cache serializers: legacy JSON"""
+        self.assertEqual(deserialize(json.dumps(self.DATA)), self.DATA)
+        self.assertEqual(deserialize(json.dumps(self.DATA).encode("utf-8")),
+                         self.DATA)
+
+    def test_030_header(self):
+        """Cache serializers: versioned header"""
+        raw = get_cache_serializer("binary").dumps(self.DATA)
+        self.assertTrue(raw.startswith(CacheSerializer.MAGIC))
+
+        # Entry written using a different marshal version.
+        header = CacheSerializer.HEADER.pack(
+            CacheSerializer.MAGIC, CacheSerializer.HEADER_VERSION,
+            BinarySerializer.FORMAT_ID, BinarySerializer.FORMAT_VERSION + 1
+        )
+        with self.assertRaisesRegex(ValueError, "marshal format version"):
+            deserialize(header + raw[len(header):])
+
+        header = CacheSerializer.HEADER.pack(
+            CacheSerializer.MAGIC, CacheSerializer.HEADER_VERSION + 1, 0, 0
+        )
+        with self.assertRaisesRegex(ValueError, "header version"):
+            deserialize(header + raw[len(header):])
+
+    def test_040_config(self):
+        """Cache serializers: configuration"""
+        with self.assertRaisesRegex(CachedObjectsError, "Unknown cache serializer"):
+            get_cache_serializer("xml")
+
+        cfg = normalize_serializers("json-zlib")
+        self.assertEqual(cfg["ripe_rpki_roas"], "json-zlib")
+
+        cfg = normalize_serializers({"pdb_info": "binary"})
+        self.assertEqual(cfg["pdb_info"], "binary")
+        self.assertEqual(cfg["general"], "json")
+        self.assertEqual(cfg["ripe_rpki_roas"], "json")
+
+        cfg = normalize_serializers()
+        self.assertEqual(cfg["ripe_rpki_roas"], "json")
+        self.assertEqual(cfg["pdb_info"], "json")
+
+        with self.assertRaisesRegex(CachedObjectsExpiryTimeConfigurationError,
+                                    "invalid value for the 'pdb_info'"):
+            normalize_serializers({"pdb_info": "xml"})
+        with self.assertRaisesRegex(CachedObjectsExpiryTimeConfigurationError,
+                                    "Invalid value for 'cache_serializer'"):
+            normalize_serializers("xml")
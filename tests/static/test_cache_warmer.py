@@ -0,0 +1,181 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import copy
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import yaml
+
+from pierky.arouteserver.builder import TemplateContextDumper
+from pierky.arouteserver.cache_warmer import CacheWarmer
+from pierky.arouteserver.irrdb import ASSet, RSet
+from pierky.arouteserver.tests.base import setup_requests_mock
+from pierky.arouteserver.tests.mocked_env import MockedEnv
+from .test_rtr_client import FakeRTRServer
+
+
+class TestCacheWarmer(unittest.TestCase):
+
+    GENERAL = {
+        "cfg": {
+            "rs_as": 999,
+            "router_id": "192.0.2.2",
+            "filtering": {
+                "irrdb": {
+                    "enforce_origin_in_as_set": True,
+                    "enforce_prefix_in_as_set": True,
+                    "peering_db": True
+                }
+            }
+        }
+    }
+    CLIENTS = {
+        "clients": [
+            { "asn": 2, "ip": "192.0.2.21" },
+            { "asn": 3, "ip": "192.0.2.31" }
+        ]
+    }
+
+    def setUp(self):
+        # The cache is not bypassed here: only the external
+        # sources are mocked.
+        self.mocked_env = MockedEnv(base_dir=os.path.dirname(__file__),
+                                    default=False)
+        self.mocked_env.do_mock_irr()
+        self.mocked_env.do_mock_peering_db()
+
+        # AS-AS3 is the AS-SET of AS3 on PeeringDB.
+        self.mocked_env.mocked_files.update({
+            "irrdb_data/asset_AS-AS3.json": {"asn_list": [3, 33]},
+            "irrdb_data/rset_AS-AS3_ipv4.json": {
+                "prefix_list": [{"prefix": "33.0.0.0/8"}]
+            },
+            "irrdb_data/rset_AS-AS3_ipv6.json": {"prefix_list": []},
+        })
+
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+        self.cache_dir = os.path.join(self.temp_dir, "cache")
+        os.mkdir(self.cache_dir)
+
+        # Prevent actual calls to external APIs.
+        self.requests_mock = setup_requests_mock()
+
+    def tearDown(self):
+        MockedEnv.stopall()
+        self.requests_mock.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def write_file(self, name, dic):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, "w") as f:
+            yaml.dump(dic, f, default_flow_style=False)
+        return path
+
+    def get_builder_params(self):
+        return dict(
+            cfg_general=self.write_file("general.yml", self.GENERAL),
+            cfg_clients=self.write_file("clients.yml", self.CLIENTS),
+            cfg_bogons="config.d/bogons.yml",
+            cache_dir=self.cache_dir,
+            cache_expiry=120,
+        )
+
+    def warm_up(self):
+        return CacheWarmer(**self.get_builder_params()).warm_up_stats
+
+    def test_010_warm_up(self):
+        """Cache warmer: external data fetched"""
+        stats = self.warm_up()
+
+        self.assertEqual(stats.errors, 0)
+        self.assertEqual(stats.sources["PeeringDB networks"]["objects"], 2)
+        # AS2, AS3 and AS-AS3 from PeeringDB.
+        self.assertEqual(stats.sources["IRR AS-SETs"]["objects"], 3)
+        self.assertEqual(stats.sources["IRR AS-SETs"]["fetched"], 3)
+        # Both IPv4 and IPv6 for each bundle.
+        self.assertEqual(stats.sources["IRR prefixes"]["objects"], 6)
+        self.assertGreater(stats.sources["IRR prefixes"]["bytes"], 0)
+
+        self.assertIn("IRR prefixes", stats.to_text())
+
+    def test_020_warm_up_twice(self):
+        """Cache warmer: fresh entries are not fetched again"""
+        self.warm_up()
+        stats = self.warm_up()
+
+        self.assertEqual(stats.errors, 0)
+        for source in ("PeeringDB networks", "IRR AS-SETs", "IRR prefixes"):
+            self.assertEqual(stats.sources[source]["fetched"], 0)
+            self.assertEqual(stats.sources[source]["cached"],
+                             stats.sources[source]["objects"])
+
+    def test_030_build_from_warm_cache(self):
+        """Cache warmer: builds use only cached data"""
+        self.warm_up()
+
+        ASSet._run_cmd.reset_mock()
+        RSet._run_cmd.reset_mock()
+
+        stats_file = os.path.join(self.temp_dir, "stats.json")
+
+        for ip_ver in (None, 4, 6):
+            builder = TemplateContextDumper(
+                template_dir="templates/template-context/",
+                template_name="main.j2",
+                ip_ver=ip_ver,
+                stats_file=stats_file,
+                **self.get_builder_params()
+            )
+            builder.render_template()
+
+            with open(stats_file) as f:
+                report = json.load(f)
+            for stats in report["sources"].values():
+                self.assertEqual(stats["misses"], 0)
+
+            if ip_ver is None:
+                self.assertGreater(report["sources"]["irr_as_sets"]["hits"], 0)
+
+                as_sets = set()
+                for bundle in builder.irrdb_info.values():
+                    as_sets.update(bundle.object_names)
+                self.assertIn("AS-AS3", as_sets)
+
+        ASSet._run_cmd.assert_not_called()
+        RSet._run_cmd.assert_not_called()
+
+    def test_040_warm_up_rtr_client(self):
+        """Cache warmer: RPKI ROAs from the RTR server"""
+        server = FakeRTRServer([("192.0.2.0/24", 24, 65534)])
+        self.addCleanup(server.stop)
+
+        self.GENERAL = copy.deepcopy(self.GENERAL)
+        self.GENERAL["cfg"]["filtering"]["rpki_bgp_origin_validation"] = {
+            "enabled": True
+        }
+        self.GENERAL["cfg"]["rpki_roas"] = {
+            "source": "rtr-client",
+            "rtr_client_server": server.address
+        }
+
+        stats = self.warm_up()
+
+        self.assertEqual(stats.errors, 0)
+        self.assertEqual(stats.sources["RPKI ROAs"]["fetched"], 1)
+        self.assertGreater(stats.sources["RPKI ROAs"]["bytes"], 0)
+        self.assertEqual(server.queries, [(1, 2)])
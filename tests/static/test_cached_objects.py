@@ -0,0 +1,608 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import shutil
+import tempfile
+try:
+    import mock
+except ImportError:
+    import unittest.mock as mock
+import threading
+import time
+import unittest
+
+import requests
+import requests_mock
+
+from pierky.arouteserver.cache_backends import SQLiteCacheBackend, \
+                                               get_cache_backend
+from pierky.arouteserver.cache_memo import CacheMemo
+from pierky.arouteserver.cache_serializers import BinarySerializer
+from pierky.arouteserver.cached_objects import CachedObject, \
+                                               CachedDataNotModified, \
+                                               normalize_stale_max_age, \
+                                               wait_for_stale_entries_refresh
+from pierky.arouteserver.errors import CachedObjectsError, \
+                                       ExternalDataNoInfoError
+
+
+class FakeCachedObject(CachedObject):
+
+    def __init__(self, name, data, **kwargs):
+        CachedObject.__init__(self, **kwargs)
+        self.name = name
+        self.data = data
+
+    def _get_object_filename(self):
+        return "fake_{}.json".format(self.name)
+
+    def _get_data(self):
+        if self.data is None:
+            raise ExternalDataNoInfoError()
+        return self.data
+
+
+class FakeHTTPCachedObject(FakeCachedObject):
+
+    URL = "http://localhost/fake.json"
+
+    def __init__(self, *args, **kwargs):
+        FakeCachedObject.__init__(self, *args, **kwargs)
+        self.parsed = 0
+
+    def _get_data(self):
+        response = requests.get(
+            self.URL, headers=self._get_conditional_headers(self.URL)
+        )
+        if response.status_code == 304:
+            raise CachedDataNotModified()
+        self._set_validators(self.URL, response.content, response)
+        self.parsed += 1
+        return json.loads(response.content.decode("utf-8"))
+
+
+class TestCachedObjects_Base(unittest.TestCase):
+
+    __test__ = False
+
+    CACHE_BACKEND = None
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+
+    def tearDown(self):
+        mock.patch.stopall()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def get_obj(self, name, data, **kwargs):
+        return FakeCachedObject(
+            name, data, cache_dir=self.temp_dir,
+            cache_backend=self.CACHE_BACKEND, **kwargs
+        )
+
+    def test_010_save_and_load(self):
+        """{}: data saved and loaded from cache"""
+        obj = self.get_obj("a", {"a": [1, 2, 3]})
+        obj.load_data()
+        self.assertFalse(obj.from_cache)
+
+        obj = self.get_obj("a", "not used")
+        obj.load_data()
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(obj.raw_data, {"a": [1, 2, 3]})
+
+    def test_020_expired(self):
+        """{}: expired entries are fetched again"""
+        obj = self.get_obj("a", "old")
+        obj.load_data()
+
+        time.sleep(2)
+
+        obj = self.get_obj("a", "new", cache_expiry=1)
+        obj.load_data()
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(obj.raw_data, "new")
+
+    def test_030_missing_info(self):
+        """{}: missing info entries"""
+        obj = self.get_obj("a", None)
+        with self.assertRaises(ExternalDataNoInfoError):
+            obj.load_data()
+
+        obj = self.get_obj("a", "not used")
+        with mock.patch.object(FakeCachedObject, "_get_data") as get_data:
+            with self.assertRaises(ExternalDataNoInfoError):
+                obj.load_data()
+            get_data.assert_not_called()
+
+    def test_040_serve_stale(self):
+        """{}: stale entries served and refreshed in background"""
+        obj = self.get_obj("a", "old")
+        obj.cache_backend.serve_stale = normalize_stale_max_age(
+            {"general": 60}
+        )
+        obj.load_data()
+
+        time.sleep(2)
+
+        obj = self.get_obj("a", "new", cache_expiry=1)
+        obj.load_data()
+        self.assertTrue(obj.from_cache)
+        self.assertTrue(obj.stale)
+        self.assertEqual(obj.raw_data, "old")
+
+        wait_for_stale_entries_refresh()
+
+        obj = self.get_obj("a", "not used", cache_expiry=1)
+        obj.load_data()
+        self.assertTrue(obj.from_cache)
+        self.assertFalse(obj.stale)
+        self.assertEqual(obj.raw_data, "new")
+
+    def test_042_serve_stale_copy_refreshed(self):
+        """{}: stale entries refreshed using a copy of the object"""
+        obj = self.get_obj("a", "old")
+        obj.cache_backend.serve_stale = normalize_stale_max_age(
+            {"general": 60}
+        )
+        obj.load_data()
+
+        time.sleep(2)
+
+        obj = self.get_obj("a", "new", cache_expiry=1)
+        with mock.patch.object(FakeCachedObject, "refresh_cache",
+                               autospec=True) as refresh_cache:
+            obj.load_data()
+            wait_for_stale_entries_refresh()
+
+        refreshed_obj = refresh_cache.call_args[0][0]
+        self.assertIsNot(refreshed_obj, obj)
+        self.assertEqual(refreshed_obj.data, "new")
+        self.assertEqual(refreshed_obj.cache_expiry_time, 1)
+
+    def test_041_serve_stale_hard_limit(self):
+        """{}: stale entries not served beyond the hard limit"""
+        obj = self.get_obj("a", "old")
+        obj.cache_backend.serve_stale = normalize_stale_max_age(
+            {"general": 1}
+        )
+        obj.load_data()
+
+        time.sleep(2)
+
+        obj = self.get_obj("a", "new", cache_expiry=1)
+        obj.load_data()
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(obj.raw_data, "new")
+
+    def test_050_concurrent_fetch(self):
+        """{}: object fetched only once by concurrent loaders"""
+        fetched = []
+
+        class SlowCachedObject(FakeCachedObject):
+
+            def _get_data(self):
+                fetched.append(self.name)
+                time.sleep(0.5)
+                return self.data
+
+        def load(results):
+            obj = SlowCachedObject("a", ["data"], cache_dir=self.temp_dir,
+                                   cache_backend=self.CACHE_BACKEND)
+            obj.load_data()
+            results.append(obj.raw_data)
+
+        results = []
+        threads = [threading.Thread(target=load, args=(results,))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(fetched, ["a"])
+        self.assertEqual(results, [["data"]] * 4)
+
+    def test_060_stats(self):
+        """{}: stats"""
+        # Entries are read from the backend.
+        get_cache_backend(self.temp_dir, self.CACHE_BACKEND).memo.max_size = 0
+
+        self.get_obj("a", [1, 2, 3]).load_data()
+        self.get_obj("a", "not used").load_data()
+        with self.assertRaises(ExternalDataNoInfoError):
+            self.get_obj("b", None).load_data()
+        with self.assertRaises(ExternalDataNoInfoError):
+            self.get_obj("b", None).load_data()
+
+        stats = get_cache_backend(self.temp_dir, self.CACHE_BACKEND).stats
+        report = stats.to_dict()["sources"]["general"]
+
+        self.assertEqual(report["hits"], 1)
+        self.assertEqual(report["misses"], 2)
+        self.assertEqual(report["negative_hits"], 1)
+        self.assertEqual(report["fetch_errors"], 0)
+        self.assertEqual(report["fetch_time"]["count"], 2)
+        self.assertEqual(report["fetch_time"]["histogram"]["+Inf"], 2)
+        self.assertGreaterEqual(report["bytes_written"],
+                                len(json.dumps([1, 2, 3])))
+        self.assertGreaterEqual(report["bytes_read"], len(json.dumps([1, 2, 3])))
+
+    def get_http_obj(self, name, **kwargs):
+        return FakeHTTPCachedObject(
+            name, None, cache_dir=self.temp_dir,
+            cache_backend=self.CACHE_BACKEND, **kwargs
+        )
+
+    def test_070_not_modified_304(self):
+        """{}: conditional requests, 304 Not Modified"""
+        with requests_mock.Mocker() as m:
+            m.get(FakeHTTPCachedObject.URL, text='{"a": 1}',
+                  headers={"ETag": '"v1"',
+                           "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"})
+            obj = self.get_http_obj("a")
+            obj.load_data()
+            self.assertEqual(obj.parsed, 1)
+            self.assertEqual(m.last_request.headers.get("If-None-Match"), None)
+
+        entry = obj.cache_backend.load(obj._get_object_filename())
+        self.assertEqual(entry["meta"]["etag"], '"v1"')
+        first_ts = entry["ts"]
+
+        time.sleep(2)
+
+        with requests_mock.Mocker() as m:
+            m.get(FakeHTTPCachedObject.URL, status_code=304)
+            obj = self.get_http_obj("a", cache_expiry=1)
+            obj.load_data()
+            self.assertEqual(m.last_request.headers["If-None-Match"], '"v1"')
+            self.assertEqual(m.last_request.headers["If-Modified-Since"],
+                             "Mon, 01 Jan 2024 00:00:00 GMT")
+
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(obj.parsed, 0)
+        self.assertEqual(obj.raw_data, {"a": 1})
+
+        entry = obj.cache_backend.load(obj._get_object_filename())
+        self.assertGreater(entry["ts"], first_ts)
+        self.assertEqual(entry["meta"]["etag"], '"v1"')
+
+        stats = obj.cache_backend.stats.to_dict()["sources"]["general"]
+        self.assertEqual(stats["not_modified"], 1)
+
+    def test_071_not_modified_same_content(self):
+        """{}: conditional requests, same content"""
+        with requests_mock.Mocker() as m:
+            m.get(FakeHTTPCachedObject.URL, text='{"a": 1}')
+            self.get_http_obj("a").load_data()
+
+            time.sleep(2)
+
+            obj = self.get_http_obj("a", cache_expiry=1)
+            obj.load_data()
+            self.assertTrue(obj.from_cache)
+            self.assertEqual(obj.parsed, 0)
+            self.assertEqual(obj.raw_data, {"a": 1})
+
+            m.get(FakeHTTPCachedObject.URL, text='{"a": 2}')
+
+            obj = self.get_http_obj("a", cache_expiry=0)
+            obj.load_data()
+            self.assertFalse(obj.from_cache)
+            self.assertEqual(obj.parsed, 1)
+            self.assertEqual(obj.raw_data, {"a": 2})
+
+    def test_080_serializers(self):
+        """{}: serializers"""
+        backend = get_cache_backend(self.temp_dir, self.CACHE_BACKEND)
+
+        for name in ("binary", "json-zlib", "json"):
+            backend.serializers = {"general": name}
+
+            obj = self.get_obj(name, {"a": [1, 2, 3]})
+            obj.load_data()
+            self.assertFalse(obj.from_cache)
+
+            # Entries are read regardless of the serializer in use.
+            backend.serializers = {"general": "json"}
+
+            obj = self.get_obj(name, "not used")
+            obj.load_data()
+            self.assertTrue(obj.from_cache)
+            self.assertEqual(obj.raw_data, {"a": [1, 2, 3]})
+
+    def test_081_invalid_entry(self):
+        """{}: entries that can't be decoded are fetched again"""
+        backend = get_cache_backend(self.temp_dir, self.CACHE_BACKEND)
+        backend.serializers = {"general": "binary"}
+        backend.memo.max_size = 0
+
+        self.get_obj("a", "old").load_data()
+
+        # As if the entry was written by a Python version that
+        # uses a different marshal format.
+        with mock.patch.object(BinarySerializer, "FORMAT_VERSION", 0):
+            obj = self.get_obj("a", "new")
+            obj.load_data()
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(obj.raw_data, "new")
+
+    def test_090_negative_expiry(self):
+        """{}: negative entries expiry time"""
+        backend = get_cache_backend(self.temp_dir, self.CACHE_BACKEND)
+        backend.negative_expiry = {"general": 1}
+
+        with self.assertRaises(ExternalDataNoInfoError):
+            self.get_obj("a", None).load_data()
+        self.get_obj("b", "old").load_data()
+
+        time.sleep(2)
+
+        obj = self.get_obj("a", "new")
+        obj.load_data()
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(obj.raw_data, "new")
+
+        # Positive entries are not affected.
+        obj = self.get_obj("b", "new")
+        obj.load_data()
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(obj.raw_data, "old")
+
+        # Never longer than the expiry time of positive entries.
+        backend.negative_expiry = {"general": 3600}
+        obj = self.get_obj("c", None, cache_expiry=10)
+        self.assertEqual(obj.get_negative_expiry_time(), 10)
+
+    def test_091_negative_index(self):
+        """{}: negative entries index"""
+        backend = get_cache_backend(self.temp_dir, self.CACHE_BACKEND)
+
+        for name in ("a", "b", "c"):
+            with self.assertRaises(ExternalDataNoInfoError):
+                self.get_obj(name, None).load_data()
+
+        # Not stored as regular entries.
+        self.assertEqual(list(backend.iter_entries()), [])
+        self.assertIsNotNone(backend.load_negative("fake_a.json"))
+
+        # From negative to positive...
+        obj = self.get_obj("a", "data")
+        obj.bypass_cache = True
+        obj.load_data()
+        self.assertIsNone(backend.load_negative("fake_a.json"))
+
+        obj = self.get_obj("a", "not used")
+        obj.load_data()
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(obj.raw_data, "data")
+
+        # ... and back.
+        obj = self.get_obj("a", None)
+        obj.bypass_cache = True
+        with self.assertRaises(ExternalDataNoInfoError):
+            obj.load_data()
+
+        with self.assertRaises(ExternalDataNoInfoError):
+            self.get_obj("a", "not used").load_data()
+
+    def test_095_memo(self):
+        """{}: in-memory cache"""
+        backend = get_cache_backend(self.temp_dir, self.CACHE_BACKEND)
+        backend.memo.max_size = 1000
+
+        self.get_obj("a", {"a": [1]}).load_data()
+
+        with mock.patch.object(backend, "_load") as load:
+            for _ in range(3):
+                obj = self.get_obj("a", "not used")
+                obj.load_data()
+                self.assertTrue(obj.from_cache)
+                self.assertEqual(obj.raw_data, {"a": [1]})
+                # Each object gets its own copy.
+                obj.raw_data["a"].append(2)
+            load.assert_not_called()
+
+        self.assertEqual(backend.memo.hits, 3)
+        self.assertIn("3 hits", backend.memo.get_summary())
+
+        # Same key, different class.
+        class OtherFakeCachedObject(FakeCachedObject):
+            pass
+
+        obj = OtherFakeCachedObject("a", "not used", cache_dir=self.temp_dir,
+                                    cache_backend=self.CACHE_BACKEND)
+        obj.load_data()
+        self.assertEqual(backend.memo.hits, 3)
+        self.assertEqual(obj.raw_data, {"a": [1]})
+
+    def test_096_memo_entry_modified(self):
+        """{}: in-memory cache, entry modified by another process"""
+        backend = get_cache_backend(self.temp_dir, self.CACHE_BACKEND)
+        backend.memo.max_size = 1000
+
+        self.get_obj("a", "old").load_data()
+
+        # Another process, with its own in-memory cache.
+        time.sleep(0.01)
+        obj = self.get_obj("a", "new")
+        obj.bypass_cache = True
+        with mock.patch.object(backend, "memo", CacheMemo(1000)):
+            obj.load_data()
+
+        obj = self.get_obj("a", "not used")
+        obj.load_data()
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(obj.raw_data, "new")
+
+    def test_097_memo_max_size(self):
+        """{}: in-memory cache, max size"""
+        backend = get_cache_backend(self.temp_dir, self.CACHE_BACKEND)
+        backend.memo.max_size = 2500
+
+        for name in ("a", "b", "c"):
+            self.get_obj(name, "x" * 1000).load_data()
+
+        self.assertLessEqual(backend.memo.size, 2500)
+        self.assertEqual(list(backend.memo.entries), ["fake_b.json",
+                                                      "fake_c.json"])
+
+        # Larger than the whole memo.
+        self.get_obj("d", "x" * 5000).load_data()
+        self.assertNotIn("fake_d.json", backend.memo.entries)
+
+    def test_099_memo_excluded(self):
+        """{}: in-memory cache, objects not kept in memory"""
+        backend = get_cache_backend(self.temp_dir, self.CACHE_BACKEND)
+        backend.memo.max_size = 1000
+
+        class LargeFakeCachedObject(FakeCachedObject):
+            USE_CACHE_MEMO = False
+
+        for _ in range(2):
+            LargeFakeCachedObject("a", [1], cache_dir=self.temp_dir,
+                                  cache_backend=self.CACHE_BACKEND).load_data()
+
+        self.assertEqual(len(backend.memo.entries), 0)
+        self.assertEqual(backend.memo.hits, 0)
+
+    def test_098_backend_views(self):
+        """{}: views of the backend, same storage"""
+        backend = get_cache_backend(self.temp_dir, self.CACHE_BACKEND)
+        view_a = backend.get_view()
+        view_b = backend.get_view()
+
+        view_a.serve_stale = {"general": 3600}
+        view_a.memo.max_size = 1000
+        self.assertEqual(view_b.serve_stale, {})
+        self.assertEqual(view_b.memo.max_size, 0)
+        self.assertEqual(backend.serve_stale, {})
+
+        FakeCachedObject("a", [1], cache_dir=self.temp_dir,
+                         cache_backend=view_a).load_data()
+        self.assertEqual(view_a.stats.to_dict()["sources"]["general"]["misses"], 1)
+        self.assertEqual(view_b.stats.to_dict()["sources"], {})
+
+        obj = FakeCachedObject("a", "not used", cache_dir=self.temp_dir,
+                               cache_backend=view_b)
+        obj.load_data()
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(obj.raw_data, [1])
+
+class TestCachedObjects_JSON(TestCachedObjects_Base):
+
+    __test__ = True
+
+    CACHE_BACKEND = "json"
+    SHORT_DESCR = "JSON backend"
+
+    def test_100_file_written(self):
+        """JSON backend: one file for each object"""
+        self.get_obj("a", [1]).load_data()
+        with open(os.path.join(self.temp_dir, "fake_a.json")) as f:
+            self.assertEqual(json.load(f)["data"], [1])
+
+    def test_101_negative_index_file(self):
+        """{}: negative entries in a single file"""
+        for name in ("a", "b"):
+            with self.assertRaises(ExternalDataNoInfoError):
+                self.get_obj(name, None).load_data()
+
+        self.assertEqual(
+            sorted(os.listdir(self.temp_dir)),
+            [".locks", ".negative_index.json"]
+        )
+
+        # Index updated by another process.
+        with open(os.path.join(self.temp_dir, ".negative_index.json")) as f:
+            index = json.load(f)
+        del index["fake_a.json"]
+        with open(os.path.join(self.temp_dir, ".negative_index.json"), "w") as f:
+            json.dump(index, f)
+
+        obj = self.get_obj("a", "data")
+        obj.load_data()
+        self.assertFalse(obj.from_cache)
+
+    def test_110_atomic_write(self):
+        """JSON backend: no temporary files left behind"""
+        self.get_obj("a", [1]).load_data()
+        self.get_obj("a", [2], cache_expiry=-1).load_data()
+        self.assertEqual(
+            sorted(os.listdir(self.temp_dir)),
+            [".locks", "fake_a.json"]
+        )
+        with open(os.path.join(self.temp_dir, "fake_a.json")) as f:
+            self.assertEqual(json.load(f)["data"], [2])
+
+class TestCachedObjects_SQLite(TestCachedObjects_Base):
+
+    __test__ = True
+
+    CACHE_BACKEND = "sqlite"
+    SHORT_DESCR = "SQLite backend"
+
+    def test_100_single_file(self):
+        """SQLite backend: no JSON files are written"""
+        self.get_obj("a", [1]).load_data()
+        self.get_obj("b", [2]).load_data()
+        self.assertIn(
+            SQLiteCacheBackend.DB_FILENAME,
+            os.listdir(self.temp_dir)
+        )
+        self.assertFalse(
+            any(f.endswith(".json") for f in os.listdir(self.temp_dir))
+        )
+
+    def test_110_migration(self):
+        """SQLite backend: legacy JSON files are imported"""
+        with open(os.path.join(self.temp_dir, "fake_a.json"), "w") as f:
+            json.dump({"ts": int(time.time()), "data": ["legacy"]}, f)
+
+        obj = self.get_obj("a", "not used")
+        obj.load_data()
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(obj.raw_data, ["legacy"])
+
+        self.assertFalse(
+            os.path.exists(os.path.join(self.temp_dir, "fake_a.json"))
+        )
+
+        obj = self.get_obj("a", "not used")
+        obj.load_data()
+        self.assertTrue(obj.from_cache)
+        self.assertEqual(obj.raw_data, ["legacy"])
+
+    def test_120_shared_backend(self):
+        """SQLite backend: one instance for each cache directory"""
+        self.assertIs(
+            get_cache_backend(self.temp_dir, "sqlite"),
+            get_cache_backend(self.temp_dir + "/", "sqlite")
+        )
+
+    def test_121_missing_cache_dir(self):
+        """SQLite backend: cache directory created"""
+        cache_dir = os.path.join(self.temp_dir, "missing")
+        obj = FakeCachedObject("a", [1], cache_dir=cache_dir,
+                               cache_backend="sqlite")
+        obj.load_data()
+        self.assertIn(SQLiteCacheBackend.DB_FILENAME, os.listdir(cache_dir))
+
+    def test_130_unknown_backend(self):
+        """Cache backend: unknown backend"""
+        with self.assertRaises(CachedObjectsError):
+            get_cache_backend(self.temp_dir, "foo")
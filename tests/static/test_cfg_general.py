@@ -246,9 +246,34 @@ class TestConfigParserGeneral(TestConfigParserBase):
     def test_use_rpki_roas_source(self):
         """{}: rpki_roas.source"""
         self.assertEqual(self.cfg["rpki_roas"]["source"], "ripe-rpki-validator-cache")
-        self._test_option(self.cfg["rpki_roas"], "source", ("ripe-rpki-validator-cache","rtr"))
+        self._test_option(self.cfg["rpki_roas"], "source", ("ripe-rpki-validator-cache","rtr","rtr-client"))
         self._test_mandatory(self.cfg["rpki_roas"], "source", has_default=True)
 
+    def test_rpki_roas_ripe_rpki_validator_fetch_mode(self):
+        """{}: rpki_roas.ripe_rpki_validator_fetch_mode"""
+        self.assertEqual(self.cfg["rpki_roas"]["ripe_rpki_validator_fetch_mode"], "sequential")
+        self._test_option(self.cfg["rpki_roas"], "ripe_rpki_validator_fetch_mode", ("sequential", "freshest"))
+        self._test_mandatory(self.cfg["rpki_roas"], "ripe_rpki_validator_fetch_mode", has_default=True)
+
+    def test_rpki_roas_ripe_rpki_validator_timeout(self):
+        """{}: rpki_roas.ripe_rpki_validator_timeout"""
+        self.assertEqual(self.cfg["rpki_roas"]["ripe_rpki_validator_timeout"], 30)
+        self._test_mandatory(self.cfg["rpki_roas"], "ripe_rpki_validator_timeout", has_default=True)
+
+    def test_rpki_roas_rtr_client_server(self):
+        """{}: rpki_roas.rtr_client_server"""
+        self.assertEqual(self.cfg["rpki_roas"]["rtr_client_server"], "127.0.0.1:3323")
+        self._test_mandatory(self.cfg["rpki_roas"], "rtr_client_server", has_default=True)
+
+        self.cfg["filtering"]["irrdb"]["use_rpki_roas_as_route_objects"]["enabled"] = True
+        self.cfg["rpki_roas"]["source"] = "rtr-client"
+        for v in ("192.0.2.1:323", "rtr.example.com:3323", "[2001:db8::1]:3323"):
+            self.cfg["rpki_roas"]["rtr_client_server"] = v
+            self._contains_err()
+        for v in ("192.0.2.1", "2001:db8::1:3323", "192.0.2.1:65536"):
+            self.cfg["rpki_roas"]["rtr_client_server"] = v
+            self._contains_err("Invalid RTR server '{}'".format(v))
+
     def test_use_arin_bulk_whois_data_enabled(self):
         """{}: use_arin_bulk_whois_data.enabled"""
         self.cfg["filtering"]["irrdb"]["use_arin_bulk_whois_data"]["source"] = "whatever"
@@ -1341,7 +1366,10 @@ class TestConfigParserGeneral(TestConfigParserBase):
                     "lacnic",
                     "ripe"
                 ],
-                "ignore_cache_files_older_than": 21600
+                "ignore_cache_files_older_than": 21600,
+                "ripe_rpki_validator_fetch_mode": "sequential",
+                "ripe_rpki_validator_timeout": 30,
+                "rtr_client_server": "127.0.0.1:3323"
             },
             "blackhole_filtering": {
                 "policy_ipv4": None,
@@ -1469,7 +1497,10 @@ class TestConfigParserGeneral(TestConfigParserBase):
                     "lacnic",
                     "ripe"
                 ],
-                "ignore_cache_files_older_than": 21600
+                "ignore_cache_files_older_than": 21600,
+                "ripe_rpki_validator_fetch_mode": "sequential",
+                "ripe_rpki_validator_timeout": 30,
+                "rtr_client_server": "127.0.0.1:3323"
             },
             "blackhole_filtering": {
                 "policy_ipv4": None,
@@ -22,6 +22,8 @@ import yaml
 
 from pierky.arouteserver.tests.base import setup_requests_mock
 from pierky.arouteserver.builder import TemplateContextDumper
+from pierky.arouteserver.enrichers.base import TasksQueue
+from pierky.arouteserver.enrichers.irrdb import IRRDBTasksCosts
 from pierky.arouteserver.tests.mocked_env import MockedEnv
 
 
@@ -283,3 +285,113 @@ class TestIRRDBEnricher_Base(unittest.TestCase):
             self.get_client_info(self.get_client_by_id("AS3_2")),
             ([3, 300], [])
         )
+
+    def test_030_ipv4_and_ipv6(self, *patches):
+        """IRRDB enricher: IPv4 and IPv6 prefixes fetched by independent tasks"""
+        clients = {"clients": [{"asn": 2, "ip": ["192.0.2.21", "2001:db8::2:1"]}]}
+
+        self.setup_builder(self.GENERAL_SIMPLE, clients, ip_ver=None)
+        self.builder.render_template()
+
+        self.assertEqual(
+            self.get_client_info(self.get_client_by_id("AS2_1")),
+            ([2], ["2.0.0.0/8", "2001:db8::/32"])
+        )
+
+    def test_040_tasks_costs(self, *patches):
+        """IRRDB enricher: history of the tasks costs"""
+        clients = copy.deepcopy(self.CLIENTS_SIMPLE)
+        clients["clients"][0]["cfg"] = {"filtering": {"irrdb": {"as_sets": ["AS-ONE"]}}}
+
+        self.setup_builder(self.GENERAL_SIMPLE, clients)
+
+        costs = IRRDBTasksCosts(self.builder.cache_backend)
+        costs.load()
+
+        # AS1, AS-ONE and AS2: ASNs and IPv4 prefixes.
+        self.assertEqual(len(costs.costs), 6)
+        for cost in costs.costs.values():
+            self.assertIsNotNone(cost["duration"])
+        self.assertEqual(sorted(cost["size"] for cost in costs.costs.values()),
+                         [1, 1, 1, 1, 3, 3])
+
+    def test_050_aggregated_prefix_lists(self, *patches):
+        """IRRDB enricher: prefix lists aggregation"""
+        clients = copy.deepcopy(self.CLIENTS_SIMPLE)
+        clients["clients"][0]["cfg"] = {"filtering": {"irrdb": {"as_sets": ["AS-ONE"]}}}
+
+        self.builder = TemplateContextDumper(
+            template_dir="templates/template-context/",
+            template_name="main.j2",
+            cfg_general=self.write_file("general.yml", self.GENERAL_SIMPLE),
+            cfg_clients=self.write_file("clients.yml", clients),
+            cfg_bogons="config.d/bogons.yml",
+            cache_dir=self.temp_dir,
+            cache_expiry=120,
+            ip_ver=4,
+            aggregate_prefix_lists=True
+        )
+        self.builder.render_template()
+
+        # 10.0.0.0/8 and 11.0.0.0/8 are merged into 10.0.0.0/7, with
+        # the same range of lengths of the original entries.
+        client = self.get_client_by_id("AS1_1")
+        self.assertEqual(
+            self.get_client_info(client),
+            ([1, 10, 11, 12], ["1.0.0.0/8", "10.0.0.0/7", "12.0.0.0/8"])
+        )
+        entries = {
+            entry["prefix"]: entry
+            for bundle_id in client["cfg"]["filtering"]["irrdb"]["as_set_bundle_ids"]
+            for entry in self.builder.data["irrdb_info"][bundle_id].prefixes
+        }
+        self.assertFalse(entries["10.0.0.0"]["exact"])
+        self.assertEqual(entries["10.0.0.0"]["ge"], 8)
+        self.assertEqual(entries["10.0.0.0"]["le"], entries["12.0.0.0"]["le"])
+
+class TestIRRDBTasksQueue(unittest.TestCase):
+
+    def test_010_order(self):
+        """IRRDB enricher: tasks with the highest cost first"""
+        q = TasksQueue()
+        for task, cost in (("a", 1), ("b", 0), ("c", 10), ("d", 1), ("e", 5)):
+            q.put(task, cost=cost)
+        q.put("f")
+
+        self.assertEqual([q.get() for _ in range(6)],
+                         ["c", "e", "a", "d", "b", "f"])
+
+    def test_020_predicted_makespan(self):
+        """IRRDB enricher: predicted makespan"""
+        q = TasksQueue()
+        for cost in (10, 3, 3, 2, 2):
+            q.put(object(), cost=cost)
+
+        self.assertEqual(q.get_predicted_makespan(1), 20)
+        self.assertEqual(q.get_predicted_makespan(2), 10)
+        self.assertEqual(q.get_predicted_makespan(4), 10)
+
+    def test_030_unknown_costs(self):
+        """IRRDB enricher: tasks never run before"""
+        costs = IRRDBTasksCosts(None)
+        self.assertEqual(costs.get_durations(["a:asns", "b:asns"]),
+                         {"a:asns": 0, "b:asns": 0})
+
+        costs.update("a:asns", 100, 4)
+        costs.update("b:asns", 10, 2)
+        costs.update("a:prefixes4", 1000, 1)
+        self.assertEqual(
+            costs.get_durations(["a:asns", "b:asns", "c:asns"]),
+            {"a:asns": 4, "b:asns": 2, "c:asns": 3}
+        )
+
+        # The size of the result is known: estimated using the
+        # rate of the tasks of the same kind, or of all of them.
+        costs.update("c:asns", 550)
+        costs.update("b:prefixes4", 2000)
+        costs.update("a:prefixes6", 1110)
+        durations = costs.get_durations(["c:asns", "b:prefixes4",
+                                         "a:prefixes6"])
+        self.assertAlmostEqual(durations["c:asns"], 30)
+        self.assertAlmostEqual(durations["b:prefixes4"], 2)
+        self.assertAlmostEqual(durations["a:prefixes6"], 7)
@@ -0,0 +1,121 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import unittest
+
+from unittest.mock import patch
+
+from pierky.arouteserver.irr_hosts import IRRHostsHealth
+
+
+class TestIRRHostsHealth(unittest.TestCase):
+
+    def setUp(self):
+        self.health = IRRHostsHealth()
+
+    def test_010_sort_hosts(self):
+        """IRR hosts health: healthiest hosts first"""
+        hosts = ["a", "b", "c", "d"]
+        self.assertEqual(self.health.sort_hosts(hosts), hosts)
+
+        for _ in range(5):
+            self.health.record_success("a", 2)
+            self.health.record_success("b", 1)
+            self.health.record_success("c", 0.5)
+            self.health.record_error("c")
+            self.health.record_error("c")
+
+        # The fastest hosts first, then the unknown ones; hosts with
+        # too many errors are used last.
+        self.assertEqual(self.health.sort_hosts(hosts), ["b", "a", "d", "c"])
+
+    def test_011_sort_unknown_hosts(self):
+        """IRR hosts health: unknown hosts after the healthy ones"""
+        self.health.record_success("b", 1)
+        self.assertEqual(self.health.sort_hosts(["a", "b", "c"]),
+                         ["b", "a", "c"])
+
+    def test_020_backoff(self):
+        """IRR hosts health: timed out hosts probed again after backoff"""
+        self.health.add("a")
+        self.assertIn("a", self.health)
+        self.assertEqual(self.health.get_backoff("a"), 300)
+        self.assertEqual(self.health.sort_hosts(["a", "b"]), ["b"])
+
+        # Adding it again while it's excluded doesn't change anything.
+        self.health.add("a")
+        self.assertEqual(self.health.get_backoff("a"), 300)
+
+        now = time.time()
+        with patch("time.time", return_value=now + 301):
+            self.assertNotIn("a", self.health)
+            self.health.add("a")
+        self.assertIn("a", self.health)
+        self.assertEqual(self.health.get_backoff("a"), 600)
+
+        for i in range(1, 5):
+            with patch("time.time", return_value=now + 100000 * i):
+                self.health.add("a")
+        self.assertEqual(self.health.get_backoff("a"), 3600)
+
+        self.health.record_success("a", 1)
+        self.assertNotIn("a", self.health)
+        self.assertEqual(self.health.get_backoff("a"), 0)
+
+    def test_030_hedging_delay(self):
+        """IRR hosts health: hedging delay"""
+        self.assertIsNone(self.health.get_hedging_delay("a"))
+
+        for _ in range(9):
+            self.health.record_success("a", 2)
+        self.assertIsNone(self.health.get_hedging_delay("a"))
+
+        self.health.record_success("a", 3)
+        self.assertEqual(self.health.get_hedging_delay("a"), 3)
+
+        for _ in range(10):
+            self.health.record_success("b", 0.1)
+        self.assertEqual(self.health.get_hedging_delay("b"), 1)
+
+    def test_031_hedging_delay_by_kind(self):
+        """IRR hosts health: hedging delay of similar queries"""
+        for _ in range(10):
+            self.health.record_success("a", 2, "asns")
+            self.health.record_success("a", 20, "prefixes4")
+        self.assertEqual(self.health.get_hedging_delay("a", "asns"), 2)
+        self.assertEqual(self.health.get_hedging_delay("a", "prefixes4"), 20)
+        self.assertIsNone(self.health.get_hedging_delay("a", "prefixes6"))
+        self.assertEqual(self.health.get_hedging_delay("a"), 20)
+
+    def test_032_hedging_budget(self):
+        """IRR hosts health: max n. of hedged queries"""
+        self.assertTrue(self.health.start_hedging())
+        self.assertFalse(self.health.start_hedging())
+
+        for _ in range(40):
+            self.health.record_success("a", 1)
+        self.assertTrue(self.health.start_hedging())
+        self.assertFalse(self.health.start_hedging())
+
+        self.health.clear()
+        self.assertTrue(self.health.start_hedging())
+
+    def test_040_clear(self):
+        """IRR hosts health: clear"""
+        self.health.add("a")
+        self.health.clear()
+        self.assertNotIn("a", self.health)
+        self.assertEqual(self.health.get_backoff("a"), 0)
@@ -0,0 +1,508 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import shutil
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+
+from unittest.mock import patch
+
+from pierky.arouteserver.errors import IRRDBToolsError
+from pierky.arouteserver.irr_expander import IRRExpander, IRRSetsMemo, \
+                                            IRR_SETS_MEMO
+from pierky.arouteserver.irrd_client import IRRdClient, \
+                                           close_irrd_connection_pools
+from pierky.arouteserver.irrdb import ASSet, RSet, TIMEDOUT_IRR_HOSTS
+from pierky.arouteserver.prefix_tree import PrefixTree
+
+
+class FakeIRRdHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        self.server.connections += 1
+        self.server.sockets.append(self.request)
+        multiple_commands = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            query = line.decode("utf-8").strip()
+            self.server.queries.append(query)
+
+            if self.server.delay:
+                time.sleep(self.server.delay)
+
+            if query == "!!":
+                multiple_commands = True
+                continue
+
+            self.wfile.write(self.server.respond(query))
+
+            if not multiple_commands:
+                break
+
+class FakeIRRd(socketserver.ThreadingTCPServer):
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    SOURCES = ("RIPE", "RADB", "ARIN")
+
+    def __init__(self, objects, delay=0):
+        socketserver.ThreadingTCPServer.__init__(self, ("127.0.0.1", 0),
+                                                 FakeIRRdHandler)
+        self.objects = objects
+        self.delay = delay
+        self.connections = 0
+        self.sockets = []
+        self.queries = []
+
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def host(self):
+        return "127.0.0.1:{}".format(self.server_address[1])
+
+    def respond(self, query):
+        if query.startswith("!n"):
+            return b"C\n"
+        if query.startswith("!s"):
+            if all(source in self.SOURCES
+                   for source in query[2:].split(",")):
+                return b"C\n"
+            return b"F Unknown source\n"
+        if query in self.objects:
+            data = (self.objects[query] + "\n").encode("utf-8")
+            return "A{}\n".format(len(data)).encode("utf-8") + data + b"C\n"
+        return b"D\n"
+
+    def close_connections(self):
+        for sock in self.sockets:
+            sock.shutdown(socket.SHUT_RDWR)
+        self.sockets = []
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class TestIRRdClient(unittest.TestCase):
+
+    OBJECTS = {
+        "!iAS-ONE": "AS1 AS2 AS-NESTED",
+        "!iAS-NESTED": "AS64512 AS3 AS-ONE",
+        "!iAS-TWO": "AS3 AS4",
+        "!iRS-ONE": "10.1.0.0/24 RS-TWO",
+        "!iRS-TWO": "10.1.1.0/24 2001:db8:1::/48",
+        "!gAS1": "10.0.0.0/24 10.0.1.0/24",
+        "!gAS2": "10.0.2.0/24 10.0.3.0/24",
+        "!gAS3": "192.168.0.0/16 192.168.1.0/24",
+        "!6AS1": "2001:db8::/32",
+        "!6AS3": "2001:db9::/32",
+    }
+
+    def setUp(self):
+        TIMEDOUT_IRR_HOSTS.clear()
+        IRR_SETS_MEMO.clear()
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+        self.servers = []
+
+    def tearDown(self):
+        close_irrd_connection_pools()
+        for server in self.servers:
+            server.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+        TIMEDOUT_IRR_HOSTS.clear()
+
+    def start_server(self, objects=None, delay=0):
+        server = FakeIRRd(self.OBJECTS if objects is None else objects,
+                          delay=delay)
+        self.servers.append(server)
+        return server
+
+    def get_obj(self, cls, object_names, hosts, *args, **kwargs):
+        return cls(
+            object_names, *args,
+            cache_dir=self.temp_dir,
+            bgpq3_path="bgpq4",
+            bgpq3_host=hosts,
+            bgpq3_sources="RIPE,RADB",
+            bgpq3_timeout=kwargs.pop("timeout", 5),
+            irr_query_method="native",
+            **kwargs
+        )
+
+    def get_prefixes(self, obj):
+        obj.load_data()
+        return sorted(
+            (p["prefix"], p["length"], p["exact"], p["ge"], p["le"])
+            for p in obj.prefixes
+        )
+
+    def test_010_asns(self):
+        """IRRd client: origin ASNs"""
+        server = self.start_server()
+
+        obj = self.get_obj(ASSet, ["AS-ONE", "AS-TWO", "AS10"], [server.host])
+        obj.load_data()
+
+        # Private ASNs are skipped, as bgpq4 does.
+        self.assertEqual(obj.asns, [1, 2, 3, 4, 10])
+        self.assertIn("!sRIPE,RADB", server.queries)
+
+    def test_011_asns_source(self):
+        """IRRd client: origin ASNs, source of the AS-SET"""
+        server = self.start_server()
+
+        obj = self.get_obj(ASSet, ["ARIN::AS-TWO"], [server.host])
+        obj.load_data()
+
+        self.assertEqual(obj.asns, [3, 4])
+        self.assertIn("!sARIN,RIPE,RADB", server.queries)
+        self.assertIn("!iAS-TWO", server.queries)
+
+    def test_012_missing_as_set(self):
+        """IRRd client: missing AS-SET"""
+        server = self.start_server()
+
+        obj = self.get_obj(ASSet, ["AS-MISSING"], [server.host])
+        obj.load_data()
+
+        self.assertEqual(obj.asns, [])
+
+    def test_020_prefixes(self):
+        """IRRd client: prefixes, aggregated"""
+        server = self.start_server()
+
+        obj = self.get_obj(RSet, ["AS-ONE", "RS-ONE"], [server.host], 4, False)
+        self.assertEqual(
+            self.get_prefixes(obj),
+            [
+                ("10.0.0.0", 22, False, 24, 24),
+                ("10.1.0.0", 23, False, 24, 24),
+                ("192.168.0.0", 16, True, None, None),
+                ("192.168.1.0", 24, True, None, None),
+            ]
+        )
+        self.assertNotIn("!gAS64512", server.queries)
+
+    def test_021_prefixes_ipv6(self):
+        """IRRd client: prefixes, IPv6"""
+        server = self.start_server()
+
+        obj = self.get_obj(RSet, ["AS-ONE", "RS-ONE"], [server.host], 6, False)
+        self.assertEqual(
+            self.get_prefixes(obj),
+            [
+                ("2001:db8:1::", 48, True, None, None),
+                ("2001:db8::", 31, False, 32, 32),
+            ]
+        )
+
+    def test_022_prefixes_longer(self):
+        """IRRd client: prefixes, more specific prefixes allowed"""
+        server = self.start_server()
+
+        obj = self.get_obj(RSet, ["AS3"], [server.host], 4, True)
+        self.assertEqual(
+            self.get_prefixes(obj),
+            [
+                ("192.168.0.0", 16, False, None, 32),
+            ]
+        )
+
+    def test_030_persistent_connections(self):
+        """IRRd client: persistent connections, pipelined queries"""
+        server = self.start_server()
+
+        for object_names in (["AS-ONE"], ["AS-TWO"], ["AS-ONE", "AS-TWO"]):
+            self.get_obj(ASSet, object_names, [server.host]).load_data()
+            self.get_obj(RSet, object_names, [server.host], 4,
+                         False).load_data()
+
+        self.assertEqual(server.connections, 1)
+
+        # Sources are set only once for the whole connection.
+        self.assertEqual(server.queries.count("!sRIPE,RADB"), 1)
+
+    def test_031_connection_closed_by_server(self):
+        """IRRd client: idle connection closed by the server"""
+        server = self.start_server()
+
+        self.get_obj(ASSet, ["AS-ONE"], [server.host]).load_data()
+
+        # The server closes the connection that is idle in the pool:
+        # a new one is used.
+        server.close_connections()
+
+        obj = self.get_obj(ASSet, ["AS-TWO"], [server.host])
+        obj.load_data()
+        self.assertEqual(obj.asns, [3, 4])
+        self.assertEqual(server.connections, 2)
+
+    def test_040_failover_timeout(self):
+        """IRRd client: timeout, fail-over to the next host"""
+        slow_server = self.start_server(delay=3)
+        server = self.start_server()
+
+        obj = self.get_obj(ASSet, ["AS-ONE"], [slow_server.host, server.host],
+                           timeout=1)
+        with self.assertLogs(level=logging.WARNING) as logs:
+            obj.load_data()
+
+        self.assertEqual(obj.asns, [1, 2, 3])
+        self.assertIn(slow_server.host, TIMEDOUT_IRR_HOSTS)
+        self.assertTrue(any(
+            "The IRRd client timed out" in msg and
+            "The host {} will not be used for the next IRR queries.".format(
+                slow_server.host) in msg and
+            "Another attempt will be performed using the next host "
+            "in the list." in msg
+            for msg in logs.output
+        ))
+
+    def test_041_failover_error(self):
+        """IRRd client: error returned by the server"""
+        server = self.start_server()
+
+        obj = self.get_obj(ASSet, ["UNKNOWN::AS-ONE"], [server.host])
+        with self.assertRaisesRegex(IRRDBToolsError, "Unknown source"):
+            obj.load_data()
+
+    def test_042_hedged_query(self):
+        """IRRd client: slow query hedged on the next host"""
+        slow_server = self.start_server(delay=2)
+        server = self.start_server()
+
+        # The slow server looks like the fastest one.
+        for _ in range(10):
+            TIMEDOUT_IRR_HOSTS.record_success(slow_server.host, 0.01, "asns")
+            TIMEDOUT_IRR_HOSTS.record_success(server.host, 0.05, "asns")
+
+        obj = self.get_obj(ASSet, ["AS-ONE"], [server.host, slow_server.host])
+        start_time = time.time()
+        with patch.object(TIMEDOUT_IRR_HOSTS, "MIN_HEDGING_DELAY", 0.1):
+            obj.load_data()
+
+        self.assertLess(time.time() - start_time, 2)
+        self.assertEqual(obj.asns, [1, 2, 3])
+        self.assertIn("!iAS-ONE", server.queries)
+
+    def test_050_shared_sets(self):
+        """IRRd client: sets shared by more bundles"""
+        server = self.start_server()
+
+        for object_names in (["AS-ONE"], ["AS-NESTED", "AS-TWO"],
+                             ["AS-TWO", "AS-ONE"]):
+            obj = self.get_obj(ASSet, object_names, [server.host])
+            obj.load_data()
+            self.assertEqual(obj.asns, sorted(
+                [1, 2, 3] + ([4] if "AS-TWO" in object_names else [])
+            ))
+            self.get_obj(RSet, object_names, [server.host], 4,
+                         False).load_data()
+
+        # Each set is fetched only once, and the loop between
+        # AS-ONE and AS-NESTED is broken.
+        for name in ("AS-ONE", "AS-NESTED", "AS-TWO"):
+            self.assertEqual(server.queries.count("!i" + name), 1)
+
+        # Origins are fetched once per bundle.
+        self.assertEqual(server.queries.count("!gAS3"), 3)
+
+    def test_051_sources(self):
+        """IRRd client: sets looked up using different sources"""
+        server = self.start_server()
+
+        self.get_obj(ASSet, ["AS-TWO"], [server.host]).load_data()
+        self.get_obj(ASSet, ["RIPE::AS-TWO"], [server.host]).load_data()
+
+        self.assertEqual(server.queries.count("!iAS-TWO"), 2)
+
+    def test_052_max_depth(self):
+        """IRRd client: maximum depth of nested sets"""
+        objects = {
+            "!iAS-L{}".format(level): "AS{} AS-L{}".format(level + 1,
+                                                          level + 1)
+            for level in range(10)
+        }
+        server = self.start_server(objects)
+
+        expander = IRRExpander(IRRdClient(server.host, 5), max_depth=3,
+                               memo=IRRSetsMemo())
+        with self.assertLogs(level=logging.WARNING) as logs:
+            asns, _ = expander.expand(["AS-L0"], "RIPE")
+
+        self.assertEqual(asns, set([1, 2, 3]))
+        for level in range(1, 4):
+            self.assertIsNone(expander.memo.get_flattened(
+                ("RIPE", "AS-L{}".format(level))))
+        self.assertTrue(any(
+            "The expansion of AS-L0 reached the maximum depth (3)" in msg
+            for msg in logs.output
+        ))
+
+    def test_053_nested_sets_flattened(self):
+        """IRRd client: nested sets flattened only when complete"""
+        objects = {
+            "!iAS-ROOT": "AS1 AS-A AS-B",
+            "!iAS-A": "AS2 AS-C",
+            "!iAS-B": "AS3 AS-C AS-D",
+            "!iAS-C": "AS4 10.0.0.0/24",
+            "!iAS-D": "AS5 AS-E",
+            "!iAS-E": "AS6 AS-D",
+        }
+        server = self.start_server(objects)
+
+        memo = IRRSetsMemo()
+        expander = IRRExpander(IRRdClient(server.host, 5), memo=memo)
+        asns, _ = expander.expand(["AS-ROOT"], "RIPE")
+        self.assertEqual(asns, set([1, 2, 3, 4, 5, 6]))
+
+        self.assertEqual(memo.get_flattened(("RIPE", "AS-A")),
+                         (frozenset([2, 4]), frozenset(["10.0.0.0/24"])))
+        self.assertEqual(memo.get_flattened(("RIPE", "AS-C")),
+                         (frozenset([4]), frozenset(["10.0.0.0/24"])))
+
+        # AS-D and AS-E are in a loop, and AS-B leads to it.
+        for name in ("AS-B", "AS-D", "AS-E"):
+            self.assertIsNone(memo.get_flattened(("RIPE", name)))
+
+        # Flattened by a new expansion, members taken from the memo.
+        queries_cnt = len(server.queries)
+        self.assertEqual(expander.expand(["AS-B"], "RIPE")[0],
+                         set([3, 4, 5, 6]))
+        self.assertEqual(expander.expand(["AS-E"], "RIPE")[0],
+                         set([5, 6]))
+        self.assertEqual(len(server.queries), queries_cnt)
+
+    def test_054_nested_sets_already_flattened(self):
+        """IRRd client: nested sets that include flattened sets"""
+        objects = {
+            "!iAS-BIG": "AS1 AS2",
+            "!iAS-A": "AS3 AS-MID",
+            "!iAS-MID": "AS4 AS-BIG",
+        }
+        server = self.start_server(objects)
+
+        memo = IRRSetsMemo()
+        expander = IRRExpander(IRRdClient(server.host, 5), memo=memo)
+        expander.expand(["AS-BIG"], "RIPE")
+        asns, _ = expander.expand(["AS-A"], "RIPE")
+        self.assertEqual(asns, set([1, 2, 3, 4]))
+
+        self.assertEqual(memo.get_flattened(("RIPE", "AS-MID")),
+                         (frozenset([1, 2, 4]), frozenset()))
+
+class TestPrefixTree(unittest.TestCase):
+
+    def aggregate(self, prefixes, ip_ver=4, refine=None):
+        tree = PrefixTree(ip_ver)
+        for prefix in prefixes:
+            tree.add(prefix)
+        if refine:
+            tree.refine(refine)
+        tree.aggregate()
+        return tree.to_prefix_list()
+
+    def test_010_siblings(self):
+        """Prefix tree: aggregation of siblings"""
+        self.assertEqual(
+            self.aggregate(["10.0.0.0/24", "10.0.1.0/24",
+                            "10.0.2.0/24", "10.0.3.0/24"]),
+            [{"prefix": "10.0.0.0/22", "exact": False,
+              "greater-equal": 24, "less-equal": 24}]
+        )
+
+    def test_011_siblings_and_parent(self):
+        """Prefix tree: aggregation of siblings and parent"""
+        self.assertEqual(
+            self.aggregate(["10.0.0.0/23", "10.0.0.0/24", "10.0.1.0/24"]),
+            [{"prefix": "10.0.0.0/23", "exact": False, "less-equal": 24}]
+        )
+
+    def test_012_no_aggregation(self):
+        """Prefix tree: prefixes that can't be aggregated"""
+        self.assertEqual(
+            self.aggregate(["10.0.0.0/24", "10.0.2.0/24", "10.0.1.0/24"]),
+            [{"prefix": "10.0.0.0/23", "exact": False,
+              "greater-equal": 24, "less-equal": 24},
+             {"prefix": "10.0.2.0/24", "exact": True}]
+        )
+
+    def test_013_refine(self):
+        """Prefix tree: more specific prefixes allowed"""
+        self.assertEqual(
+            self.aggregate(["10.0.0.0/16", "10.0.1.0/24", "10.1.0.0/16"],
+                           refine=32),
+            [{"prefix": "10.0.0.0/15", "exact": False,
+              "greater-equal": 16, "less-equal": 32}]
+        )
+
+    def test_014_range_operator(self):
+        """Prefix tree: RPSL range operators"""
+        self.assertEqual(
+            self.aggregate(["10.0.0.0/8^16-24", "192.168.0.0/16^+",
+                            "172.16.0.0/12^-"]),
+            [{"prefix": "10.0.0.0/8", "exact": False,
+              "greater-equal": 16, "less-equal": 24},
+             {"prefix": "172.16.0.0/12", "exact": False,
+              "greater-equal": 13, "less-equal": 32},
+             {"prefix": "192.168.0.0/16", "exact": False,
+              "less-equal": 32}]
+        )
+
+    def test_016_exact_and_range(self):
+        """Prefix tree: exact prefix and range for the same prefix"""
+        expected = [{"prefix": "192.0.2.0/24", "exact": True},
+                    {"prefix": "192.0.2.0/24", "exact": False,
+                     "greater-equal": 25, "less-equal": 32}]
+        self.assertEqual(
+            self.aggregate(["192.0.2.0/24", "192.0.2.0/24^25-32"]), expected
+        )
+        self.assertEqual(
+            self.aggregate(["192.0.2.0/24^25-32", "192.0.2.0/24"]), expected
+        )
+
+        # Ranges are merged, and the exact prefix is covered
+        # by a range that includes its length.
+        self.assertEqual(
+            self.aggregate(["192.0.2.0/24^25-26", "192.0.2.0/24^27-28",
+                            "192.0.2.0/24^30-32"]),
+            [{"prefix": "192.0.2.0/24", "exact": False,
+              "greater-equal": 25, "less-equal": 28},
+             {"prefix": "192.0.2.0/24", "exact": False,
+              "greater-equal": 30, "less-equal": 32}]
+        )
+        self.assertEqual(
+            self.aggregate(["192.0.2.0/24^26-32", "192.0.2.0/24",
+                            "192.0.2.0/24^24-25"]),
+            [{"prefix": "192.0.2.0/24", "exact": False, "less-equal": 32}]
+        )
+
+    def test_015_ipv6(self):
+        """Prefix tree: IPv6"""
+        self.assertEqual(
+            self.aggregate(["2001:db8::/32", "2001:db9::/32", "10.0.0.0/8"],
+                           ip_ver=6),
+            [{"prefix": "2001:db8::/31", "exact": False,
+              "greater-equal": 32, "less-equal": 32}]
+        )
@@ -21,12 +21,16 @@ try:
     import mock
 except ImportError:
     import unittest.mock as mock
+import ipaddress
+import random
 import time
 import unittest
 
 
 from pierky.arouteserver.errors import ExternalDataNoInfoError
-from pierky.arouteserver.irrdb import IRRDBInfo, ASSet, RSet
+from pierky.arouteserver.irrdb import IRRDBInfo, ASSet, RSet, \
+                                     parse_prefix, parse_prefix_list, \
+                                     RunningIRRQuery, TIMEDOUT_IRR_HOSTS
 
 def load(filename):
     path = os.path.join(os.path.dirname(__file__), "irrdb_data", filename)
@@ -200,11 +204,11 @@ class TestIRRDBInfo(TestIRRDBInfo_Base):
 
         self.assertTrue(self.obj.raw_data is None)
 
-        # Verify that cache file is regularly written with empty data.
-        self.file_exists("test2_file")
-        cached_data = json.loads(self.load("test2_file"))
-        self.assertEqual(cached_data["data"], None)
-        self.assertTrue(cached_data["ts"] > int(time.time()) - 1)
+        # Verify that the negative entry is regularly written
+        # into the index.
+        self.file_exists(".negative_index.json")
+        negative_index = json.loads(self.load(".negative_index.json"))
+        self.assertTrue(negative_index["test2_file"] > int(time.time()) - 1)
 
         # Reuse data from cache.
         self.setup_obj(["TEST"])
@@ -368,3 +372,126 @@ class TestIRRDBInfo_RSet(TestIRRDBInfo_Base):
                 time.sleep(1)
             else:
                 self.assertEqual(run_cmd.call_count, 2)
+
+class TestPrefixListParser(unittest.TestCase):
+
+    EDGE_CASES = [
+        {"prefix": "10.0.0.0/08", "exact": True},
+        {"prefix": "10.0.0.0/8", "exact": 1},
+        {"prefix": "10.0.0.0/8", "exact": False,
+         "greater-equal": 0, "less-equal": 24},
+        {"prefix": "10.0.0.0/8", "exact": False, "greater-equal": "16"},
+        {"prefix": "10.0.0.0/8", "exact": True, "greater-equal": 4},
+        {"prefix": "2001:DB8::/32", "exact": True},
+        {"prefix": "2001:0db8:0000::/32", "exact": True},
+        {"prefix": "2001:db8:0:1::/64", "exact": True},
+        {"prefix": "::ffff:0.0.0.0/96", "exact": True},
+        {"prefix": "::/0", "exact": False, "less-equal": 48},
+        {"prefix": "0.0.0.0/0", "exact": False,
+         "greater-equal": 0, "less-equal": 0},
+        {"prefix": "::/0", "exact": False, "greater-equal": 0,
+         "less-equal": 16},
+    ]
+
+    INVALID = [
+        {"prefix": "010.0.0.0/8", "exact": True},
+        {"prefix": "10.0.0.1/8", "exact": True},
+        {"prefix": "10.0.0.0/33", "exact": True},
+        {"prefix": "256.0.0.0/8", "exact": True},
+        {"prefix": "10.0.0.0/8", "exact": False, "greater-equal": 4},
+        {"prefix": "10.0.0.0/8", "exact": False, "less-equal": 33},
+        {"prefix": "10.0.0.0/8", "exact": False,
+         "greater-equal": 24, "less-equal": 16},
+        {"prefix": "2001:db8::1/32", "exact": True},
+    ]
+
+    @staticmethod
+    def random_prefix():
+        ip_ver = random.choice([4, 6])
+        max_length = 32 if ip_ver == 4 else 128
+        length = random.randint(0, max_length)
+        value = random.getrandbits(max_length)
+        value = value >> (max_length - length) << (max_length - length)
+        if ip_ver == 4:
+            net = ipaddress.IPv4Network((value, length))
+        else:
+            net = ipaddress.IPv6Network((value, length))
+
+        raw = {"prefix": str(net)}
+        if random.random() < 0.5:
+            raw["exact"] = True
+        else:
+            raw["exact"] = False
+            ge = random.randint(length, max_length)
+            le = random.randint(ge, max_length)
+            if random.random() < 0.5:
+                raw["greater-equal"] = ge
+            if random.random() < 0.5:
+                raw["less-equal"] = le
+        return raw
+
+    def test_010_same_results(self):
+        """IRRDB info: bulk prefix list parser, same results"""
+        raw_prefixes = [self.random_prefix() for _ in range(5000)]
+        raw_prefixes += self.EDGE_CASES
+
+        expected = [parse_prefix(dict(raw)) for raw in raw_prefixes]
+        self.assertEqual(parse_prefix_list(raw_prefixes), expected)
+
+    def test_020_invalid(self):
+        """IRRDB info: bulk prefix list parser, invalid entries"""
+        for raw in self.INVALID:
+            with self.assertRaises(Exception) as expected:
+                parse_prefix(dict(raw))
+            with self.assertRaises(type(expected.exception)):
+                parse_prefix_list([raw])
+
+class TestIRRDBInfo_Hedging(TestIRRDBInfo_Base):
+
+    __test__ = True
+
+    def setUp(self):
+        TestIRRDBInfo_Base.setUp(self)
+        TIMEDOUT_IRR_HOSTS.clear()
+
+    def tearDown(self):
+        TestIRRDBInfo_Base.tearDown(self)
+        TIMEDOUT_IRR_HOSTS.clear()
+
+    def test_010_loser_killed(self):
+        """IRRDB info: hedged query, the slowest process is killed"""
+        procs = []
+        orig_set_process = RunningIRRQuery.set_process
+
+        def set_process(query, proc):
+            procs.append(proc)
+            orig_set_process(query, proc)
+
+        def get_cmd(host, args):
+            if host == "slow":
+                return ["sh", "-c", "sleep 10; echo '{\"asn_list\": [2]}'"]
+            return ["echo", '{"asn_list": [1]}']
+
+        # The slow host looks like the fastest one.
+        for _ in range(10):
+            TIMEDOUT_IRR_HOSTS.record_success("slow", 0.01, "asns")
+            TIMEDOUT_IRR_HOSTS.record_success("fast", 0.05, "asns")
+
+        obj = ASSet(["AS-ONE"], cache_dir=self.temp_dir, cache_expiry=10,
+                    bgpq3_path="bgpq4", bgpq3_host=["fast", "slow"])
+        mock.patch.object(obj, "_get_cmd", side_effect=get_cmd).start()
+        mock.patch.object(RunningIRRQuery, "set_process", autospec=True,
+                          side_effect=set_process).start()
+        mock.patch.object(TIMEDOUT_IRR_HOSTS, "MIN_HEDGING_DELAY", 0.1).start()
+
+        start_time = time.time()
+        obj.load_data()
+        self.assertLess(time.time() - start_time, 5)
+        self.assertEqual(obj.asns, [1])
+
+        self.assertEqual(len(procs), 2)
+        procs[0].wait(timeout=5)
+        self.assertLess(procs[0].returncode, 0)
+
+        # The cancelled query doesn't count as an error of the host.
+        self.assertEqual(TIMEDOUT_IRR_HOSTS.hosts["slow"].error_rate, 0)
@@ -0,0 +1,100 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+
+from pierky.arouteserver.config.validators import ValidatorPrefixListEntry
+from pierky.arouteserver.enrichers.irrdb import IRRDB
+from pierky.arouteserver.irrdb_store import IRRDBStore
+
+
+class TestIRRDBStore(unittest.TestCase):
+
+    PREFIXES = [
+        ValidatorPrefixListEntry().validate(entry)
+        for entry in (
+            {"prefix": "10.0.0.0", "length": 8, "exact": True},
+            {"prefix": "192.168.0.0", "length": 16, "exact": False,
+             "ge": 24, "le": 32, "comment": "white list"},
+            {"prefix": "2001:db8::", "length": 32, "exact": False,
+             "le": 48},
+        )
+    ]
+
+    def tearDown(self):
+        if hasattr(self, "store"):
+            self.store.close()
+
+    def test_010_asns(self):
+        """IRRDB store: ASNs"""
+        self.store = IRRDBStore()
+        asns = self.store.get_asns(self.store.put_asns([3, 4200000000, 1]))
+
+        self.assertEqual(list(asns), [1, 3, 4200000000])
+        self.assertEqual(len(asns), 3)
+        self.assertEqual(list(self.store.get_asns(self.store.put_asns([]))),
+                         [])
+
+    def test_011_prefixes(self):
+        """IRRDB store: prefixes"""
+        self.store = IRRDBStore()
+        prefixes = self.store.get_prefixes(
+            self.store.put_prefixes(self.PREFIXES)
+        )
+
+        self.assertEqual(len(prefixes), 3)
+        self.assertEqual(list(prefixes), self.PREFIXES)
+        self.assertEqual(prefixes[-1], self.PREFIXES[-1])
+
+    def test_020_spill(self):
+        """IRRDB store: data spilled to file above the memory limit"""
+        self.store = IRRDBStore(memory_limit=16)
+
+        handles = [
+            ("asns", self.store.put_asns([1, 2])),
+            ("asns", self.store.put_asns([1, 2, 3])),
+            ("prefixes", self.store.put_prefixes(self.PREFIXES)),
+            ("asns", self.store.put_asns(range(1000))),
+        ]
+
+        # Only the first one is kept in memory.
+        self.assertEqual(self.store.memory_used, 8)
+        self.assertIsNotNone(self.store.spill_file)
+
+        self.assertEqual(list(self.store.get_asns(handles[0][1])), [1, 2])
+        self.assertEqual(list(self.store.get_asns(handles[1][1])), [1, 2, 3])
+        self.assertEqual(list(self.store.get_prefixes(handles[2][1])),
+                         self.PREFIXES)
+
+        # The file grows after it has been mapped.
+        handles.append(("asns", self.store.put_asns([5])))
+        self.assertEqual(list(self.store.get_asns(handles[3][1])),
+                         list(range(1000)))
+        self.assertEqual(list(self.store.get_asns(handles[4][1])), [5])
+
+    def test_030_records(self):
+        """IRRDB store: IRRDB records"""
+        irrdb = IRRDB(memory_limit=0)
+        self.store = irrdb.store
+
+        record = irrdb[irrdb.request(["AS-ONE"], "client 1")]
+        self.assertEqual(record.asns, [])
+        self.assertEqual(record.prefixes, [])
+
+        record.save("asns", [2, 1])
+        record.save("prefixes", self.PREFIXES)
+
+        self.assertEqual(record.to_dict()["asns"], [1, 2])
+        self.assertEqual(record.to_dict()["prefixes"], self.PREFIXES)
@@ -0,0 +1,103 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections.abc import Iterator
+import json
+import unittest
+
+from pierky.arouteserver.json_stream import JSONObjectStream
+
+
+class TestJSONObjectStream(unittest.TestCase):
+
+    DOCS = [
+        '{}',
+        ' { } ',
+        '{"a": 1}',
+        '{"a": 12345, "b": -1.5e10, "c": true, "d": null, "e": "x"}',
+        '{"metadata": {"buildtime": "2021-07-21T17:00:00Z"},\n'
+        ' "roas": [\n'
+        '  {"asn": "AS1", "prefix": "192.0.2.0/24", "maxLength": 24},\n'
+        '  {"asn": 2, "prefix": "2001:db8::/32", "maxLength": 48}\n'
+        ' ],\n'
+        ' "aspas": [],\n'
+        ' "other": [[1, 2], {"a": [3]}, "\\u00e8\\"]", 4]}',
+        '{"unicode": "èé中", "list": ["è", 12, 345]}',
+    ]
+
+    INVALID_DOCS = [
+        '',
+        '[]',
+        '{"a": 1',
+        '{"a": 1,}',
+        '{"a" 1}',
+        '{a: 1}',
+        '{"a": [1, 2}',
+        '{"a": [1 2]}',
+        '{"a": tru}',
+        '{"a": 1} x',
+    ]
+
+    @staticmethod
+    def _chunks(doc, size):
+        raw = doc.encode("utf-8")
+        return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+    @staticmethod
+    def _read(chunks):
+        res = {}
+        for key, value in JSONObjectStream(chunks).iter_items():
+            if isinstance(value, Iterator):
+                value = list(value)
+            res[key] = value
+        return res
+
+    def test_010_same_results(self):
+        """JSON stream: same results of json.loads, any chunk size"""
+        for doc in self.DOCS:
+            for size in (1, 2, 3, 7, 64, 65536):
+                self.assertEqual(self._read(self._chunks(doc, size)),
+                                 json.loads(doc),
+                                 "{} - chunk size {}".format(doc, size))
+
+    def test_020_invalid(self):
+        """JSON stream: invalid documents"""
+        for doc in self.INVALID_DOCS:
+            for size in (1, 65536):
+                with self.assertRaises(ValueError, msg=doc):
+                    self._read(self._chunks(doc, size))
+
+    def test_030_arrays_read_lazily(self):
+        """JSON stream: arrays decoded while they are consumed"""
+        doc = '{"a": 1, "list": [1, 2, 3, 4], "b": 2, "c": [5, 6], "d": 3}'
+        chunks = iter(self._chunks(doc, 4))
+
+        items = JSONObjectStream(chunks).iter_items()
+        self.assertEqual(next(items), ("a", 1))
+
+        key, value = next(items)
+        self.assertEqual(key, "list")
+        self.assertEqual(next(value), 1)
+
+        # The rest of the document has not been read yet.
+        self.assertGreater(len(list(chunks)), 0)
+
+    def test_040_skip_unconsumed_arrays(self):
+        """JSON stream: arrays not consumed are skipped"""
+        doc = '{"a": 1, "list": [1, [2, 3], {"x": [4]}], "b": 2, "c": [5, 6], "d": 3}'
+        for size in (1, 5, 65536):
+            items = JSONObjectStream(self._chunks(doc, size)).iter_items()
+            self.assertEqual([key for key, _ in items],
+                             ["a", "list", "b", "c", "d"])
@@ -0,0 +1,127 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import ipaddress
+import random
+import unittest
+
+from pierky.arouteserver.config.validators import ValidatorPrefixListEntry
+from pierky.arouteserver.prefix_aggregator import aggregate_prefix_list
+
+
+def entry(prefix, exact=True, ge=None, le=None, comment=None):
+    net = ipaddress.ip_network(prefix)
+    res = {"prefix": str(net.network_address), "length": net.prefixlen,
+           "exact": exact, "ge": ge, "le": le}
+    if comment:
+        res["comment"] = comment
+    return ValidatorPrefixListEntry().validate(res)
+
+def get_matcher(prefix_list):
+    """Same logic used by BIRD and OpenBGPD to match routes."""
+    ranges = []
+    for e in prefix_list:
+        if e["exact"]:
+            low = hi = e["length"]
+        else:
+            low = e["ge"] or e["length"]
+            hi = e["le"] or e["max_length"]
+        ranges.append((ipaddress.ip_network(
+            "{}/{}".format(e["prefix"], e["length"])), low, hi))
+
+    def matches(net):
+        return any(low <= net.prefixlen <= hi and net.subnet_of(prefix)
+                   for prefix, low, hi in ranges)
+    return matches
+
+class TestPrefixAggregator(unittest.TestCase):
+
+    def aggregate(self, prefix_list):
+        return [
+            (e["prefix"], e["length"], e["exact"], e["ge"], e["le"])
+            for e in aggregate_prefix_list(prefix_list)
+        ]
+
+    def test_010_siblings(self):
+        """Prefix lists aggregation: siblings"""
+        self.assertEqual(
+            self.aggregate([entry("10.0.{}.0/24".format(i))
+                            for i in range(4)]),
+            [("10.0.0.0", 22, False, 24, 24)]
+        )
+        self.assertEqual(
+            self.aggregate([entry("2001:db8::/48", False, le=64),
+                            entry("2001:db8:1::/48", False, le=64)]),
+            [("2001:db8::", 47, False, 48, 64)]
+        )
+
+    def test_020_covered(self):
+        """Prefix lists aggregation: covered and adjacent ranges"""
+        self.assertEqual(
+            self.aggregate([entry("10.0.0.0/16", False, le=24),
+                            entry("10.0.1.0/24"),
+                            entry("10.0.0.0/16"),
+                            entry("10.0.0.0/16", False, ge=25, le=26)]),
+            [("10.0.0.0", 16, False, None, 26)]
+        )
+
+    def test_030_not_aggregated(self):
+        """Prefix lists aggregation: nothing to aggregate"""
+        prefix_list = [entry("10.0.1.0/24"), entry("10.0.2.0/24"),
+                       entry("10.0.0.0/16", False, ge=25, le=25)]
+        self.assertEqual(aggregate_prefix_list(prefix_list), prefix_list)
+
+        self.assertEqual(
+            self.aggregate([entry("10.0.0.0/24", comment="a"),
+                            entry("10.0.1.0/24", comment="b")]),
+            [("10.0.0.0", 24, True, None, None),
+             ("10.0.1.0", 24, True, None, None)]
+        )
+
+    def test_040_random(self):
+        """Prefix lists aggregation: same routes matched"""
+        base = ipaddress.ip_network("10.0.0.0/22")
+        all_nets = [net
+                    for length in range(22, 33)
+                    for net in base.subnets(new_prefix=length)]
+
+        for _ in range(20):
+            prefix_list = []
+            for _ in range(random.randint(1, 40)):
+                length = random.randint(22, 30)
+                net = ipaddress.ip_network((
+                    int(base.network_address) +
+                    (random.getrandbits(length - 22) << (32 - length)),
+                    length
+                ))
+                if random.random() < 0.5:
+                    prefix_list.append(entry(str(net)))
+                else:
+                    ge = random.randint(length, 32)
+                    le = random.randint(ge, 32)
+                    prefix_list.append(entry(str(net), False,
+                                             ge if ge > length else None, le))
+
+            aggregated = aggregate_prefix_list(prefix_list)
+            self.assertLessEqual(len(aggregated), len(prefix_list))
+            for e in aggregated:
+                ValidatorPrefixListEntry().validate(dict(e))
+            expected = get_matcher(prefix_list)
+            matches = get_matcher(aggregated)
+            for net in all_nets:
+                self.assertEqual(
+                    matches(net), expected(net),
+                    "{}: {} vs {}".format(net, prefix_list, aggregated)
+                )
@@ -0,0 +1,240 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import ipaddress
+import random
+import unittest
+
+from pierky.arouteserver.ipaddresses import IPNetwork
+from pierky.arouteserver.roa_table import ROATable, parse_roa_prefix
+
+
+def _as_dicts(rows):
+    """ROAs in the format of the dicts used before the ROA table."""
+    roas = []
+    for row in rows:
+        roa = {"prefix": row.prefix, "length": row.length,
+               "max_len": row.max_len, "asn": row.asn}
+        if row.expires is not None:
+            roa["expires"] = row.expires
+        roas.append(roa)
+    return roas
+
+
+class TestROATable(unittest.TestCase):
+
+    @staticmethod
+    def _random_roa(rnd):
+        ip_ver = rnd.choice((4, 6))
+        bits = 32 if ip_ver == 4 else 128
+        length = rnd.randint(0, bits)
+        net = ipaddress.ip_network(
+            (rnd.getrandbits(bits) >> (bits - length) << (bits - length)
+             if length else 0, length)
+        )
+        roa = {"prefix": str(net), "length": length,
+               "max_len": rnd.randint(length, bits),
+               "asn": rnd.choice((0, rnd.randint(1, 2**32 - 1)))}
+        if rnd.random() < 0.5:
+            roa["expires"] = rnd.randint(1600000000, 1900000000)
+        return roa
+
+    def _build_table(self, roas):
+        table = ROATable()
+        for roa in roas:
+            table.add(*parse_roa_prefix(roa["prefix"]), roa["max_len"],
+                      roa["asn"], roa.get("expires"))
+        return table
+
+    def test_010_same_roas(self):
+        """ROA table: same ROAs and order of the lists of dicts"""
+        rnd = random.Random(0)
+        roas = [self._random_roa(rnd) for _ in range(2000)]
+        # Same prefix, different ASNs.
+        roas.append(dict(roas[0], asn=roas[0]["asn"] + 1))
+
+        table = self._build_table(roas)
+        self.assertEqual(len(table), len(roas))
+
+        # Previously, lists of dicts were sorted at rendering
+        # time by prefix length, prefix and origin ASN.
+        expected = sorted(roas, key=lambda r: (r["length"], r["prefix"],
+                                               r["asn"]))
+        self.assertEqual(_as_dicts(table), expected)
+
+        # Iterating again gives the same results.
+        self.assertEqual(_as_dicts(table), expected)
+
+        for ip_ver in (4, 6):
+            self.assertEqual(
+                _as_dicts(table.iter_roas(ip_ver)),
+                [roa for roa in expected
+                 if IPNetwork(roa["prefix"]).version == ip_ver]
+            )
+
+    def test_020_add_after_sort(self):
+        """ROA table: ROAs added after sorting"""
+        roas = [
+            {"prefix": "192.0.2.0/24", "length": 24, "max_len": 24, "asn": 2},
+            {"prefix": "10.0.0.0/8", "length": 8, "max_len": 24, "asn": 1,
+             "expires": 1626890400},
+        ]
+        table = self._build_table(roas[:1])
+        table.sort()
+        table.add(*parse_roa_prefix(roas[1]["prefix"]), 24, 1, 1626890400)
+
+        self.assertEqual(_as_dicts(table), [roas[1], roas[0]])
+        self.assertEqual(list(table.iter_roas(6)), [])
+
+    def test_025_parse_prefix(self):
+        """ROA table: prefixes parsed like ipaddress does"""
+        rnd = random.Random(0)
+        prefixes = [self._random_roa(rnd)["prefix"] for _ in range(500)]
+        prefixes += ["::ffff:192.0.2.0/120", "192.0.2.0"]
+
+        for prefix in prefixes:
+            net = ipaddress.ip_network(prefix)
+            self.assertEqual(
+                parse_roa_prefix(prefix),
+                (net.version, int(net.network_address), net.prefixlen)
+            )
+
+        for prefix in ("192.0.2.1/24", "192.0.2.0/33", "192.0.2/24",
+                       "2001:db8::1/32", "2001:db8::/129", "x/24"):
+            with self.assertRaises(ValueError):
+                parse_roa_prefix(prefix)
+
+    def test_030_empty(self):
+        """ROA table: empty table"""
+        table = ROATable()
+        self.assertFalse(table)
+        self.assertEqual(len(table), 0)
+        self.assertEqual(list(table), [])
+
+class TestROATableCompression(unittest.TestCase):
+
+    # Routes and ROAs are built within this prefix.
+    NET = ipaddress.ip_network("10.0.0.0/21")
+    MAX_LEN = 25
+    ASNS = (0, 1, 2)
+    EXPIRES = (None, 1000, 2000)
+
+    @staticmethod
+    def _validate(roas, route, origin, now):
+        """RFC 6811 validation state of the route."""
+        state = "not-found"
+        for roa in roas:
+            if "expires" in roa and roa["expires"] < now:
+                continue
+            if not route.subnet_of(roa["net"]):
+                continue
+            state = "invalid"
+            if roa["asn"] == origin and roa["asn"] != 0 and \
+                    route.prefixlen <= roa["max_len"]:
+                return "valid"
+        return state
+
+    def _get_routes(self):
+        routes = []
+        for length in range(self.NET.prefixlen - 1, self.MAX_LEN + 1):
+            if length < self.NET.prefixlen:
+                routes.append(self.NET.supernet(new_prefix=length))
+            else:
+                routes.extend(self.NET.subnets(new_prefix=length))
+        return routes
+
+    def _random_table(self, rnd):
+        table = ROATable()
+        for _ in range(rnd.randint(1, 40)):
+            length = rnd.randint(self.NET.prefixlen, self.MAX_LEN - 1)
+            net = rnd.choice(list(self.NET.subnets(new_prefix=length)))
+            table.add(net.version, int(net.network_address), length,
+                      rnd.randint(length, self.MAX_LEN),
+                      rnd.choice(self.ASNS),
+                      rnd.choice(self.EXPIRES))
+        return table
+
+    @staticmethod
+    def _get_roas(table):
+        roas = _as_dicts(table)
+        for roa in roas:
+            roa["net"] = ipaddress.ip_network(roa["prefix"])
+        return roas
+
+    def test_010_redundant_roas(self):
+        """ROA table: compression, redundant ROAs removed"""
+        table = ROATable()
+        for prefix, max_len, asn, expires in (
+            ("10.0.0.0/16", 24, 1, None),
+            # Covered by the /16.
+            ("10.0.1.0/24", 24, 1, None),
+            ("10.0.0.0/16", 20, 1, 1000),
+            # Different ASN.
+            ("10.0.2.0/24", 24, 2, None),
+            # Longer max length.
+            ("10.0.3.0/24", 25, 1, None),
+            # Not covered.
+            ("10.1.0.0/24", 24, 1, None),
+            # Covered by the /16, which does not expire.
+            ("10.0.4.0/24", 24, 1, 1000),
+            # Expires after the covering ROA.
+            ("192.0.2.0/24", 25, 1, 1000),
+            ("192.0.2.0/25", 25, 1, 2000),
+            # Duplicate.
+            ("2001:db8::/32", 48, 1, None),
+            ("2001:db8::/32", 48, 1, None),
+        ):
+            table.add(*parse_roa_prefix(prefix), max_len, asn, expires)
+        table.sort()
+
+        self.assertEqual(table.compress(), 4)
+        self.assertEqual(
+            [(roa.prefix, roa.max_len, roa.asn) for roa in table],
+            [("10.0.0.0/16", 24, 1),
+             ("10.0.2.0/24", 24, 2),
+             ("10.0.3.0/24", 25, 1),
+             ("10.1.0.0/24", 24, 1),
+             ("192.0.2.0/24", 25, 1),
+             ("192.0.2.0/25", 25, 1),
+             ("2001:db8::/32", 48, 1)]
+        )
+
+    def test_020_same_validation_outcome(self):
+        """ROA table: compression, same validation outcome"""
+        routes = self._get_routes()
+        rnd = random.Random(0)
+        removed = 0
+
+        for _ in range(30):
+            table = self._random_table(rnd)
+            roas = self._get_roas(table)
+
+            removed += table.compress()
+            compressed_roas = self._get_roas(table)
+
+            for now in (0, 1500, 3000):
+                for route in routes:
+                    for origin in self.ASNS:
+                        self.assertEqual(
+                            self._validate(compressed_roas, route, origin, now),
+                            self._validate(roas, route, origin, now),
+                            "{} AS{} at {}, ROAs: {}".format(
+                                route, origin, now, roas
+                            )
+                        )
+
+        # Make sure that the test is meaningful.
+        self.assertGreater(removed, 0)
+
@@ -23,6 +23,9 @@ except ImportError:
 import unittest
 import datetime
 
+import requests
+import requests_mock
+
 
 from pierky.arouteserver.ripe_rpki_cache import RIPE_RPKI_ROAs
 from pierky.arouteserver.errors import RPKIValidatorCacheError
@@ -205,3 +208,206 @@ class TestRPKICache(unittest.TestCase):
             open("tests/static/data/rpki_roas_octorpki.json").read()
         )
         self.assertEqual(len(roas), 39680)
+
+    def test_300(self):
+        """RPKI ROAs: file not modified"""
+
+        raw_content = (
+            '{'
+            '  "metadata": { "buildtime": "2021-07-21T17:00:00Z" },'
+            '  "roas": ['
+            '    { "asn": "AS1", "prefix": "192.0.2.0/24", "maxLength": 24, "ta": "test", "expires": 1626890400 },'
+            '    { "asn": "AS2", "prefix": "198.51.100.0/24", "maxLength": 24, "ta": "test" }'
+            '  ]'
+            '}'
+        )
+        file_path = self._get_file_path(raw_content)
+
+        def load(now):
+            with mock.patch.object(RIPE_RPKI_ROAs, "_get_utc_now",
+                                   return_value=now):
+                obj = RIPE_RPKI_ROAs(
+                    cache_dir=self.temp_dir,
+                    cache_expiry=0,
+                    ripe_rpki_validator_url=[file_path]
+                )
+                obj.load_data()
+                return obj
+
+        obj = load(datetime.datetime(2021, 7, 21, 17, 26))
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(len(obj.roas["roas"]), 2)
+
+        # Same file, the cached entry is used; the first ROA
+        # expired in the meantime.
+        obj = load(datetime.datetime(2021, 7, 21, 20, 0))
+        self.assertTrue(obj.from_cache)
+        self.assertEqual([roa["asn"] for roa in obj.roas["roas"]], ["AS2"])
+
+        # The buildtime of the cached file is checked again.
+        with self.assertRaisesRegex(RPKIValidatorCacheError, "was built at .* it will be ignored"):
+            load(datetime.datetime(2030, 12, 31, 23, 59))
+
+    @mock.patch.object(
+        RIPE_RPKI_ROAs,
+        "_get_utc_now",
+        return_value=datetime.datetime(2030, 12, 31, 23, 59)
+    )
+    def test_310(self, _):
+        """RPKI ROAs: old files discarded before parsing ROAs"""
+
+        # The file is truncated: the error is about buildtime,
+        # since ROAs are not parsed at all.
+        with self.assertRaisesRegex(RPKIValidatorCacheError, "was built at .* it will be ignored"):
+            self._setup_obj(
+                '{'
+                '  "metadata": { "buildtime": "2021-07-21T17:00:00Z" },'
+                '  "roas": ['
+                '    { "asn": "AS1", "prefix": "192.0.2.0/24", "maxLe'
+            )
+
+    @mock.patch.object(
+        RIPE_RPKI_ROAs,
+        "_get_utc_now",
+        return_value=datetime.datetime(2021, 7, 21, 17, 26)
+    )
+    def test_320(self, _):
+        """RPKI ROAs: fetched via HTTP"""
+
+        url = "https://rpki.example.com/vrps.json"
+        raw_content = (
+            '{'
+            '  "metadata": { "buildtime": "2021-07-21T17:00:00Z" },'
+            '  "roas": ['
+            '    { "asn": "AS1", "prefix": "192.0.2.0/24", "maxLength": 24, "ta": "test", "expires": 1626800000 },'
+            '    { "asn": 2, "prefix": "198.51.100.0/24", "maxLength": "24", "ta": "test" },'
+            '    { "asn": "AS3", "prefix": "2001:db8::/32", "maxLength": 48, "ta": "test" }'
+            '  ]'
+            '}'
+        )
+
+        def load():
+            obj = RIPE_RPKI_ROAs(
+                cache_dir=self.temp_dir,
+                cache_expiry=0,
+                ripe_rpki_validator_url=[url]
+            )
+            obj.load_data()
+            return obj
+
+        with requests_mock.Mocker() as m:
+            m.get(url, content=raw_content.encode("utf-8"))
+
+            obj = load()
+            self.assertFalse(obj.from_cache)
+            self.assertEqual(
+                [(roa["asn"], roa["prefix"], roa["maxLength"])
+                 for roa in obj.roas["roas"]],
+                [("AS2", "198.51.100.0/24", 24), ("AS3", "2001:db8::/32", 48)]
+            )
+
+            # Same content: the cached entry is used.
+            obj = load()
+            self.assertTrue(obj.from_cache)
+            self.assertEqual(len(obj.roas["roas"]), 2)
+
+    def _get_file_content(self, buildtime, asn):
+        return (
+            '{'
+            '  "metadata": { "buildtime": "' + buildtime + '" },'
+            '  "roas": ['
+            '    { "asn": "AS' + str(asn) + '", "prefix": "192.0.2.0/24", "maxLength": 24, "ta": "test" }'
+            '  ]'
+            '}'
+        ).encode("utf-8")
+
+    def _load_freshest(self, urls):
+        obj = RIPE_RPKI_ROAs(
+            cache_dir=self.temp_dir,
+            cache_expiry=0,
+            ripe_rpki_validator_url=urls,
+            fetch_mode="freshest",
+            timeout=5
+        )
+        obj.load_data()
+        return obj
+
+    @mock.patch.object(
+        RIPE_RPKI_ROAs,
+        "_get_utc_now",
+        return_value=datetime.datetime(2021, 7, 21, 17, 26)
+    )
+    def test_330(self, _):
+        """RPKI ROAs: freshest mode, most recent file used"""
+
+        urls = ["https://rpki{}.example.com/vrps.json".format(i)
+                for i in range(5)]
+
+        with requests_mock.Mocker() as m:
+            m.get(urls[0], content=self._get_file_content("2021-07-21T17:00:00Z", 1))
+            m.get(urls[1], content=self._get_file_content("2021-07-21T17:20:00Z", 2))
+            m.get(urls[2], exc=requests.exceptions.ConnectTimeout)
+            # Too old.
+            m.get(urls[3], content=self._get_file_content("2021-07-01T17:00:00Z", 4))
+            # Build time unknown.
+            m.get(urls[4], content=b'{"roas": []}')
+
+            with self.assertLogs(level="INFO") as logs:
+                obj = self._load_freshest(urls)
+
+            self.assertFalse(obj.from_cache)
+            self.assertEqual([roa["asn"] for roa in obj.roas["roas"]], ["AS2"])
+            self.assertEqual(obj.meta["url"], urls[1])
+            self.assertEqual(
+                obj.meta["buildtime"],
+                RIPE_RPKI_ROAs._dt_to_ts(datetime.datetime(2021, 7, 21, 17, 20))
+            )
+
+            for request in m.request_history:
+                self.assertEqual(request.timeout, 5)
+
+            # Latency of each source.
+            output = "\n".join(logs.output)
+            for url, status in ((urls[0], "received in .* seconds, cancelled"),
+                                (urls[1], "received in .* seconds, used"),
+                                (urls[2], "failed after"),
+                                (urls[3], "failed after"),
+                                (urls[4], "build time unknown UTC, received in .* cancelled")):
+                self.assertRegex(output, "RPKI ROAs from {}: .*{}".format(url, status))
+
+            # Same content: the cached entry is used.
+            obj = self._load_freshest(urls)
+            self.assertTrue(obj.from_cache)
+            self.assertEqual([roa["asn"] for roa in obj.roas["roas"]], ["AS2"])
+
+            # A more recent file is available.
+            m.get(urls[0], content=self._get_file_content("2021-07-21T17:25:00Z", 1))
+            obj = self._load_freshest(urls)
+            self.assertFalse(obj.from_cache)
+            self.assertEqual([roa["asn"] for roa in obj.roas["roas"]], ["AS1"])
+            self.assertEqual(obj.meta["url"], urls[0])
+
+    @mock.patch.object(
+        RIPE_RPKI_ROAs,
+        "_get_utc_now",
+        return_value=datetime.datetime(2021, 7, 21, 17, 26)
+    )
+    def test_340(self, _):
+        """RPKI ROAs: freshest mode, fallback to the next file"""
+
+        urls = ["https://rpki{}.example.com/vrps.json".format(i)
+                for i in range(3)]
+
+        with requests_mock.Mocker() as m:
+            m.get(urls[0], content=self._get_file_content("2021-07-21T17:00:00Z", 1))
+            # The most recent file is truncated.
+            m.get(urls[1], content=self._get_file_content("2021-07-21T17:20:00Z", 2)[:-10])
+            m.get(urls[2], status_code=500)
+
+            obj = self._load_freshest(urls)
+            self.assertEqual([roa["asn"] for roa in obj.roas["roas"]], ["AS1"])
+            self.assertEqual(obj.meta["url"], urls[0])
+
+            m.get(urls[0], status_code=404)
+            with self.assertRaisesRegex(RPKIValidatorCacheError, "Impossible to load RPKI ROAs"):
+                self._load_freshest(urls)
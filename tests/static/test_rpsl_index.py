@@ -0,0 +1,296 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from pierky.arouteserver.errors import IRRDumpsError
+from pierky.arouteserver.irr_expander import IRR_SETS_MEMO
+from pierky.arouteserver.irrdb import ASSet, RSet
+from pierky.arouteserver.rpsl_index import RPSLDumpIndex, \
+                                           iter_rpsl_objects
+
+
+RIPE_SETS = """
+% This is the RIPE Database dump.
+
+as-set:         AS-ONE
+descr:          test # comment
+members:        AS1, AS2,
+                AS-NESTED
+mnt-by:         MNT-ONE
+source:         RIPE
+
+as-set:         AS-NESTED
+members:        AS64512 AS3
++               AS-ONE
+mnt-by:         MNT-ONE
+source:         RIPE
+
+route-set:      RS-ONE
+members:        10.1.0.0/24
+mp-members:     2001:db8:1::/48
+source:         RIPE
+
+mntner:         MNT-ONE
+source:         RIPE
+"""
+
+RIPE_ROUTES = """
+route:          10.0.0.0/24
+origin:         AS1
+mnt-by:         MNT-ONE
+source:         RIPE
+
+route:          10.0.1.0/24
+origin:         AS1
+source:         RIPE
+
+route6:         2001:db8::/32
+origin:         AS1
+source:         RIPE
+
+route:          10.0.2.0/24
+origin:         AS2
+source:         RIPE
+"""
+
+RADB = """
+as-set:         AS-ONE
+members:        AS4
+source:         RADB
+
+as-set:         AS-TWO
+members:        AS3 AS4
+source:         RADB
+
+route:          10.0.3.0/24
+origin:         AS2
+source:         RADB
+
+route:          192.168.0.0/16
+origin:         AS3
+source:         RADB
+"""
+
+class TestRPSLIndex(unittest.TestCase):
+
+    def setUp(self):
+        IRR_SETS_MEMO.clear()
+        self.temp_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+        self.dumps_dir = os.path.join(self.temp_dir, "dumps")
+        os.mkdir(self.dumps_dir)
+
+        self.write_dump("ripe.db.as-set.gz", RIPE_SETS)
+        self.write_dump("ripe.db.route.gz", RIPE_ROUTES)
+        self.write_dump("radb.db", RADB)
+
+        self.index = RPSLDumpIndex(self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def write_dump(self, name, content):
+        path = os.path.join(self.dumps_dir, name)
+        if name.endswith(".gz"):
+            with gzip.open(path, "wt") as f:
+                f.write(content)
+        else:
+            with open(path, "w") as f:
+                f.write(content)
+        return path
+
+    def get_obj(self, cls, object_names, *args, **kwargs):
+        return cls(
+            object_names, *args,
+            cache_dir=self.temp_dir,
+            bgpq3_path="bgpq4",
+            bgpq3_sources="RIPE,RADB",
+            irr_query_method="local",
+            **kwargs
+        )
+
+    def test_010_parser(self):
+        """RPSL dumps: parser"""
+        objects = list(iter_rpsl_objects(io.StringIO(RIPE_SETS)))
+
+        self.assertEqual(len(objects), 3)
+        self.assertEqual(
+            objects[0],
+            ("as-set", "AS-ONE", {
+                "as-set": ["AS-ONE"],
+                "descr": ["test"],
+                "members": ["AS1, AS2, AS-NESTED"],
+                "mnt-by": ["MNT-ONE"],
+                "source": ["RIPE"]
+            })
+        )
+        self.assertEqual(objects[1][2]["members"], ["AS64512 AS3 AS-ONE"])
+        self.assertEqual(objects[2][2]["mp-members"], ["2001:db8:1::/48"])
+
+    def test_020_index(self):
+        """RPSL dumps: index lookups"""
+        self.index.update([os.path.join(self.dumps_dir, "*")])
+
+        self.assertEqual(
+            self.index.get_set_members("as-one", ["RIPE", "RADB"]),
+            ["AS1", "AS2", "AS-NESTED"]
+        )
+        # The order of the sources is taken into account.
+        self.assertEqual(
+            self.index.get_set_members("AS-ONE", ["RADB", "RIPE"]),
+            ["AS4"]
+        )
+        self.assertIsNone(
+            self.index.get_set_members("AS-TWO", ["RIPE"])
+        )
+        self.assertEqual(
+            sorted(self.index.get_origin_prefixes(2, 4, ["RIPE", "RADB"])),
+            ["10.0.2.0/24", "10.0.3.0/24"]
+        )
+        self.assertEqual(
+            self.index.get_origin_prefixes(2, 4, ["RIPE"]),
+            ["10.0.2.0/24"]
+        )
+        self.assertEqual(
+            self.index.get_origin_prefixes(1, 6, ["RIPE"]),
+            ["2001:db8::/32"]
+        )
+
+    def test_021_missing_dump(self):
+        """RPSL dumps: missing files"""
+        with self.assertRaisesRegex(IRRDumpsError, "No IRR dump files found"):
+            self.index.update([os.path.join(self.dumps_dir, "missing.gz")])
+
+    def test_030_incremental_update(self):
+        """RPSL dumps: only changed dumps are loaded again"""
+        dumps = [os.path.join(self.dumps_dir, "*")]
+
+        with patch.object(RPSLDumpIndex, "_load_dump",
+                          autospec=True,
+                          side_effect=RPSLDumpIndex._load_dump) as load_dump:
+            self.index.update(dumps)
+            self.assertEqual(load_dump.call_count, 3)
+
+            self.index.update(dumps)
+            self.assertEqual(load_dump.call_count, 3)
+
+            path = self.write_dump("radb.db", RADB.replace("AS3 AS4", "AS5"))
+            os.utime(path, ns=(0, 0))
+            self.index.update(dumps)
+            self.assertEqual(load_dump.call_count, 4)
+            self.assertEqual(load_dump.call_args[0][2], path)
+
+        self.assertEqual(
+            self.index.get_set_members("AS-TWO", ["RADB"]),
+            ["AS5"]
+        )
+
+        # Objects of the dumps no longer in the list are removed.
+        self.index.update([os.path.join(self.dumps_dir, "ripe.*")])
+        self.assertIsNone(
+            self.index.get_set_members("AS-TWO", ["RIPE", "RADB"])
+        )
+        self.assertEqual(
+            self.index.get_origin_prefixes(2, 4, ["RIPE", "RADB"]),
+            ["10.0.2.0/24"]
+        )
+
+    def test_040_asns(self):
+        """RPSL dumps: origin ASNs"""
+        self.index.update([os.path.join(self.dumps_dir, "*")])
+
+        obj = self.get_obj(ASSet, ["AS-ONE", "AS-TWO"])
+        obj.load_data()
+
+        # Private ASNs are skipped, as bgpq4 does.
+        self.assertEqual(obj.asns, [1, 2, 3, 4])
+
+    def test_041_prefixes(self):
+        """RPSL dumps: prefixes"""
+        self.index.update([os.path.join(self.dumps_dir, "*")])
+
+        obj = self.get_obj(RSet, ["AS-ONE", "RS-ONE"], 4, False)
+        obj.load_data()
+        self.assertEqual(
+            sorted(
+                (p["prefix"], p["length"], p["exact"], p["ge"], p["le"])
+                for p in obj.prefixes
+            ),
+            [
+                ("10.0.0.0", 22, False, 24, 24),
+                ("10.1.0.0", 24, True, None, None),
+                ("192.168.0.0", 16, True, None, None),
+            ]
+        )
+
+    def test_050_not_modified(self):
+        """RPSL dumps: bundles re-expanded only if their objects changed"""
+        dumps = [os.path.join(self.dumps_dir, "*")]
+        self.index.update(dumps)
+
+        def load(cls, object_names, *args):
+            IRR_SETS_MEMO.clear()
+            obj = self.get_obj(cls, object_names, *args, cache_expiry=0)
+            obj.load_data()
+            return obj
+
+        def update(name, content):
+            path = self.write_dump(name, content)
+            os.utime(path, ns=(0, 0))
+            self.index.update(dumps)
+
+        for cls, args in ((ASSet, ()), (RSet, (4, False))):
+            self.assertFalse(load(cls, ["AS-TWO"], *args).from_cache)
+            self.assertTrue(load(cls, ["AS-TWO"], *args).from_cache)
+        self.assertFalse(load(ASSet, ["AS-ONE"]).from_cache)
+        self.assertTrue(load(ASSet, ["AS-ONE"]).from_cache)
+
+        # Nested sets of AS-ONE.
+        update("ripe.db.as-set.gz",
+               RIPE_SETS.replace("AS64512 AS3", "AS64512 AS5"))
+        self.assertTrue(load(ASSet, ["AS-TWO"]).from_cache)
+        self.assertTrue(load(RSet, ["AS-TWO"], 4, False).from_cache)
+        obj = load(ASSet, ["AS-ONE"])
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(obj.asns, [1, 2, 5])
+        self.assertTrue(load(ASSet, ["AS-ONE"]).from_cache)
+
+        # Route objects of AS3, used by AS-TWO for its prefixes only.
+        update("radb.db", RADB.replace("192.168.0.0/16", "192.168.0.0/17"))
+        self.assertTrue(load(ASSet, ["AS-TWO"]).from_cache)
+        obj = load(RSet, ["AS-TWO"], 4, False)
+        self.assertFalse(obj.from_cache)
+        self.assertEqual([p["length"] for p in obj.prefixes], [17])
+        self.assertTrue(load(RSet, ["AS-TWO"], 4, False).from_cache)
+
+        # AS-TWO itself.
+        update("radb.db", RADB.replace("AS3 AS4", "AS5"))
+        obj = load(ASSet, ["AS-TWO"])
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(obj.asns, [5])
+
+        # Objects of the dumps no longer in the list.
+        dumps = [os.path.join(self.dumps_dir, "ripe.*")]
+        self.index.update(dumps)
+        obj = load(ASSet, ["AS-TWO"])
+        self.assertFalse(obj.from_cache)
+        self.assertEqual(obj.asns, [])
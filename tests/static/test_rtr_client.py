@@ -0,0 +1,364 @@
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import ipaddress
+import os
+import shutil
+import socketserver
+import struct
+import tempfile
+import threading
+import unittest
+
+from pierky.arouteserver.errors import RTRClientError
+from pierky.arouteserver.rtr_client import RTRClient, RTRState, \
+                                          RTR_RPKI_ROAs, parse_rtr_server
+
+
+class FakeRTRHandler(socketserver.BaseRequestHandler):
+
+    def _send(self, version, pdu_type, field, body=b""):
+        self.request.sendall(
+            struct.pack("!BBHI", version, pdu_type, field, 8 + len(body)) +
+            body
+        )
+
+    def _send_vrp(self, version, announce, vrp):
+        prefix, max_len, asn = vrp
+        net = ipaddress.ip_network(prefix)
+        if net.version == 4:
+            self._send(version, 4, 0, struct.pack(
+                "!BBBxII", int(announce), net.prefixlen, max_len,
+                int(net.network_address), asn))
+        else:
+            self._send(version, 6, 0, struct.pack(
+                "!BBBx16sI", int(announce), net.prefixlen, max_len,
+                net.network_address.packed, asn))
+
+    def _send_end_of_data(self, version):
+        if version == 0:
+            body = struct.pack("!I", self.server.serial)
+        else:
+            body = struct.pack("!IIII", self.server.serial, 3600, 600,
+                               self.server.expire)
+        self._send(version, 7, self.server.session_id, body)
+
+    def _recv(self, size):
+        data = b""
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def handle(self):
+        srv = self.server
+        while True:
+            header = self._recv(8)
+            if not header:
+                return
+            version, pdu_type, field, length = struct.unpack("!BBHI", header)
+            body = self._recv(length - 8)
+            srv.queries.append((version, pdu_type))
+
+            if version > srv.max_version:
+                # Error Report, Unsupported Protocol Version.
+                text = b"unsupported version"
+                self._send(srv.max_version, 10, 4,
+                           struct.pack("!I", len(header + body)) +
+                           header + body +
+                           struct.pack("!I", len(text)) + text)
+                return
+
+            # Not relevant for the client.
+            self._send(version, 0, srv.session_id,
+                       struct.pack("!I", srv.serial))
+
+            if pdu_type == 2:
+                # Reset Query
+                self._send(version, 3, srv.session_id)
+                for vrp in sorted(srv.vrps):
+                    self._send_vrp(version, True, vrp)
+                if version > 0:
+                    # Router Key, ignored by the client.
+                    self._send(version, 9, 0, b"\x00" * 20 + b"\x00" * 8)
+                self._send_end_of_data(version)
+
+            elif pdu_type == 1:
+                # Serial Query
+                serial = struct.unpack("!I", body)[0]
+                if field != srv.session_id or \
+                        serial not in srv.history and serial != srv.serial:
+                    self._send(version, 8, 0)
+                    continue
+
+                self._send(version, 3, srv.session_id)
+                for past_serial in sorted(srv.history):
+                    if past_serial < serial:
+                        continue
+                    for announce, vrp in srv.history[past_serial]:
+                        self._send_vrp(version, announce, vrp)
+                self._send_end_of_data(version)
+
+class FakeRTRServer(socketserver.ThreadingTCPServer):
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, vrps, max_version=1):
+        socketserver.ThreadingTCPServer.__init__(self, ("127.0.0.1", 0),
+                                                 FakeRTRHandler)
+        self.max_version = max_version
+        self.session_id = 1234
+        self.serial = 10
+        self.expire = 7200
+        self.vrps = set(vrps)
+
+        # { <serial>: [(announce, vrp)] } changes from <serial>
+        # to <serial> + 1.
+        self.history = {}
+
+        self.queries = []
+
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def address(self):
+        return "127.0.0.1:{}".format(self.server_address[1])
+
+    def update(self, announce=(), withdraw=()):
+        self.history[self.serial] = \
+            [(True, vrp) for vrp in announce] + \
+            [(False, vrp) for vrp in withdraw]
+        self.vrps.update(announce)
+        self.vrps.difference_update(withdraw)
+        self.serial += 1
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class TestRTRClient(unittest.TestCase):
+
+    VRPS = [
+        ("192.0.2.0/24", 24, 65534),
+        ("198.51.100.0/22", 24, 65535),
+        ("203.0.113.0/24", 32, 4200000000),
+        ("10.0.0.0/8", 8, 0),
+        ("2001:db8::/32", 48, 65534),
+        ("2001:db8:ffff::/48", 64, 65535),
+    ]
+
+    def setUp(self):
+        self.server = FakeRTRServer(self.VRPS)
+        self.cache_dir = tempfile.mkdtemp(suffix="arouteserver_unittest")
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _sync(self, state, server=None):
+        server = server or self.server
+        client = RTRClient(*parse_rtr_server(server.address), timeout=5)
+        incremental = client.sync(state)
+        return incremental, client.received_bytes
+
+    @staticmethod
+    def _sorted(roas):
+        return sorted(roas, key=lambda roa: (roa["prefix"], roa["maxLength"],
+                                             roa["asn"]))
+
+    def _get_roas(self, vrps):
+        return self._sorted(
+            {"prefix": ipaddress.ip_network(prefix).compressed,
+             "maxLength": max_len, "asn": "AS{}".format(asn)}
+            for prefix, max_len, asn in vrps
+        )
+
+    def _assert_state(self, state, server=None):
+        server = server or self.server
+        self.assertEqual(self._sorted(state.iter_roas()),
+                         self._get_roas(server.vrps))
+        self.assertEqual(state.session_id, server.session_id)
+        self.assertEqual(state.serial, server.serial)
+
+    def _get_roas_obj(self):
+        return RTR_RPKI_ROAs(self.cache_dir, self.server.address, timeout=5)
+
+    def test_010_full_sync(self):
+        """RTR client: full sync"""
+        state = RTRState(self.server.address)
+        incremental, _ = self._sync(state)
+
+        self.assertFalse(incremental)
+        self._assert_state(state)
+        self.assertEqual(state.version, 1)
+        self.assertEqual(len(state), len(self.VRPS))
+        self.assertEqual(self.server.queries, [(1, 2)])
+
+    def test_020_incremental_sync(self):
+        """RTR client: incremental sync"""
+        state = RTRState(self.server.address)
+        _, full_bytes = self._sync(state)
+
+        self.server.update(announce=[("192.0.2.0/25", 25, 65534)],
+                           withdraw=[("2001:db8::/32", 48, 65534)])
+        self.server.update(announce=[("2001:db8::/32", 48, 65533)])
+
+        incremental, delta_bytes = self._sync(state)
+        self.assertTrue(incremental)
+        self._assert_state(state)
+        self.assertEqual(self.server.queries, [(1, 2), (1, 1)])
+
+        # Serial Notify + Cache Response + 3 prefixes + End of Data.
+        self.assertEqual(delta_bytes, 12 + 8 + 20 + 32 * 2 + 24)
+        self.assertLess(delta_bytes, full_bytes)
+
+        # Nothing changed.
+        self.assertTrue(self._sync(state)[0])
+        self._assert_state(state)
+
+    def test_030_cache_reset(self):
+        """RTR client: cache reset, full sync"""
+        state = RTRState(self.server.address)
+        self._sync(state)
+
+        self.server.update(announce=[("192.0.2.0/25", 25, 65534)])
+        # Changes are no longer available on the server.
+        self.server.history = {}
+
+        incremental, _ = self._sync(state)
+        self.assertFalse(incremental)
+        self._assert_state(state)
+        self.assertEqual(self.server.queries, [(1, 2), (1, 1), (1, 2)])
+
+    def test_030_session_changed(self):
+        """RTR client: session ID changed, full sync"""
+        state = RTRState(self.server.address)
+        self._sync(state)
+
+        new_server = FakeRTRServer(self.VRPS[1:])
+        new_server.session_id = 4321
+        try:
+            state.server = new_server.address
+            incremental, _ = self._sync(state, new_server)
+            self.assertFalse(incremental)
+            self._assert_state(state, new_server)
+            self.assertEqual(new_server.queries, [(1, 1), (1, 2)])
+        finally:
+            new_server.stop()
+
+    def test_040_inconsistent_changes(self):
+        """RTR client: inconsistent changes, full sync"""
+        state = RTRState(self.server.address)
+        self._sync(state)
+
+        self.server.update(announce=[("192.0.2.0/25", 25, 65534)],
+                           withdraw=[("192.0.2.0/24", 24, 65534)])
+        # The client doesn't know the VRP that is withdrawn.
+        state.vrps[4] = set(
+            key for key in state.vrps[4]
+            if key >> 48 != int(ipaddress.ip_address("192.0.2.0"))
+        )
+
+        incremental, _ = self._sync(state)
+        self.assertFalse(incremental)
+        self._assert_state(state)
+        self.assertEqual(self.server.queries, [(1, 2), (1, 1), (1, 2)])
+
+    def test_050_version_0(self):
+        """RTR client: server that supports version 0 only"""
+        server = FakeRTRServer(self.VRPS, max_version=0)
+        try:
+            state = RTRState(server.address)
+            self.assertFalse(self._sync(state, server)[0])
+            self._assert_state(state, server)
+            self.assertEqual(state.version, 0)
+
+            server.update(announce=[("192.0.2.0/25", 25, 65534)])
+            self.assertTrue(self._sync(state, server)[0])
+            self._assert_state(state, server)
+
+            self.assertEqual(server.queries,
+                             [(1, 2), (0, 2), (1, 2), (0, 1)])
+        finally:
+            server.stop()
+
+    def test_060_state_file(self):
+        """RTR client: VRPs saved to the state file"""
+        roas = self._get_roas_obj()
+        roas.load_data()
+        self.assertEqual(self._sorted(roas.iter_roas()),
+                         self._get_roas(self.server.vrps))
+
+        self.server.update(announce=[("192.0.2.0/25", 25, 65534)])
+
+        roas = self._get_roas_obj()
+        roas.load_data()
+        self.assertEqual(self._sorted(roas.iter_roas()),
+                         self._get_roas(self.server.vrps))
+        self.assertEqual(self.server.queries, [(1, 2), (1, 1)])
+
+        # Invalid state file: full sync.
+        for filename in os.listdir(self.cache_dir):
+            with open(os.path.join(self.cache_dir, filename), "wb") as f:
+                f.write(b"ARSC\x01\x02")
+
+        roas = self._get_roas_obj()
+        roas.load_data()
+        self.assertEqual(self._sorted(roas.iter_roas()),
+                         self._get_roas(self.server.vrps))
+        self.assertEqual(self.server.queries, [(1, 2), (1, 1), (1, 2)])
+
+    def test_070_server_unreachable(self):
+        """RTR client: server unreachable, local copy used if not expired"""
+        roas = self._get_roas_obj()
+        roas.load_data()
+        expected = self._get_roas(self.server.vrps)
+
+        self.server.stop()
+
+        roas = self._get_roas_obj()
+        roas.load_data()
+        self.assertEqual(self._sorted(roas.iter_roas()), expected)
+
+        # The local copy is expired.
+        path = roas._get_state_path()
+        state = RTRState.load(path, self.server.address)
+        state.last_update -= state.expire + 1
+        state.save(path)
+
+        with self.assertRaisesRegex(RTRClientError, "no recent local copy"):
+            self._get_roas_obj().load_data()
+
+    def test_080_no_state(self):
+        """RTR client: server unreachable, no local copy"""
+        self.server.stop()
+        with self.assertRaisesRegex(RTRClientError, "Can't connect"):
+            self._get_roas_obj().load_data()
+
+    def test_090_parse_server(self):
+        """RTR client: server address"""
+        self.assertEqual(parse_rtr_server("127.0.0.1:3323"),
+                         ("127.0.0.1", 3323))
+        self.assertEqual(parse_rtr_server("rtr.example.com:323"),
+                         ("rtr.example.com", 323))
+        self.assertEqual(parse_rtr_server("[::1]:3323"), ("::1", 3323))
+        for server in ("127.0.0.1", "::1:3323", "a:0", "a:65536"):
+            with self.assertRaises(RTRClientError, msg=server):
+                parse_rtr_server(server)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compare the cache serializers on a set of RPKI ROAs: size of the
+# cache entry, time needed to write and load it and peak RSS of the
+# process that loads it. Each load is performed in a new process,
+# so that the peak RSS is not affected by the previous runs.
+#
+# Usage:
+#
+#   utils/cache_serializers_benchmark.py [--vrps FILE] [--roas N]
+#
+# FILE is a VRP set in one of the formats supported by the
+# 'ripe-rpki-validator-cache' source (rpki-client, OctoRPKI,
+# Routinator, ...), for example https://console.rpki-client.org/vrps.json
+# When it's not given, N random ROAs are generated.
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pierky.arouteserver.cache_serializers import CACHE_SERIALIZERS, \
+                                                  deserialize
+
+
+def get_peak_rss():
+    # Kilobytes on Linux, bytes on macOS.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss //= 1024
+    return peak_rss * 1024
+
+def generate_roas(cnt):
+    roas = []
+    for _ in range(cnt):
+        if random.random() < 0.8:
+            prefix_len = random.randint(12, 24)
+            prefix = "{}.{}.{}.0/{}".format(random.randint(1, 223),
+                                            random.randint(0, 255),
+                                            random.randint(0, 255),
+                                            prefix_len)
+            max_len = random.randint(prefix_len, 24)
+        else:
+            prefix_len = random.randint(19, 48)
+            prefix = "2{:03x}:{:x}::/{}".format(random.randint(0, 0xfff),
+                                                random.randint(0, 0xffff),
+                                                prefix_len)
+            max_len = random.randint(prefix_len, 48)
+        roas.append({
+            "asn": "AS{}".format(random.randint(1, 400000)),
+            "prefix": prefix,
+            "maxLength": max_len,
+            "ta": random.choice(["afrinic", "apnic", "arin",
+                                 "lacnic", "ripe"]),
+            "expires": int(time.time()) + 86400
+        })
+    return {"roas": roas}
+
+def load(path):
+    with open(path, "rb") as f:
+        raw = f.read()
+
+    start_time = time.time()
+    entry = deserialize(raw)
+    load_time = time.time() - start_time
+
+    print(json.dumps({
+        "roas": len(entry["data"]["roas"]),
+        "load_time": load_time,
+        "peak_rss": get_peak_rss()
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the cache serializers."
+    )
+    parser.add_argument("--vrps", help="VRP set (JSON file).")
+    parser.add_argument("--roas", type=int, default=500000,
+                        help="Number of random ROAs generated when "
+                             "--vrps is not given. Default: 500000.")
+    parser.add_argument("--load", help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.load:
+        load(args.load)
+        return
+
+    if args.vrps:
+        with open(args.vrps, "r") as f:
+            data = {"roas": json.load(f)["roas"]}
+    else:
+        data = generate_roas(args.roas)
+
+    # Same structure of the entries stored by the JSON files backend.
+    entry = {"ts": int(time.time()), "data": data}
+
+    fmt = "{:<12} {:>14} {:>10} {:>10} {:>14}"
+    print(fmt.format("Format", "Size", "Write (s)", "Load (s)",
+                     "Peak RSS (MB)"))
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        for name in sorted(CACHE_SERIALIZERS):
+            path = os.path.join(temp_dir, name)
+
+            start_time = time.time()
+            raw = CACHE_SERIALIZERS[name].dumps(entry)
+            write_time = time.time() - start_time
+
+            with open(path, "wb") as f:
+                f.write(raw)
+
+            res = json.loads(subprocess.check_output(
+                [sys.executable, __file__, "--load", path]
+            ))
+            assert res["roas"] == len(data["roas"])
+
+            print(fmt.format(
+                name,
+                "{:,}".format(len(raw)),
+                "{:.2f}".format(write_time),
+                "{:.2f}".format(res["load_time"]),
+                "{:.1f}".format(res["peak_rss"] / 1024 / 1024)
+            ))
+
+            os.remove(path)
+    finally:
+        os.rmdir(temp_dir)
+
+if __name__ == "__main__":
+    main()
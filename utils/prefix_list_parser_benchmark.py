@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# Copyright (C) 2017-2025 Pier Carlo Chiodi
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Compare the time needed to build the prefix list entries out of
+# the output of bgpq4, item by item (parse_prefix) and in bulk
+# (parse_prefix_list).
+#
+# Usage:
+#
+#   utils/prefix_list_parser_benchmark.py [--bgpq4-output FILE] [--prefixes N]
+#
+# FILE is the output of 'bgpq4 -j -A -l prefix_list ...'; when it's
+# not given, N random prefixes are generated.
+
+import argparse
+import ipaddress
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from pierky.arouteserver.irrdb import parse_prefix, parse_prefix_list
+
+
+def generate_prefixes(cnt):
+    prefixes = []
+    for _ in range(cnt):
+        if random.random() < 0.8:
+            length = random.randint(8, 24)
+            net = ipaddress.IPv4Network(
+                (random.getrandbits(32) >> (32 - length) << (32 - length),
+                 length)
+            )
+            max_length = 24
+        else:
+            length = random.randint(19, 48)
+            net = ipaddress.IPv6Network(
+                (random.getrandbits(128) >> (128 - length) << (128 - length),
+                 length)
+            )
+            max_length = 48
+
+        entry = {"prefix": str(net)}
+        if random.random() < 0.7 or length == max_length:
+            entry["exact"] = True
+        else:
+            entry["exact"] = False
+            entry["greater-equal"] = length
+            entry["less-equal"] = max_length
+        prefixes.append(entry)
+    return prefixes
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the bgpq4 prefix list parser."
+    )
+    parser.add_argument("--bgpq4-output", help="Output of bgpq4 (JSON).")
+    parser.add_argument("--prefixes", type=int, default=500000,
+                        help="Number of random prefixes generated when "
+                             "--bgpq4-output is not given. "
+                             "Default: 500000.")
+
+    args = parser.parse_args()
+
+    if args.bgpq4_output:
+        with open(args.bgpq4_output, "r") as f:
+            raw_prefixes = json.load(f)["prefix_list"]
+    else:
+        raw_prefixes = generate_prefixes(args.prefixes)
+
+    start_time = time.time()
+    expected = [parse_prefix(dict(raw)) for raw in raw_prefixes]
+    item_by_item = time.time() - start_time
+
+    start_time = time.time()
+    res = parse_prefix_list(raw_prefixes)
+    bulk = time.time() - start_time
+
+    assert res == expected
+
+    fmt = "{:<14} {:>10}"
+    print("{:,} prefixes".format(len(raw_prefixes)))
+    print(fmt.format("Parser", "Time (s)"))
+    print(fmt.format("item by item", "{:.2f}".format(item_by_item)))
+    print(fmt.format("bulk", "{:.2f}".format(bulk)))
+
+if __name__ == "__main__":
+    main()